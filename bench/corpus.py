@@ -0,0 +1,187 @@
+# bench/corpus.py
+
+import os
+import random
+
+import click
+
+# Генератор синтетических PDF-рапортов для бенчмарков. PDF пишется вручную, без сторонних
+# библиотек: шрифт Helvetica с однобайтовой кодировкой (/Differences) для кириллицы
+# и CMap /ToUnicode, чтобы pypdf извлекал текст так же, как из настоящих рапортов.
+# Генерация детерминирована (seed), поэтому корпус воспроизводим между запусками.
+
+DEFAULT_CORPUS_DIR = os.path.join('data', 'bench', 'corpus')
+DEFAULT_PAGE_COUNTS = (1, 1, 2, 3, 5, 8, 20, 80)
+
+_CYRILLIC = "АБВГДЕЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯабвгдежзийклмнопрстуфхцчшщъыьэюяЁёӘәҒғҚқҢңӨөҰұҮүҺһІі«»№—"
+# Коды 128.. по порядку символов _CYRILLIC; имена глифов нужны только для отображения
+_CODES = {char: 128 + index for index, char in enumerate(_CYRILLIC)}
+
+LINES_PER_PAGE = 60
+CHARS_PER_LINE = 95
+
+_SURNAMES = ["Сарсенбаев", "Иванов", "Ахметова", "Кенжебеков", "Петрова", "Жумабаев", "Смагулова"]
+_INITIALS = ["М.Р.", "А.С.", "Д.К.", "Е.Б.", "Н.Т."]
+_POSITIONS = ["Следователь по ОВД", "Старший следователь", "Следователь СУ ДЭР"]
+_CITIES = ["г. Астана", "г. Алматы", "г. Шымкент", "г. Караганда"]
+_OFFENCES = [
+    ("217", "финансовая пирамида", "создании и руководстве финансовой пирамидой"),
+    ("190", "мошенничество", "хищении чужого имущества путем обмана"),
+    ("189", "присвоение", "присвоении вверенного имущества"),
+    ("218", "легализация", "легализации денежных средств, полученных преступным путем"),
+]
+_MONTHS = ["января", "февраля", "марта", "апреля", "мая", "июня", "июля", "августа",
+           "сентября", "октября", "ноября", "декабря"]
+_FILLER = [
+    "В ходе проверки установлено движение денежных средств по счетам фигурантов.",
+    "Согласно выписке банка второго уровня, поступления осуществлялись от физических лиц.",
+    "Опрошенные потерпевшие пояснили, что вносили деньги под обещание высокого дохода.",
+    "Сведения из СИОПСО подтверждают регистрацию имущества на близких родственников.",
+    "Материалы проверки направлены для принятия процессуального решения.",
+    "По данным оператора связи, абонентский номер использовался в личном кабинете платежной системы.",
+]
+
+
+def _encode(text):
+    """Строка PDF в однобайтовой кодировке шрифта; неизвестные символы заменяются на '?'."""
+    out = bytearray()
+    for char in text:
+        if char in _CODES:
+            out.append(_CODES[char])
+        elif 32 <= ord(char) < 127:
+            if char in "()\\":
+                out.append(ord("\\"))
+            out.append(ord(char))
+        else:
+            out.append(ord("?"))
+    return bytes(out)
+
+
+def _to_unicode_cmap():
+    entries = [f"<{code:02X}> <{ord(char):04X}>" for char, code in _CODES.items()]
+    blocks = []
+    for start in range(0, len(entries), 100):
+        chunk = entries[start:start + 100]
+        blocks.append(f"{len(chunk)} beginbfchar\n" + "\n".join(chunk) + "\nendbfchar")
+    return ("/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n"
+            "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n"
+            "/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n"
+            "1 begincodespacerange\n<00> <FF>\nendcodespacerange\n"
+            + "\n".join(blocks) + "\nendcmap\nCMapName currentdict /CMap defineresource pop\nend\nend\n").encode("ascii")
+
+
+def write_pdf(path, pages):
+    """Пишет PDF: pages - список страниц, каждая - список строк текста."""
+    objects = []  # тела объектов, номер объекта = индекс + 1
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    differences = " ".join(f"/uni{ord(char):04X}" for char in _CYRILLIC)
+    encoding_id = add(f"<< /Type /Encoding /BaseEncoding /WinAnsiEncoding /Differences [128 {differences}] >>".encode())
+    cmap = _to_unicode_cmap()
+    cmap_id = add(b"<< /Length %d >>\nstream\n" % len(cmap) + cmap + b"\nendstream")
+    font_id = add(f"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding {encoding_id} 0 R "
+                  f"/ToUnicode {cmap_id} 0 R >>".encode())
+    pages_id = len(objects) + 1 + 2 * len(pages)  # после пар "содержимое + страница"
+
+    page_ids = []
+    for lines in pages:
+        content = bytearray(b"BT /F1 9 Tf 11 TL 40 800 Td\n")
+        for line in lines:
+            content += b"(" + _encode(line) + b") '\n"
+        content += b"ET"
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(content) + bytes(content) + b"\nendstream")
+        page_ids.append(add(f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 595 842] "
+                            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>".encode()))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    add(f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode())
+    catalog_id = add(f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode())
+
+    data = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog_id, xref_offset)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _wrap(text, width=CHARS_PER_LINE):
+    lines, current = [], ""
+    for word in text.split():
+        if current and len(current) + 1 + len(word) > width:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}".strip()
+    if current:
+        lines.append(current)
+    return lines
+
+
+def make_raport(rng, page_count):
+    """Текст синтетического рапорта: шапка с реквизитами ЕРДР на первой странице и страницы материалов."""
+    article, offence_type, fact = rng.choice(_OFFENCES)
+    day, month, year = rng.randint(1, 28), rng.randrange(12), rng.choice([2022, 2023, 2024])
+    hour, minute = rng.randint(8, 19), rng.randint(0, 59)
+    erdr = f"{rng.choice([22, 23, 24])}71001{rng.randint(0, 99999999):08d}"
+    investigator = f"{rng.choice(_SURNAMES)} {rng.choice(_INITIALS)}"
+    part = rng.randint(1, 4)
+
+    header = [
+        "РАПОРТ",
+        f"{day} {_MONTHS[month]} {year} г.                                  {rng.choice(_CITIES)}",
+        f"Мною, {rng.choice(_POSITIONS).lower()} {investigator}, {day:02d}.{month + 1:02d}.{year} в {hour:02d}:{minute:02d} "
+        f"в ходе изучения материалов обнаружены сведения о {fact}.",
+        f"Сведения зарегистрированы в ЕРДР за № {erdr} от {day:02d}.{month + 1:02d}.{year}г. в {hour:02d}:{minute:02d} "
+        f"по признакам уголовного правонарушения, предусмотренного ч.{part} ст.{article} УК РК.",
+        f"Источник сведений: инициативный рапорт. Тип правонарушения: {offence_type}.",
+        f"Фигуранты: {rng.choice(_SURNAMES)} {rng.choice(_INITIALS)}, {rng.choice(_SURNAMES)} {rng.choice(_INITIALS)}.",
+        "",
+    ]
+    pages = []
+    lines = list(header)
+    for _ in range(page_count):
+        while len(lines) < LINES_PER_PAGE:
+            lines.extend(_wrap(" ".join(rng.choice(_FILLER) for _ in range(3))))
+        pages.append(lines[:LINES_PER_PAGE])
+        lines = []
+    pages[-1].extend(["", f"{rng.choice(_POSITIONS)}                                   {investigator}"])
+    return pages
+
+
+def generate_corpus(output_dir=DEFAULT_CORPUS_DIR, count=16, page_counts=DEFAULT_PAGE_COUNTS, seed=42):
+    """Создает count рапортов с числом страниц по кругу из page_counts. Возвращает список путей."""
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for index in range(count):
+        page_count = page_counts[index % len(page_counts)]
+        path = os.path.join(output_dir, f"raport_{index:04d}_{page_count}p.pdf")
+        write_pdf(path, make_raport(rng, page_count))
+        paths.append(path)
+    return paths
+
+
+@click.command()
+@click.option('--output-dir', '-o', default=DEFAULT_CORPUS_DIR, show_default=True,
+              help='Директория для синтетических рапортов.')
+@click.option('--count', '-n', type=click.IntRange(min=1), default=16, show_default=True, help='Число рапортов.')
+@click.option('--pages', default=",".join(map(str, DEFAULT_PAGE_COUNTS)), show_default=True,
+              help='Число страниц рапортов через запятую (используются по кругу).')
+@click.option('--seed', type=int, default=42, show_default=True)
+def main(output_dir, count, pages, seed):
+    """Генерирует синтетический корпус PDF-рапортов."""
+    page_counts = tuple(int(value) for value in pages.split(",") if value.strip())
+    paths = generate_corpus(output_dir, count, page_counts, seed)
+    click.echo(f"Создано рапортов: {len(paths)} в {output_dir}")
+
+
+if __name__ == '__main__':
+    main()
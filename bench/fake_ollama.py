@@ -0,0 +1,253 @@
+# bench/fake_ollama.py
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import click
+
+from core.token_budget import estimate_tokens
+
+# Локальная имитация HTTP API Ollama (/api/chat, /api/generate, /api/tags) для бенчмарков
+# без GPU и живой модели. Задержка ответа складывается из загрузки модели (при первом
+# запросе и при смене num_ctx - как у настоящей Ollama), обработки промпта со скоростью
+# prompt_tokens_per_second, задержки первого токена и генерации со скоростью tokens_per_second.
+# Ответ - JSON с полями из схемы format; итоговый фрагмент содержит счетчики и длительности
+# в том же виде, что и Ollama (prompt_eval_count, eval_count, *_duration в наносекундах).
+#
+# Кэш префикса промпта имитирует llama.cpp-сервер Ollama: у каждой модели cache_slots слотов
+# (аналог OLLAMA_NUM_PARALLEL) с текстом последнего промпта; новый запрос попадает в слот
+# с самым длинным общим префиксом и вычисляет только остаток. prompt_eval_count, как и в Ollama,
+# считает только вычисленные токены. Смена num_ctx перезагружает модель и сбрасывает ее кэш.
+
+FAKE_CASE_DATA = {
+    "рапорт_дата": "5 октября 2023 г.",
+    "фио_следователя": "Сарсенбаев М.Р.",
+    "должность_следователя": "Следователь по ОВД",
+    "дата_обнаружения": "05.10.2023 17:28",
+    "источник_сведений": "инициативный рапорт",
+    "суть_правонарушения": "создание и руководство финансовой пирамидой",
+    "статья_ук_рк": "217 ч.2 п.1",
+    "номер_ердр": "237100121000075",
+    "дата_регистрации_ердр": "05.10.2023г. в 17:28",
+    "место_правонарушения": "г. Астана",
+    "тип_правонарушения": "финансовая пирамида",
+    "фигуранты": "Иванов А.С., Петрова Д.К.",
+    "дополнительные_сведения": "Н/Д",
+}
+CHARS_PER_OUTPUT_TOKEN = 3
+
+
+class FakeOllamaConfig:
+    def __init__(self, latency=0.05, tokens_per_second=100.0, prompt_tokens_per_second=2000.0,
+                 load_seconds=0.0, trailing_text="\n", prefix_cache=True, cache_slots=1):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.load_seconds = load_seconds
+        self.trailing_text = trailing_text  # текст после JSON - его обрезает досрочная остановка потока
+        self.prefix_cache = prefix_cache
+        self.cache_slots = cache_slots
+
+
+class FakeOllamaState:
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.loaded_num_ctx = {}  # модель -> num_ctx, с которым она загружена
+        self.prompt_slots = {}  # модель -> тексты промптов в слотах кэша
+        self.requests = 0
+        self.prompt_tokens = 0  # всего токенов в промптах
+        self.cached_prompt_tokens = 0  # из них взято из кэша префикса
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = self.prompt_tokens = self.cached_prompt_tokens = 0
+
+    def load_model(self, model, options):
+        """Имитирует (пере)загрузку модели; возвращает затраченное время в секундах."""
+        num_ctx = (options or {}).get("num_ctx", 2048)
+        with self.lock:
+            self.requests += 1
+            if self.loaded_num_ctx.get(model) == num_ctx:
+                return 0.0
+            self.loaded_num_ctx[model] = num_ctx
+            self.prompt_slots[model] = []
+        time.sleep(self.config.load_seconds)
+        return self.config.load_seconds
+
+    def evaluate_prompt(self, model, prompt):
+        """Занимает слот кэша под prompt; возвращает (всего токенов, токенов из кэша префикса)."""
+        if not prompt:
+            return 0, 0  # прогрев
+        total = estimate_tokens(prompt)
+        cached = 0
+        with self.lock:
+            slots = self.prompt_slots.setdefault(model, [])
+            prefixes = [os.path.commonprefix([slot, prompt]) for slot in slots] if self.config.prefix_cache else []
+            best = max(range(len(prefixes)), key=lambda i: len(prefixes[i]), default=None)
+            if best is not None and prefixes[best]:
+                # Последний токен промпта вычисляется всегда - от него начинается генерация
+                cached = min(estimate_tokens(prefixes[best]), total - 1)
+                slots[best] = prompt
+            else:
+                if len(slots) >= self.config.cache_slots:
+                    slots.pop(0)
+                slots.append(prompt)
+            self.prompt_tokens += total
+            self.cached_prompt_tokens += cached
+        return total, cached
+
+
+def _prompt_text(request):
+    if "messages" in request:
+        return "\n".join(message.get("content", "") for message in request["messages"])
+    return request.get("prompt", "")
+
+
+def _response_content(request):
+    schema = request.get("format")
+    fields = list(schema.get("properties", {})) if isinstance(schema, dict) else list(FAKE_CASE_DATA)
+    return json.dumps({field: FAKE_CASE_DATA.get(field, "Н/Д") for field in fields}, ensure_ascii=False)
+
+
+def _output_chunks(text):
+    return [text[i:i + CHARS_PER_OUTPUT_TOKEN] for i in range(0, len(text), CHARS_PER_OUTPUT_TOKEN)]
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # задается в make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            pass  # клиент закрыл соединение после досрочной остановки потока
+
+    def _send_json(self, value, status=200):
+        body = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": "fake:latest", "model": "fake:latest"}]})
+        elif self.path == "/api/version":
+            self._send_json({"version": "0.0.0-fake"})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path not in ("/api/chat", "/api/generate"):
+            self._send_json({"error": "not found"}, status=404)
+            return
+        config = self.state.config
+        started = time.perf_counter()
+        load_seconds = self.state.load_model(request.get("model"), request.get("options"))
+
+        total_tokens, cached_tokens = self.state.evaluate_prompt(request.get("model"), _prompt_text(request))
+        prompt_tokens = total_tokens - cached_tokens
+        prompt_seconds = prompt_tokens / config.prompt_tokens_per_second if config.prompt_tokens_per_second else 0.0
+        time.sleep(prompt_seconds + config.latency)
+
+        is_chat = self.path == "/api/chat"
+        # Пустой промпт /api/generate - прогрев модели: только загрузка
+        text = "" if not is_chat and not request.get("prompt") else _response_content(request) + config.trailing_text
+        chunks = _output_chunks(text)
+        token_delay = 1.0 / config.tokens_per_second if config.tokens_per_second else 0.0
+
+        def message(content, done):
+            base = {"model": request.get("model"), "created_at": "1970-01-01T00:00:00Z", "done": done}
+            if is_chat:
+                base["message"] = {"role": "assistant", "content": content}
+            else:
+                base["response"] = content
+            return base
+
+        def stats():
+            return {
+                "done_reason": "stop",
+                "total_duration": int((time.perf_counter() - started) * 1e9),
+                "load_duration": int(load_seconds * 1e9),
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(prompt_seconds * 1e9),
+                "eval_count": len(chunks),
+                "eval_duration": int(len(chunks) * token_delay * 1e9),
+            }
+
+        if not request.get("stream", True):
+            time.sleep(len(chunks) * token_delay)
+            self._send_json({**message(text, True), **stats()})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for chunk in chunks:
+                time.sleep(token_delay)
+                self._write_chunk(message(chunk, False))
+            self._write_chunk({**message("", True), **stats()})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # клиент закрыл поток после закрытия JSON - генерация прекращается, как в Ollama
+
+    def _write_chunk(self, value):
+        line = (json.dumps(value, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+
+def make_server(host="127.0.0.1", port=0, config=None):
+    """Создает сервер (port=0 - свободный порт). Адрес для клиента: f"http://{host}:{server.server_port}"."""
+    handler = type("Handler", (FakeOllamaHandler,), {"state": FakeOllamaState(config or FakeOllamaConfig())})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_server(host="127.0.0.1", port=0, config=None):
+    """Запускает сервер в фоновом потоке; возвращает (server, url). Остановка - server.shutdown()."""
+    server = make_server(host, port, config)
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', type=int, default=11500, show_default=True)
+@click.option('--latency', type=float, default=0.05, show_default=True, help='Задержка первого токена, с.')
+@click.option('--tokens-per-second', type=float, default=100.0, show_default=True, help='Скорость генерации.')
+@click.option('--prompt-tokens-per-second', type=float, default=2000.0, show_default=True,
+              help='Скорость обработки промпта (0 - мгновенно).')
+@click.option('--load-seconds', type=float, default=0.0, show_default=True,
+              help='Время загрузки модели при первом запросе и смене num_ctx.')
+@click.option('--prefix-cache/--no-prefix-cache', default=True, show_default=True,
+              help='Переиспользовать вычисленный общий префикс промптов.')
+@click.option('--cache-slots', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Число слотов кэша префикса на модель (аналог OLLAMA_NUM_PARALLEL).')
+def main(host, port, latency, tokens_per_second, prompt_tokens_per_second, load_seconds, prefix_cache, cache_slots):
+    """Запускает имитацию Ollama для бенчмарков."""
+    config = FakeOllamaConfig(latency, tokens_per_second, prompt_tokens_per_second, load_seconds,
+                              prefix_cache=prefix_cache, cache_slots=cache_slots)
+    server = make_server(host, port, config)
+    click.echo(f"Имитация Ollama слушает http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
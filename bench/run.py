@@ -0,0 +1,227 @@
+# bench/run.py
+
+import contextlib
+import io
+import json
+import math
+import os
+import tempfile
+import time
+
+import click
+
+from bench.corpus import DEFAULT_CORPUS_DIR, generate_corpus
+from bench.fake_ollama import FAKE_CASE_DATA, FakeOllamaConfig, start_server
+
+# Бенчмарки этапов (извлечение текста из PDF, структурирование через Ollama, формирование плана,
+# сборка DOCX) и сквозной пакетной обработки на синтетическом корпусе и имитации Ollama.
+# Для каждого этапа выводятся пропускная способность и задержки p50/p95 - этих чисел достаточно,
+# чтобы принять или отклонить изменение производительности без GPU.
+#
+#   python -m bench.run                         # все бенчмарки
+#   python -m bench.run -b pdf -b render        # выбранные
+#   python -m bench.run --json-out bench.json   # результаты для сравнения между ревизиями
+
+BENCHMARKS = ("pdf", "llm", "prefix", "plan", "render", "e2e")
+ARTICLES = ("217 ч.2 п.1", "190 ч.3", "189 ч.2", "218 ч.1", "Н/Д")
+
+
+def percentile(samples, fraction):
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def summarize(name, samples, wall_seconds):
+    return {
+        "benchmark": name,
+        "samples": len(samples),
+        "wall_seconds": wall_seconds,
+        "throughput_per_second": len(samples) / wall_seconds if wall_seconds else None,
+        "p50_ms": percentile(samples, 0.50) * 1000,
+        "p95_ms": percentile(samples, 0.95) * 1000,
+        "max_ms": max(samples) * 1000,
+    }
+
+
+def measure(name, calls):
+    """Выполняет вызовы последовательно, подавляя вывод этапов; возвращает сводку."""
+    samples = []
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for call in calls:
+            call_started = time.perf_counter()
+            call()
+            samples.append(time.perf_counter() - call_started)
+    return summarize(name, samples, time.perf_counter() - started)
+
+
+def make_parser(url, stream, warm_up=False):
+    from core.parser import RaportParser
+
+    return RaportParser(ollama_model="fake", stream=stream, warm_up=warm_up, pdf_processes=1, ollama_host=url)
+
+
+def bench_pdf(pdf_paths, iterations, url, stream):
+    parser = make_parser(url, stream)
+    return measure("pdf: RaportParser._extract_text_from_pdf",
+                   [lambda path=path: parser._extract_text_from_pdf(path) for path in pdf_paths * iterations])
+
+
+def bench_llm(pdf_paths, iterations, url, stream):
+    from core.llm_utils import OllamaClient
+    from core.parser import compact_raport_text, extract_text_from_pdf
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        texts = [compact_raport_text(extract_text_from_pdf(path))[:12000] for path in pdf_paths]
+    client = OllamaClient(model_name="fake", stream=stream, host=url)
+    return measure(f"llm: OllamaClient.extract_case_data ({'stream' if stream else 'no-stream'})",
+                   [lambda text=text: client.extract_case_data(text) for text in texts * iterations])
+
+
+def bench_prefix(pdf_paths, server, url, stream):
+    """
+    Структурирование корпуса подряд (как в пакете) при выключенном и включенном кэше префикса
+    имитации Ollama: разница показывает экономию на обработке промпта за счет общего системного сообщения.
+    """
+    from core.parser import join_pages
+
+    state = server.RequestHandlerClass.state
+    parser = make_parser(url, stream)
+    with contextlib.redirect_stdout(io.StringIO()):
+        documents = [parser._extract_pages_from_pdf(path) for path in pdf_paths]
+    prefix_cache = state.config.prefix_cache
+    results = []
+    try:
+        for enabled in (False, True):
+            state.config.prefix_cache = enabled
+            state.prompt_slots.clear()
+            state.reset_counters()
+            summary = measure(f"prefix: parse_raport_text_with_llm (кэш префикса {'вкл' if enabled else 'выкл'})",
+                              [lambda pages=pages: parser.parse_raport_text_with_llm(join_pages(pages), pages=pages)
+                               for pages in documents])
+            summary["prompt_tokens"] = state.prompt_tokens
+            summary["cached_prompt_tokens"] = state.cached_prompt_tokens
+            results.append(summary)
+    finally:
+        state.config.prefix_cache = prefix_cache
+    return results
+
+
+def _case_data_variants():
+    return [{**FAKE_CASE_DATA, "статья_ук_рк": article} for article in ARTICLES]
+
+
+def bench_plan(iterations):
+    from core.plan_generator import generate_investigation_plan
+
+    variants = _case_data_variants()
+    generate_investigation_plan(variants[0])  # компиляция индекса и загрузка методики - вне замера
+    return measure("plan: generate_investigation_plan",
+                   [lambda case_data=case_data: generate_investigation_plan(case_data)
+                    for case_data in variants * iterations * 20])
+
+
+def bench_render(iterations, rows=100):
+    from core.plan_generator import generate_investigation_plan
+    from utils.doc_formatter import create_investigation_plan_doc
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        plan = generate_investigation_plan(FAKE_CASE_DATA)
+    plan["actions"] = [dict(plan["actions"][index % len(plan["actions"])], номер=index + 1) for index in range(rows)]
+    with tempfile.TemporaryDirectory() as output_dir:
+        output = os.path.join(output_dir, "plan.docx")
+        create_investigation_plan_doc(plan, output)  # сборка скелета - вне замера
+        return measure(f"render: create_investigation_plan_doc ({rows} строк)",
+                       [lambda: create_investigation_plan_doc(plan, output) for _ in range(iterations * 20)])
+
+
+def bench_e2e(pdf_paths, url, stream, workers, max_llm_requests):
+    from core.batch import run_batch
+
+    class CollectingSink:
+        def __init__(self):
+            self.records = []
+
+        def emit(self, record):
+            self.records.append(dict(record))
+
+    parser = make_parser(url, stream)
+    sink = CollectingSink()
+    with tempfile.TemporaryDirectory() as output_dir, contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        run_batch(pdf_paths, output_dir, parser, workers=workers, max_llm_requests=max_llm_requests,
+                  metrics_sink=sink)
+        wall_seconds = time.perf_counter() - started
+    summary = summarize(f"e2e: batch (workers={workers}, llm={max_llm_requests})",
+                        [record["total_seconds"] for record in sink.records], wall_seconds)
+    summary["failed"] = sum(1 for record in sink.records if record["status"] != "ok")
+    return summary
+
+
+@click.command()
+@click.option('--benchmark', '-b', 'selected', type=click.Choice(BENCHMARKS), multiple=True,
+              help='Бенчмарк для запуска (можно несколько; по умолчанию - все).')
+@click.option('--corpus-dir', default=DEFAULT_CORPUS_DIR, show_default=True,
+              help='Директория синтетического корпуса (создается при отсутствии).')
+@click.option('--count', type=click.IntRange(min=1), default=16, show_default=True, help='Число рапортов в корпусе.')
+@click.option('--iterations', type=click.IntRange(min=1), default=3, show_default=True,
+              help='Повторы микробенчмарков.')
+@click.option('--latency', type=float, default=0.05, show_default=True, help='Задержка первого токена имитации Ollama, с.')
+@click.option('--tokens-per-second', type=float, default=200.0, show_default=True,
+              help='Скорость генерации имитации Ollama.')
+@click.option('--prompt-tokens-per-second', type=float, default=4000.0, show_default=True,
+              help='Скорость обработки промпта имитацией Ollama.')
+@click.option('--stream/--no-stream', default=True, show_default=True)
+@click.option('--workers', type=click.IntRange(min=1), default=2, show_default=True)
+@click.option('--max-llm-requests', type=click.IntRange(min=1), default=2, show_default=True)
+@click.option('--json-out', type=click.Path(dir_okay=False), default=None, help='Сохранить результаты в JSON.')
+def main(selected, corpus_dir, count, iterations, latency, tokens_per_second, prompt_tokens_per_second,
+         stream, workers, max_llm_requests, json_out):
+    """Запускает бенчмарки на синтетическом корпусе и имитации Ollama."""
+    selected = selected or BENCHMARKS
+    pdf_paths = sorted(os.path.join(corpus_dir, name) for name in os.listdir(corpus_dir)
+                       if name.endswith(".pdf")) if os.path.isdir(corpus_dir) else []
+    if len(pdf_paths) < count:
+        pdf_paths = generate_corpus(corpus_dir, count)
+    pdf_paths = [os.path.abspath(path) for path in pdf_paths[:count]]
+
+    server, url = start_server(config=FakeOllamaConfig(latency, tokens_per_second, prompt_tokens_per_second))
+    # Кэш LLM и прогрев не используются: замеряется сам запрос к модели
+    results = []
+    try:
+        runners = {
+            "pdf": lambda: bench_pdf(pdf_paths, iterations, url, stream),
+            "llm": lambda: bench_llm(pdf_paths, 1, url, stream),
+            "prefix": lambda: bench_prefix(pdf_paths, server, url, stream),
+            "plan": lambda: bench_plan(iterations),
+            "render": lambda: bench_render(iterations),
+            "e2e": lambda: bench_e2e(pdf_paths, url, stream, workers, max_llm_requests),
+        }
+        for name in BENCHMARKS:
+            if name not in selected:
+                continue
+            outcome = runners[name]()
+            for result in outcome if isinstance(outcome, list) else [outcome]:
+                results.append(result)
+                click.echo(f"{result['benchmark']:<58} n={result['samples']:<5} "
+                           f"{result['throughput_per_second']:>9.1f}/с  p50 {result['p50_ms']:>9.2f} мс  "
+                           f"p95 {result['p95_ms']:>9.2f} мс")
+                if result.get("prompt_tokens"):
+                    click.echo(f"    токенов промпта: {result['prompt_tokens']}, из кэша префикса: "
+                               f"{result['cached_prompt_tokens']} "
+                               f"({result['cached_prompt_tokens'] / result['prompt_tokens']:.0%})")
+    finally:
+        server.shutdown()
+
+    if json_out:
+        with open(json_out, "w", encoding="utf-8") as f:
+            json.dump({"config": {"count": len(pdf_paths), "iterations": iterations, "latency": latency,
+                                  "tokens_per_second": tokens_per_second,
+                                  "prompt_tokens_per_second": prompt_tokens_per_second, "stream": stream},
+                       "results": results}, f, ensure_ascii=False, indent=2)
+        click.echo(f"Результаты сохранены в: {json_out}")
+
+
+if __name__ == '__main__':
+    main()
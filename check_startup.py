@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+
+# Проверка времени запуска CLI по данным "python -X importtime".
+# Запускает короткие команды (--help), суммирует время импорта модулей верхнего уровня
+# и завершается с кодом 1, если превышен бюджет или при запуске загружены тяжелые зависимости,
+# которые должны импортироваться только внутри команд (см. cli/main.py).
+#
+#   python check_startup.py            # бюджет по умолчанию
+#   python check_startup.py 150        # бюджет в миллисекундах
+
+STARTUP_BUDGET_MS = float(sys.argv[1]) if len(sys.argv) > 1 else 100.0
+COMMANDS = [
+    ["--help"],
+    ["generate-plan", "--help"],
+    ["batch", "--help"],
+]
+FORBIDDEN_MODULES = ["ollama", "httpx", "pypdf", "docx", "lxml", "openpyxl", "pandas"]
+RUNS = 3  # берется лучший из нескольких запусков, чтобы не ловить случайные задержки диска
+
+
+def measure(args):
+    """Возвращает (суммарное время импорта в мс, {модуль: накопленное время в мкс})."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-m", "cli.main", *args],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise RuntimeError(f"Команда {' '.join(args)} завершилась с кодом {result.returncode}:\n{result.stderr}")
+    modules = {}
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        level = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = int(cumulative)
+        if level == 0:
+            total_us += int(cumulative)
+    return total_us / 1000, modules
+
+
+failed = False
+for args in COMMANDS:
+    best_ms, modules = min((measure(args) for _ in range(RUNS)), key=lambda measurement: measurement[0])
+    loaded = sorted({name for name in modules if name.split(".")[0] in FORBIDDEN_MODULES})
+    heaviest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:5]
+    status = "OK" if best_ms <= STARTUP_BUDGET_MS and not loaded else "ПРЕВЫШЕНИЕ"
+    print(f"[{status}] cli {' '.join(args)}: импорт {best_ms:.1f} мс (бюджет {STARTUP_BUDGET_MS:.0f} мс)")
+    print("    самые тяжелые: " + ", ".join(f"{name} {cumulative / 1000:.1f} мс" for name, cumulative in heaviest))
+    if loaded:
+        print(f"    загружены тяжелые зависимости: {', '.join(loaded)}")
+    failed = failed or status != "OK"
+
+sys.exit(1 if failed else 0)
@@ -1,45 +1,274 @@
 # cli/main.py
 
 import click
+import logging
 import os
 from dotenv import load_dotenv
 
-from core.parser import RaportParser # Изменено на RaportParser
-from core.plan_generator import generate_investigation_plan
-from utils.doc_formatter import create_investigation_plan_doc
+from core.cache import DEFAULT_CACHE_PATH, ExtractionCache
+
+# Тяжелые зависимости (ollama/httpx, pypdf, python-docx/lxml) импортируются внутри команд,
+# на том этапе, где они нужны: --help и ошибки в аргументах не должны платить за их загрузку.
+# Бюджет времени запуска проверяет check_startup.py.
 
 # Загружаем переменные окружения из .env файла
 load_dotenv()
 
-@click.command()
+
+def parser_options(command):
+    """
+    Общие опции извлечения данных (модель, режим обращения к Ollama, кэш)
+    для команд, использующих RaportParser. Значения собираются в build_parser.
+    """
+    options = [
+        click.option('--ollama-model', '-m', default='llama3',
+                     help='Название модели Ollama для использования (например, llama3).'),
+        click.option('--draft-model', envvar='OLLAMA_DRAFT_MODEL', default=None,
+                     help='Черновая (малая) модель каскада, например "llama3.2:3b": она отвечает первой, '
+                          'а основной модели передаются только поля, не прошедшие проверку '
+                          '(обязательные поля, формат номера ЕРДР, статья УК РК).'),
+        click.option('--keep-alive', envvar='OLLAMA_KEEP_ALIVE', default=None,
+                     help='Сколько держать модель в памяти Ollama после запроса: "30m", "2h", '
+                          'секунды или "-1" (постоянно). По умолчанию - настройка сервера.'),
+        click.option('--warm-up/--no-warm-up', default=True, show_default=True,
+                     help='Загружать модель в Ollama параллельно с разбором PDF.'),
+        click.option('--stream/--no-stream', default=True, show_default=True,
+                     help='Потоковый ответ Ollama с остановкой генерации сразу после закрытия JSON-объекта.'),
+        click.option('--async-llm/--sync-llm', default=False, show_default=True,
+                     help='Асинхронный клиент Ollama: общий пул соединений, лимит одновременных запросов, '
+                          'таймауты и повторы с экспоненциальной задержкой.'),
+        click.option('--request-timeout', type=click.FloatRange(min=1), default=300.0, show_default=True,
+                     help='Таймаут одного запроса к Ollama в секундах (асинхронный клиент).'),
+        click.option('--max-retries', type=click.IntRange(min=0), default=3, show_default=True,
+                     help='Число повторов запроса при ошибках 429/5xx и сетевых сбоях (асинхронный клиент).'),
+        click.option('--ollama-hosts', envvar='OLLAMA_HOSTS', default=None,
+                     help='Адреса нескольких экземпляров Ollama через запятую '
+                          '(например, "http://gpu1:11434,http://gpu2:11434"): запросы распределяются '
+                          'по наименее загруженному и переотправляются при сбое.'),
+        click.option('--hedge-percentile', envvar='OLLAMA_HEDGE_PERCENTILE',
+                     type=click.FloatRange(min=50, max=99.9), default=None,
+                     help='Дублировать на другой экземпляр запрос, выполняющийся дольше этого перцентиля '
+                          'задержек (например, 95). Только вместе с --ollama-hosts.'),
+        click.option('--ollama-failure-cooldown', envvar='OLLAMA_FAILURE_COOLDOWN',
+                     type=click.FloatRange(min=0), default=30.0, show_default=True,
+                     help='Сколько секунд не отправлять запросы на экземпляр Ollama после сбоя '
+                          '(раньше - только если его вернет проверка здоровья). Только вместе с --ollama-hosts.'),
+        click.option('--pre-extract/--no-pre-extract', default=True, show_default=True,
+                     help='Заполнять регулярные поля (номер и дата ЕРДР, статья, даты) правилами без LLM.'),
+        click.option('--max-prompt-chars', type=click.IntRange(min=1000), default=12000, show_default=True,
+                     help='Максимальный объем текста рапорта в одном запросе; более длинные рапорты '
+                          'обрабатываются по фрагментам страниц (map-reduce).'),
+        click.option('--chunk-workers', type=click.IntRange(min=1), default=2, show_default=True,
+                     help='Число фрагментов длинного рапорта, структурируемых одновременно.'),
+        click.option('--max-num-ctx', type=click.IntRange(min=2048), default=16384, show_default=True,
+                     help='Верхняя граница контекста (num_ctx) на запрос; фактический размер подбирается '
+                          'по длине промпта.'),
+        click.option('--max-pages', type=click.IntRange(min=1), default=None,
+                     help='Читать не больше указанного числа страниц PDF.'),
+        click.option('--early-stop/--no-early-stop', default=False, show_default=True,
+                     help='Прекращать чтение PDF, как только найдена шапка рапорта (номер и дата ЕРДР, статья, даты).'),
+        click.option('--cache-path', type=click.Path(dir_okay=False), default=DEFAULT_CACHE_PATH,
+                     show_default=True, help='Путь к файлу кэша результатов LLM (SQLite).'),
+        click.option('--no-cache', is_flag=True,
+                     help='Не использовать кэш результатов LLM (всегда обращаться к модели).'),
+        click.option('--clear-cache', is_flag=True,
+                     help='Очистить кэш результатов LLM перед запуском.'),
+        click.option('--near-duplicates/--no-near-duplicates', default=True, show_default=True,
+                     help='Переносить данные ранее обработанного почти одинакового рапорта (перерегистрация, '
+                          'исправленная версия) и извлекать LLM только поля, затронутые различиями текстов. '
+                          'Индекс хранится в файле кэша LLM.'),
+        click.option('--near-duplicate-threshold', type=click.FloatRange(min=0.5, max=1.0), default=0.9,
+                     show_default=True,
+                     help='Минимальное сходство текстов (коэффициент Жаккара по последовательностям из 4 слов).'),
+        click.option('--split-bundles/--no-split-bundles', default=True, show_default=True,
+                     help='Делить PDF, в котором подряд сшиты несколько рапортов с разными номерами ЕРДР, '
+                          'на отдельные рапорты с отдельным планом для каждого (не работает с --early-stop).'),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def open_cache(cache_path, no_cache, clear_cache):
+    if clear_cache:
+        removed = ExtractionCache(cache_path).clear()
+        click.echo(f"Кэш LLM очищен: удалено записей - {removed}.")
+    if no_cache:
+        return None
+    return ExtractionCache(cache_path)
+
+
+def open_near_duplicates(cache_path, no_cache, clear_cache, near_duplicates, threshold):
+    if no_cache or not near_duplicates:
+        return None
+    from core.near_duplicates import NearDuplicateIndex
+
+    index = NearDuplicateIndex(cache_path, threshold=threshold)
+    if clear_cache:
+        index.clear()
+    return index
+
+
+def open_host_pool(ollama_hosts, hedge_percentile, failure_cooldown):
+    urls = [url.strip() for url in (ollama_hosts or "").split(",") if url.strip()]
+    if not urls:
+        return None
+    from core.host_pool import OllamaHostPool
+
+    pool = OllamaHostPool(urls, failure_cooldown=failure_cooldown,
+                          hedge_percentile=hedge_percentile / 100 if hedge_percentile else None)
+    pool.start_health_checks()
+    click.echo(f"Пул Ollama: {', '.join(urls)}")
+    return pool
+
+
+def build_parser(ollama_model, draft_model, keep_alive, warm_up, stream, async_llm, request_timeout, max_retries,
+                 ollama_hosts, hedge_percentile, ollama_failure_cooldown, pre_extract, max_prompt_chars, chunk_workers,
+                 max_num_ctx, max_pages, early_stop, cache_path, no_cache, clear_cache, near_duplicates,
+                 near_duplicate_threshold, split_bundles,
+                 llm_concurrency=None):
+    """
+    Создает RaportParser из значений parser_options. llm_concurrency - лимит одновременных
+    запросов асинхронного клиента (по умолчанию - chunk_workers).
+    """
+    from core.parser import RaportParser
+
+    return RaportParser(ollama_model=ollama_model, draft_model=draft_model, cache=open_cache(cache_path, no_cache, clear_cache),
+                        stream=stream, pre_extract=pre_extract, max_prompt_chars=max_prompt_chars,
+                        chunk_workers=chunk_workers, max_num_ctx=max_num_ctx,
+                        max_pages=max_pages, early_stop=early_stop,
+                        keep_alive=keep_alive, warm_up=warm_up,
+                        async_llm=async_llm, llm_concurrency=llm_concurrency or chunk_workers,
+                        request_timeout=request_timeout, max_retries=max_retries,
+                        host_pool=open_host_pool(ollama_hosts, hedge_percentile, ollama_failure_cooldown),
+                        near_duplicates=open_near_duplicates(cache_path, no_cache, clear_cache, near_duplicates,
+                                                             near_duplicate_threshold),
+                        split_bundles=split_bundles)
+
+
+def metrics_options(command):
+    """Опции экспорта метрик этапов обработки документов."""
+    options = [
+        click.option('--metrics-jsonl', type=click.Path(dir_okay=False), default=None,
+                     help='Дописывать метрики каждого документа (время этапов, токены Ollama) в файл JSON lines.'),
+        click.option('--metrics-prom', type=click.Path(dir_okay=False), default=None,
+                     help='Файл метрик для textfile collector Prometheus (node_exporter), '
+                          'например /var/lib/node_exporter/plan_llm.prom.'),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def open_metrics_sink(metrics_jsonl, metrics_prom):
+    if not metrics_jsonl and not metrics_prom:
+        return None
+    from core.metrics import MetricsSink
+
+    return MetricsSink(jsonl_path=metrics_jsonl, prometheus_path=metrics_prom)
+
+
+def result_outputs(result):
+    """Документы результата DocumentPipeline: у PDF-пакета - по одному на каждый рапорт."""
+    parts = result.get("parts")
+    return ", ".join(part["output"] for part in parts) if parts else result["output"]
+
+
+class DefaultCommandGroup(click.Group):
+    """
+    Группа команд, совместимая с прежним интерфейсом из одной команды: если аргументы начинаются
+    с опции (например, "python cli/main.py -r raport.pdf"), они передаются команде по умолчанию
+    (generate-plan). Неизвестное имя команды ("bach dir/") - ошибка "No such command".
+    """
+
+    default_command = 'generate-plan'
+
+    def resolve_command(self, ctx, args):
+        if args and args[0].startswith('-') and args[0] not in self.commands:
+            return self.default_command, self.commands[self.default_command], args
+        return super().resolve_command(ctx, args)
+
+
+# ignore_unknown_options: опции команды по умолчанию (-r, -o, ...) не должны разбираться группой
+@click.group(cls=DefaultCommandGroup, context_settings={'ignore_unknown_options': True})
+@click.option('--log-level', type=click.Choice(['DEBUG', 'INFO', 'WARNING', 'ERROR'], case_sensitive=False),
+              default='WARNING', show_default=True, envvar='PLAN_LLM_LOG_LEVEL',
+              help='Уровень журнала (DEBUG - отладка формирования действий плана).')
+def cli(log_level):
+    """
+    Генерация планов досудебного расследования по рапортам ЕРДР.
+    Без имени команды выполняется generate-plan: "main.py -r raport.pdf".
+    """
+    logging.basicConfig(level=log_level.upper(), format='%(levelname)s %(name)s: %(message)s')
+
+
+@cli.command()
 @click.option('--raport-pdf', '-r', type=click.Path(exists=True, readable=True, resolve_path=True),
               required=True, help='Путь к PDF-файлу рапорта ЕРДР.')
 @click.option('--output', '-o', type=click.Path(),
               default='data/output/generated_investigation_plan.docx',
               help='Путь для сохранения сгенерированного документа Word.')
-@click.option('--ollama-model', '-m', default='llama3', help='Название модели Ollama для использования (например, llama3).')
-def generate_plan(raport_pdf, output, ollama_model):
+@click.option('--verify-docx', is_flag=True,
+              help='Перечитать сохраненный документ и вывести содержимое таблицы (отладка).')
+@metrics_options
+@parser_options
+def generate_plan(raport_pdf, output, verify_docx, metrics_jsonl, metrics_prom, **parser_settings):
     """
     Генерирует план досудебного расследования уголовного дела на основе PDF-файла рапорта ЕРДР,
     используя Ollama для извлечения данных.
     """
-    parser = RaportParser(ollama_model=ollama_model)
+    from core.metrics import document_metrics
 
-    click.echo(f"Загрузка и парсинг рапорта из PDF: {raport_pdf} с использованием модели Ollama: {ollama_model}")
+    with document_metrics(raport_pdf, open_metrics_sink(metrics_jsonl, metrics_prom)) as metrics:
+        parser = build_parser(**parser_settings)
+        try:
+            if _generate_plan(raport_pdf, output, verify_docx, parser):
+                metrics.set("status", "ok")
+        finally:
+            parser.close()
+
+
+def _generate_plan(raport_pdf, output, verify_docx, parser):
+    from core.batch import part_output_path
+
+    click.echo(f"Загрузка и парсинг рапорта из PDF: {raport_pdf} с использованием модели Ollama: {parser.ollama_client.model_label}")
     try:
-        case_data = parser.parse_raport_pdf_with_llm(raport_pdf)
-        if case_data is None:
+        raports = parser.parse_raport_bundle_pdf_with_llm(raport_pdf)
+        if raports is None or all(case_data is None for case_data in raports):
             click.echo("Произошла ошибка при извлечении или парсинге текста из PDF. Прерывание.", err=True)
-            return
+            return False
 
         click.echo("Данные из рапорта успешно извлечены и структурированы.")
-        # Для отладки: click.echo(f"Извлеченные данные: {case_data}")
+        # Для отладки: click.echo(f"Извлеченные данные: {raports}")
     except Exception as e:
         click.echo(f"Критическая ошибка при обработке PDF или парсинге: {e}", err=True)
-        return
+        return False
+
+    if len(raports) == 1:
+        return _write_plan(raports[0], output, raport_pdf, parser.ollama_client.model_label, verify_docx)
+
+    # PDF-пакет из нескольких рапортов: отдельный документ на каждый рапорт
+    succeeded = True
+    for number, case_data in enumerate(raports, start=1):
+        click.echo(f"\n--- Рапорт {number} из {len(raports)} ---")
+        if case_data is None:
+            click.echo(f"Рапорт {number}: LLM не смог структурировать данные.", err=True)
+            succeeded = False
+            continue
+        succeeded &= _write_plan(case_data, part_output_path(output, number), raport_pdf,
+                                 parser.ollama_client.model_label, verify_docx)
+    return succeeded
+
+
+def _write_plan(case_data, output, raport_pdf, model, verify_docx):
+    from core.metrics import stage
+    from core.plan_generator import generate_investigation_plan
+    from core.sidecar import write_sidecar
+    from utils.doc_formatter import create_investigation_plan_doc
 
     click.echo("Генерация плана расследования...")
-    investigation_plan = generate_investigation_plan(case_data)
+    with stage("plan"):
+        investigation_plan = generate_investigation_plan(case_data)
     click.echo("План расследования сгенерирован.")
 
     # Создаем директорию для вывода, если ее нет
@@ -48,10 +277,209 @@ def generate_plan(raport_pdf, output, ollama_model):
         os.makedirs(output_dir)
 
     try:
-        create_investigation_plan_doc(investigation_plan, output)
+        with stage("render"):
+            create_investigation_plan_doc(investigation_plan, output, verify=verify_docx)
         click.echo(f"Готовый документ сохранен в: {output}")
     except Exception as e:
         click.echo(f"Ошибка при сохранении документа Word: {e}", err=True)
+        return False
+
+    try:
+        sidecar_path = write_sidecar(output, case_data, source_pdf=raport_pdf, model=model)
+        click.echo(f"Данные рапорта сохранены в: {sidecar_path} (для пересборки командой rerender)")
+    except Exception as e:
+        click.echo(f"Ошибка при сохранении данных рапорта: {e}", err=True)
+    return True
+
+
+@cli.command()
+@click.argument('inputs', nargs=-1, required=True)
+@click.option('--output-dir', '-o', type=click.Path(file_okay=False),
+              default='data/output', help='Директория для сохранения сгенерированных документов Word.')
+@click.option('--workers', '-w', type=click.IntRange(min=1), default=None,
+              help='Число процессов для извлечения текста из PDF (по умолчанию - число CPU).')
+@click.option('--max-llm-requests', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Максимальное число одновременных запросов к Ollama (считая каждый фрагмент длинного рапорта).')
+@click.option('--verify-docx', is_flag=True,
+              help='Перечитывать каждый сохраненный документ и выводить содержимое таблицы (отладка).')
+@click.option('--journal/--no-journal', default=True, show_default=True,
+              help='Вести журнал этапов в директории результатов: повторный запуск продолжает '
+                   'с последнего завершенного этапа каждого документа (без повторного разбора PDF и запросов к LLM).')
+@click.option('--restart', is_flag=True, help='Очистить журнал и обработать все рапорты заново.')
+@metrics_options
+@parser_options
+def batch(inputs, output_dir, workers, max_llm_requests, verify_docx, journal, restart, metrics_jsonl, metrics_prom,
+          **parser_settings):
+    """
+    Генерирует планы для набора рапортов. INPUTS - директории с PDF,
+    glob-шаблоны (например, "data/input/*.pdf") или пути к отдельным файлам.
+    """
+    from core.batch import collect_raport_pdfs, run_batch
+    from core.journal import BatchJournal, journal_path_for
+
+    pdf_paths = collect_raport_pdfs(inputs)
+    if not pdf_paths:
+        click.echo("Не найдено ни одного PDF-файла рапорта. Прерывание.", err=True)
+        return
+
+    batch_journal = None
+    if journal:
+        batch_journal = BatchJournal(journal_path_for(output_dir))
+        if restart:
+            removed = batch_journal.clear()
+            click.echo(f"Журнал пакета очищен: удалено записей - {removed}.")
+    parser = build_parser(llm_concurrency=max_llm_requests, **parser_settings)
+    click.echo(f"Найдено рапортов: {len(pdf_paths)}. Модель Ollama: {parser.ollama_client.model_label}, "
+               f"одновременных запросов к LLM: {max_llm_requests}")
+    try:
+        results = run_batch(pdf_paths, output_dir, parser, workers=workers, max_llm_requests=max_llm_requests,
+                            verify_docx=verify_docx, metrics_sink=open_metrics_sink(metrics_jsonl, metrics_prom),
+                            journal=batch_journal)
+    finally:
+        parser.close()
+
+    click.echo("\n--- Итоги пакетной обработки ---")
+    for result in results:
+        resumed = f" (продолжено с этапа {result['resumed']})" if result["resumed"] else ""
+        if result["status"] == "ok":
+            click.echo(f"[OK]     {result['pdf']} -> {result_outputs(result)}{resumed}")
+        else:
+            click.echo(f"[ОШИБКА] {result['pdf']}: {result['error']}{resumed}")
+    succeeded = sum(1 for result in results if result["status"] == "ok")
+    resumed = sum(1 for result in results if result["resumed"])
+    click.echo(f"Успешно: {succeeded}, с ошибками: {len(results) - succeeded}, всего: {len(results)}"
+               + (f", продолжено по журналу: {resumed}" if resumed else ""))
+
+
+@cli.command()
+@click.argument('directories', nargs=-1, type=click.Path(exists=True, file_okay=False))
+@click.option('--output-dir', '-o', type=click.Path(file_okay=False),
+              default='data/output', help='Директория для сохранения сгенерированных документов Word.')
+@click.option('--workers', '-w', type=click.IntRange(min=1), default=None,
+              help='Число процессов для извлечения текста из PDF (по умолчанию - число CPU).')
+@click.option('--max-llm-requests', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Максимальное число одновременных запросов к Ollama (считая каждый фрагмент длинного рапорта).')
+@click.option('--queue-size', type=click.IntRange(min=1), default=16, show_default=True,
+              help='Предел документов в очереди: пока она заполнена, новые файлы не принимаются.')
+@click.option('--settle-seconds', type=click.FloatRange(min=0), default=2.0, show_default=True,
+              help='Файл берется в работу, когда его размер и время изменения не меняются столько секунд.')
+@click.option('--poll-interval', type=click.FloatRange(min=0.1), default=5.0, show_default=True,
+              help='Период сканирования директорий (с inotify - страховочный).')
+@click.option('--inotify/--no-inotify', default=True, show_default=True,
+              help='Узнавать о новых файлах через inotify (Linux); без него - только опрос.')
+@click.option('--keep-warm-interval', type=click.FloatRange(min=0), default=240.0, show_default=True,
+              help='Раз в сколько секунд простоя продлевать keep_alive модели (с тем же num_ctx, '
+                   'без перезагрузки), чтобы Ollama не выгружала ее (0 - не продлевать).')
+@click.option('--retry-interval', type=click.FloatRange(min=1), default=300.0, show_default=True,
+              help='Через сколько секунд повторять документы, обработка которых завершилась ошибкой.')
+@click.option('--journal/--no-journal', default=True, show_default=True,
+              help='Вести журнал этапов в директории результатов: после перезапуска документы продолжаются '
+                   'с последнего завершенного этапа, готовые не обрабатываются заново.')
+@metrics_options
+@parser_options
+def watch(directories, output_dir, workers, max_llm_requests, queue_size, settle_seconds, poll_interval, inotify,
+          keep_warm_interval, retry_interval, journal, metrics_jsonl, metrics_prom, **parser_settings):
+    """
+    Наблюдает за директориями (по умолчанию data/input) и генерирует планы для новых рапортов
+    по мере их появления. Завершение - SIGTERM или Ctrl+C: очередь дообрабатывается.
+    """
+    from core.batch import DocumentPipeline
+    from core.journal import BatchJournal, journal_path_for
+    from core.watch import FolderWatcher, run_watch
+
+    directories = directories or ('data/input',)
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+
+    parser = build_parser(llm_concurrency=max_llm_requests, **parser_settings)
+    pipeline = DocumentPipeline(output_dir, parser, workers=workers, max_llm_requests=max_llm_requests,
+                                metrics_sink=open_metrics_sink(metrics_jsonl, metrics_prom),
+                                journal=BatchJournal(journal_path_for(output_dir)) if journal else None)
+    watcher = FolderWatcher(directories, settle_seconds=settle_seconds, poll_interval=poll_interval,
+                            use_inotify=inotify)
+    click.echo(f"Наблюдение за: {', '.join(watcher.directories)} "
+               f"({'inotify' if watcher.uses_inotify else f'опрос каждые {poll_interval:g} с'}). "
+               f"Модель Ollama: {parser.ollama_client.model_label}, результаты: {output_dir}")
+
+    def report(result):
+        if result["status"] == "ok":
+            click.echo(f"[OK]     {result['pdf']} -> {result_outputs(result)}")
+        else:
+            click.echo(f"[ОШИБКА] {result['pdf']}: {result['error']} (повтор через {retry_interval:g} с)")
+
+    try:
+        run_watch(watcher, pipeline, consumers=pipeline.workers + max_llm_requests, queue_size=queue_size,
+                  keep_warm_interval=keep_warm_interval or None, retry_interval=retry_interval, on_result=report)
+    finally:
+        pipeline.close()
+        parser.close()
+    click.echo("Наблюдение остановлено.")
+
+
+@cli.command()
+@click.option('--host', default='127.0.0.1', show_default=True, help='Адрес для HTTP-соединений.')
+@click.option('--port', type=click.IntRange(min=0, max=65535), default=8765, show_default=True,
+              help='Порт для HTTP-соединений.')
+@click.option('--unix-socket', type=click.Path(dir_okay=False), default=None,
+              help='Слушать Unix-сокет по этому пути вместо TCP (доступ - по правам на файл сокета).')
+@click.option('--max-llm-requests', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Максимальное число одновременных запросов к Ollama (считая каждый фрагмент длинного рапорта).')
+@metrics_options
+@parser_options
+def serve(host, port, unix_socket, max_llm_requests, metrics_jsonl, metrics_prom, **parser_settings):
+    """
+    Локальный сервис генерации планов: POST /v1/case-data (PDF -> массив case_data),
+    /v1/plan (case_data -> план JSON), /v1/docx (план -> .docx). Одинаковые одновременные
+    запросы выполняются один раз. Завершение - SIGTERM или Ctrl+C.
+    """
+    from core.server import PlanService, make_server, preload_plan_templates, run_server
+
+    parser = build_parser(llm_concurrency=max_llm_requests, **parser_settings)
+    preload_plan_templates()
+    service = PlanService(parser, max_llm_requests=max_llm_requests,
+                          metrics_sink=open_metrics_sink(metrics_jsonl, metrics_prom))
+    server = make_server(service, host=host, port=port, unix_socket=unix_socket)
+    address = f"unix:{unix_socket}" if unix_socket else f"http://{host}:{server.server_port}"
+    click.echo(f"Сервис планов слушает {address}. Модель Ollama: {service.model}")
+    try:
+        run_server(server, service)
+    finally:
+        parser.close()
+    click.echo("Сервис остановлен.")
+
+
+@cli.command()
+@click.argument('inputs', nargs=-1, required=True)
+@click.option('--force', is_flag=True, help='Пересобрать все документы, даже если входные данные не изменились.')
+@click.option('--verify-docx', is_flag=True,
+              help='Перечитывать каждый сохраненный документ и выводить содержимое таблицы (отладка).')
+def rerender(inputs, force, verify_docx):
+    """
+    Пересобирает планы по сохраненным данным рапортов (*.case.json рядом с .docx) без PDF и LLM.
+    INPUTS - директории, glob-шаблоны или пути к файлам. Пересобираются только документы,
+    у которых изменились данные, шаблоны действий, методика или макет документа.
+    """
+    from core.sidecar import collect_sidecars, render_fingerprints, rerender_sidecar
+
+    sidecar_paths = collect_sidecars(inputs)
+    if not sidecar_paths:
+        click.echo("Не найдено ни одного файла данных рапорта (*.case.json). Прерывание.", err=True)
+        return
+
+    fingerprints = render_fingerprints()
+    results = [rerender_sidecar(path, fingerprints, force=force, verify=verify_docx) for path in sidecar_paths]
+
+    click.echo("\n--- Итоги пересборки ---")
+    for result in results:
+        if result["status"] == "rendered":
+            click.echo(f"[ПЕРЕСОБРАН] {result['output']}")
+        elif result["status"] == "error":
+            click.echo(f"[ОШИБКА]     {result['sidecar']}: {result['error']}")
+    counts = {status: sum(1 for result in results if result["status"] == status)
+              for status in ("rendered", "unchanged", "error")}
+    click.echo(f"Пересобрано: {counts['rendered']}, без изменений: {counts['unchanged']}, "
+               f"с ошибками: {counts['error']}, всего: {len(results)}")
+
 
 if __name__ == '__main__':
-    generate_plan()
+    cli()
@@ -0,0 +1,131 @@
+# core/action_index.py
+
+import heapq
+import re
+
+# Скомпилированный индекс шаблонов действий плана (core/templates.INVESTIGATION_PLAN_ACTIONS).
+# Шаблоны один раз раскладываются в обратный индекс "статья -> действия" и отдельные списки
+# универсальных действий и действий, привязанных только к типу правонарушения, поэтому выбор
+# действий для дела занимает время, пропорциональное числу подходящих действий, а не размеру библиотеки.
+#
+# Условия отбора в шаблоне:
+#   "relevant_articles" - статьи УК РК: "217", "217 ч.2" или "217 ч.2 п.1" (часть и пункт уточняют статью);
+#                         пустой список - действие не зависит от статьи;
+#   "relevant_types"    - подстроки типа правонарушения в нижнем регистре (например, "пирамид");
+#                         пустой список или отсутствие ключа - действие не зависит от типа.
+# Если заданы оба условия, должны выполняться оба.
+
+_SPEC_RE = re.compile(r"^\s*(\d{1,3}(?:-\d+)?)(?:\s*ч\.?\s*(\d+))?(?:\s*п\.?\s*(\d+))?\s*$")
+_ARTICLE_WITH_PREFIX_RE = re.compile(r"ст(?:атья|атьи|\.)?\s*(\d{1,3}(?:-\d+)?)")
+_LEADING_ARTICLE_RE = re.compile(r"\s*(\d{1,3}(?:-\d+)?)")
+_PART_RE = re.compile(r"ч(?:асть|асти|\.)?\s*(\d+)")
+_POINT_RE = re.compile(r"п(?:ункт|ункта|\.)?\s*(\d+)")
+
+
+def parse_uk_article(uk_article_string):
+    """
+    Разбирает статью УК РК ("217 ч.2 п.1", "ст. 217 ч. 2", "п.1 ч.2 ст.217 УК РК")
+    в кортеж (статья, часть, пункт); отсутствующие части - None.
+    Возвращает None, если номер статьи не найден.
+    """
+    if not uk_article_string:
+        return None
+    match = _ARTICLE_WITH_PREFIX_RE.search(uk_article_string) or _LEADING_ARTICLE_RE.match(uk_article_string)
+    if not match:
+        return None
+    part = _PART_RE.search(uk_article_string)
+    point = _POINT_RE.search(uk_article_string)
+    return match.group(1), part.group(1) if part else None, point.group(1) if point else None
+
+
+def _parse_spec(spec):
+    match = _SPEC_RE.match(str(spec))
+    if not match:
+        raise ValueError(f"Некорректная статья в relevant_articles шаблона действия: '{spec}'")
+    return match.groups()
+
+
+def _article_keys(article):
+    # "190-1" ищется и как "190-1", и как "190" - так же, как ее сопоставлял extract_main_uk_article
+    base = article.split("-", 1)[0]
+    return (article, base) if base != article else (article,)
+
+
+class ActionIndex:
+    """
+    Обратный индекс шаблонов действий. Порядок действий в плане совпадает
+    с порядком шаблонов; срок и исполнитель, не зависящие от дела, вычисляются при компиляции.
+    """
+
+    def __init__(self, actions, durations):
+        self.size = len(actions)
+        self.universal = []
+        self.by_article = {}
+        self.by_type = {}
+        for order, template in enumerate(actions):
+            specs = [_parse_spec(spec) for spec in template.get("relevant_articles") or []]
+            types = tuple(type_.lower() for type_ in template.get("relevant_types") or [])
+
+            stage = template.get("methodology_stage")
+            if stage and stage in durations:
+                srok, srok_source = durations[stage], "методология"
+            elif template.get("срок"):
+                srok, srok_source = template["срок"], "шаблон"
+            else:
+                srok, srok_source = None, "дата ЕРДР"
+            entry = (order, template, specs, types, srok, srok_source)
+
+            if specs:
+                for article in {spec[0] for spec in specs}:
+                    self.by_article.setdefault(article, []).append(entry)
+            elif types:
+                for type_ in types:
+                    self.by_type.setdefault(type_, []).append(entry)
+            else:
+                self.universal.append(entry)
+
+    @staticmethod
+    def _matches(entry, article, part, point, offence_type):
+        _, _, specs, types, _, _ = entry
+        if specs and not any(
+            spec_article in _article_keys(article)
+            and (spec_part is None or spec_part == part)
+            and (spec_point is None or spec_point == point)
+            for spec_article, spec_part, spec_point in specs
+        ):
+            return False
+        if types and not any(type_ in offence_type for type_ in types):
+            return False
+        return True
+
+    def select(self, uk_article_string, offence_type=None):
+        """
+        Возвращает подходящие записи индекса в порядке шаблонов:
+        кортежи (order, template, specs, types, srok, srok_source).
+        """
+        parsed = parse_uk_article(uk_article_string)
+        offence_type = (offence_type or "").lower()
+        buckets = [self.universal]
+        if parsed:
+            buckets.extend(self.by_article.get(key, []) for key in _article_keys(parsed[0]))
+        if offence_type:
+            # Ключей типов немного (десятки), в отличие от самих действий
+            buckets.extend(entries for type_, entries in self.by_type.items() if type_ in offence_type)
+
+        article, part, point = parsed or (None, None, None)
+        selected = []
+        last_order = None
+        for entry in heapq.merge(*buckets, key=lambda entry: entry[0]):
+            if entry[0] == last_order:
+                continue  # действие пришло из нескольких корзин
+            last_order = entry[0]
+            if entry[2] and article is None:
+                continue
+            if self._matches(entry, article, part, point, offence_type):
+                selected.append(entry)
+        return selected
+
+
+def compile_action_index(actions, durations):
+    """Компилирует шаблоны действий в ActionIndex (durations - соответствие этапа методологии и срока)."""
+    return ActionIndex(actions, durations)
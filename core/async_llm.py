@@ -0,0 +1,199 @@
+# core/async_llm.py
+
+import asyncio
+import random
+import threading
+import time
+
+import httpx
+import ollama
+
+from core.llm_utils import ChatStreamReader, OllamaClient
+from core.metrics import add_metric, bind_metrics, current_metrics, record_llm_response
+
+# Коды ответа Ollama, при которых запрос имеет смысл повторить:
+# перегрузка очереди (503 при превышении OLLAMA_MAX_QUEUE), 429 и ошибки шлюза/сервера.
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RequestTimeoutError(Exception):
+    """Запрос к Ollama не уложился в request_timeout."""
+
+
+def is_retryable_error(error):
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (httpx.TransportError, ConnectionError, RequestTimeoutError))
+
+
+class AsyncOllamaClient(OllamaClient):
+    """
+    Асинхронный клиент Ollama на базе ollama.AsyncClient с общим пулом HTTP-соединений.
+    Ограничивает число одновременных запросов (max_in_flight), повторяет запросы
+    с экспоненциальной задержкой при ResponseError 429/5xx и сетевых ошибках
+    и прерывает каждый запрос по request_timeout.
+
+    Для асинхронного кода - extract_case_data_async и extract_many. Синхронный
+    extract_case_data выполняет корутину в собственном цикле событий клиента (фоновый поток),
+    поэтому клиент можно передавать в RaportParser и использовать из потоков пакетного режима:
+    все их запросы проходят через один пул соединений и один семафор.
+    Один экземпляр используется либо из одного внешнего цикла событий, либо через синхронный фасад.
+    """
+
+    def __init__(self, model_name="llama3", max_in_flight=4, max_retries=3, request_timeout=300.0,
+                 backoff_base=1.0, backoff_max=30.0, **kwargs):
+        super().__init__(model_name=model_name, **kwargs)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.request_timeout = request_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._async_client = None
+        self._semaphore = None
+        self._loop = None
+        self._loop_thread = None
+        self._loop_lock = threading.Lock()
+
+    def _get_async_client(self):
+        # Создается внутри цикла событий клиента: пул соединений httpx привязан к циклу
+        if self._async_client is None:
+            limits = httpx.Limits(max_connections=self.max_in_flight,
+                                  max_keepalive_connections=self.max_in_flight)
+            self._async_client = ollama.AsyncClient(host=self.host, limits=limits)
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._async_client
+
+    def _backoff_delay(self, attempt):
+        delay = min(self.backoff_base * (2 ** attempt), self.backoff_max)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _with_retries(self, make_request):
+        """
+        Выполняет make_request(async_client) под семафором с таймаутом и повторами -
+        на своем клиенте или через пул экземпляров Ollama (переотправка и дублирование - в пуле).
+        Слот семафора освобождается на время паузы перед повтором.
+        """
+        self._get_async_client()
+        if self.host_pool is not None:
+            request = lambda: self.host_pool.acall(make_request)
+        else:
+            request = lambda: make_request(self._async_client)
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    try:
+                        return await asyncio.wait_for(request(), timeout=self.request_timeout)
+                    except asyncio.TimeoutError:
+                        raise RequestTimeoutError(
+                            f"Запрос к Ollama не завершился за {self.request_timeout} с"
+                        ) from None
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                delay = self._backoff_delay(attempt)
+                attempt += 1
+                print(f"Ошибка запроса к Ollama ({e}). Повтор {attempt}/{self.max_retries} через {delay:.1f} с.")
+                await asyncio.sleep(delay)
+
+    async def _chat_until_json_closed_async(self, client, model, messages, schema, options):
+        reader = ChatStreamReader()
+        stream = await client.chat(model=model, messages=messages, format=schema,
+                                   options=options, keep_alive=self.keep_alive, stream=True)
+        try:
+            async for part in stream:
+                if reader.feed(part):
+                    break
+        finally:
+            await stream.aclose()
+        return reader.result()
+
+    async def _request_case_data_async(self, raport_text, fields, model=None):
+        model = model or self.model
+        messages, schema, options = self._build_request(raport_text, fields, model)
+        content = ""
+        json_string_candidate = None
+        started = time.perf_counter()
+        try:
+            if self.stream:
+                content, json_string_candidate, final_part, chunks = await self._with_retries(
+                    lambda client: self._chat_until_json_closed_async(client, model, messages, schema, options)
+                )
+                record_llm_response(final_part, time.perf_counter() - started, streamed_chunks=chunks)
+            else:
+                response = await self._with_retries(
+                    lambda client: client.chat(model=model, messages=messages, format=schema,
+                                               options=options, keep_alive=self.keep_alive)
+                )
+                record_llm_response(response, time.perf_counter() - started)
+                content = response['message']['content']
+            return self._parse_case_data(content, json_string_candidate)
+        except Exception as e:
+            self._report_request_error(e, content, model)
+            return None
+
+    async def extract_fields_async(self, raport_text, fields=None, fragment=False):
+        """Асинхронный аналог OllamaClient.extract_fields (тот же _extraction_flow)."""
+        flow = self._extraction_flow(fields, fragment)
+        response = None
+        try:
+            while True:
+                request_fields, model = flow.send(response)
+                response = await self._request_case_data_async(raport_text, request_fields, model)
+        except StopIteration as done:
+            return done.value
+
+    async def extract_case_data_async(self, raport_text, fields=None, fragment=False):
+        """Асинхронный аналог OllamaClient.extract_case_data (с тем же кэшем)."""
+        cache_key = self._cache_key(raport_text, fields)
+        if cache_key is not None:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                print("Данные рапорта взяты из кэша LLM.")
+                add_metric("llm_cache_hits")
+                return cached
+
+        case_data = await self.extract_fields_async(raport_text, fields, fragment)
+        if case_data is not None and cache_key is not None:
+            await asyncio.to_thread(self.cache.put, cache_key, self.model_label, case_data)
+        return case_data
+
+    async def extract_many(self, raport_texts, fields=None):
+        """Структурирует несколько текстов одновременно (не более max_in_flight запросов)."""
+        return await asyncio.gather(*(self.extract_case_data_async(text, fields) for text in raport_texts))
+
+    # --- Синхронный фасад для RaportParser и потоков пакетного режима ---
+
+    def _ensure_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(target=self._loop.run_forever,
+                                                     name="ollama-async-client", daemon=True)
+                self._loop_thread.start()
+        return self._loop
+
+    def run(self, coroutine):
+        """Выполняет корутину в цикле событий клиента и ждет результат."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop()).result()
+
+    def extract_case_data(self, raport_text, fields=None, fragment=False):
+        # Задача в цикле клиента не видит contextvars вызывающего потока - передаем сборщик метрик
+        return self.run(bind_metrics(current_metrics(),
+                                     self.extract_case_data_async(raport_text, fields, fragment)))
+
+    def close(self):
+        super().close()
+        if self._loop is None:
+            return
+        if self._async_client is not None:
+            self.run(self._async_client.close())
+        if self.host_pool is not None:
+            self.run(self.host_pool.aclose())
+        # Досрочно закрытые потоковые ответы оставляют незавершенные async-генераторы httpx
+        self.run(self._loop.shutdown_asyncgens())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop_thread.join()
+        self._loop.close()
+        self._loop = None
+        self._async_client = None
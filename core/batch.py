@@ -0,0 +1,237 @@
+# core/batch.py
+
+import glob
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from core.parser import extract_pages_from_pdf, join_pages
+from core.metrics import current_metrics, document_metrics, set_metric, stage, use_metrics
+from core.plan_generator import generate_investigation_plan
+from core.sidecar import render_fingerprints, render_inputs_hash, write_sidecar
+from utils.doc_formatter import create_investigation_plan_doc
+
+
+def collect_raport_pdfs(inputs):
+    """
+    Раскрывает список входов (директории, glob-шаблоны или пути к файлам)
+    в отсортированный список PDF-файлов без повторов.
+    """
+    pdf_paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = glob.glob(os.path.join(item, "*.pdf")) + glob.glob(os.path.join(item, "*.PDF"))
+        else:
+            candidates = glob.glob(item, recursive=True)
+        for path in candidates:
+            if os.path.isfile(path) and path.lower().endswith(".pdf"):
+                pdf_paths.append(os.path.abspath(path))
+    return sorted(set(pdf_paths))
+
+
+def output_path_for(pdf_path, output_dir):
+    """Путь к итоговому .docx для PDF рапорта в пакетном режиме."""
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    return os.path.join(output_dir, f"{stem}_plan.docx")
+
+
+def part_output_path(output_path, number):
+    """Путь к документу number-го рапорта PDF-пакета: "<имя>_<номер>.docx" рядом с output_path."""
+    root, ext = os.path.splitext(output_path)
+    return f"{root}_{number}{ext}"
+
+
+class DocumentPipeline:
+    """
+    Конвейер PDF -> case_data -> план -> DOCX для одного документа; общий для пакетного режима
+    (run_batch) и наблюдения за директориями (core/watch.py). process() вызывается из нескольких потоков.
+
+    Извлечение текста (pypdf) выполняется в пуле процессов, обращения к Ollama - в потоках
+    вызывающего кода, но одновременно в работе не больше max_llm_requests запросов, считая каждый
+    фрагмент длинного рапорта (parser.limit_llm_requests). DOCX собирается
+    из скелета за доли миллисекунды, поэтому прямо в потоке документа (передача плана в процесс дороже).
+    verify_docx=True - перечитывать каждый сохраненный документ для отладки.
+    Рядом с каждым документом сохраняются case_data (core/sidecar.py).
+    metrics_sink - core.metrics.MetricsSink для метрик этапов по каждому документу.
+    PDF-пакет из нескольких рапортов (parser.split_bundles) дает отдельный документ на каждый рапорт.
+    journal - core.journal.BatchJournal: завершенные этапы документов фиксируются в нем,
+    и повторная обработка продолжается с последнего завершенного этапа каждого документа.
+    """
+
+    def __init__(self, output_dir, parser, workers=None, max_llm_requests=1, verify_docx=False,
+                 metrics_sink=None, journal=None):
+        self.output_dir = output_dir
+        self.parser = parser
+        self.workers = workers or os.cpu_count() or 1
+        self.verify_docx = verify_docx
+        self.metrics_sink = metrics_sink
+        self.journal = journal
+        os.makedirs(output_dir, exist_ok=True)
+
+        parser.limit_llm_requests(max_llm_requests)
+        self._process_pool = self._make_process_pool()
+        self._process_pool_lock = threading.Lock()
+
+        # Шаблоны, методика и макет одинаковы для всех документов запуска
+        self.fingerprints = render_fingerprints()
+        self.model = parser.ollama_client.model_label
+        self.extraction_key = parser.extraction_key()
+
+    def _make_process_pool(self, workers=None):
+        # spawn вместо fork: пул используется из нескольких потоков одновременно
+        return ProcessPoolExecutor(max_workers=workers or self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _extract_pages(self, pdf_path):
+        """
+        Извлекает текст в пуле процессов. Аварийное завершение процесса (например, на поврежденном PDF)
+        ломает весь пул вместе с задачами других документов: пул пересоздается, а каждый затронутый
+        документ повторяется в отдельном процессе - ошибкой завершается только тот, на котором процесс падает.
+        """
+        # Документы и так обрабатываются параллельно, поэтому внутри задачи - один процесс
+        arguments = (extract_pages_from_pdf, pdf_path, self.parser.max_pages, self.parser.early_stop, 1)
+        pool = self._process_pool
+        try:
+            return pool.submit(*arguments).result()
+        except BrokenProcessPool:
+            with self._process_pool_lock:
+                if self._process_pool is pool:
+                    pool.shutdown(wait=False)
+                    self._process_pool = self._make_process_pool()
+        isolated = self._make_process_pool(workers=1)
+        try:
+            return isolated.submit(*arguments).result()
+        except BrokenProcessPool:
+            raise RuntimeError("процесс извлечения текста аварийно завершился на этом PDF") from None
+        finally:
+            isolated.shutdown(wait=False)
+
+    def _process_document(self, pdf_path, result):
+        journal = self.journal
+        entry = journal.load(pdf_path, self.extraction_key) if journal is not None else None
+        if entry is not None:
+            result["resumed"] = entry["stage"]
+            set_metric("resumed_from", entry["stage"])
+
+        pages = None
+        if entry is None or entry["case_data"] is None:
+            pages = entry["pages"] if entry else None
+            if pages is None:
+                with stage("pdf"):
+                    pages = self._extract_pages(pdf_path)
+                if pages is None:
+                    result["error"] = "не удалось извлечь текст из PDF"
+                    return
+                if journal is not None:
+                    journal.record(pdf_path, "extracted", pages=pages)
+            parts = self.parser.split_bundle(pages)
+            if len(parts) > 1:
+                self._process_bundle(pdf_path, parts, result)
+                return
+        self._process_raport(pdf_path, pages, entry, result)
+
+    def _process_raport(self, pdf_path, pages, entry, result, part=None):
+        """Структурирует рапорт (если case_data нет в журнале), собирает план и документ."""
+        journal = self.journal
+        case_data = entry["case_data"] if entry else None
+        if case_data is None:
+            case_data = self.parser.parse_raport_text_with_llm(join_pages(pages), pages=pages)
+            if case_data is None:
+                result["error"] = "LLM не смог структурировать данные"
+                return
+            if journal is not None:
+                journal.record(pdf_path, "structured", part=part, case_data=case_data,
+                               extraction_key=self.extraction_key)
+
+        # План и документ из журнала действительны, только пока не изменились входные данные сборки
+        inputs_hash = render_inputs_hash(case_data, self.fingerprints)
+        current = entry is not None and entry["inputs_hash"] == inputs_hash
+        if current and entry["stage"] == "rendered" and entry["output"] == result["output"] \
+                and os.path.exists(result["output"]):
+            result["status"] = "ok"
+            return
+
+        investigation_plan = entry["plan"] if current else None
+        if investigation_plan is None:
+            with stage("plan"):
+                investigation_plan = generate_investigation_plan(case_data)
+            if journal is not None:
+                journal.record(pdf_path, "planned", part=part, plan=investigation_plan, inputs_hash=inputs_hash)
+        with stage("render"):
+            create_investigation_plan_doc(investigation_plan, result["output"], verify=self.verify_docx)
+            write_sidecar(result["output"], case_data, source_pdf=pdf_path, model=self.model,
+                          fingerprints=self.fingerprints)
+        if journal is not None:
+            journal.record(pdf_path, "rendered", part=part, output=result["output"])
+        result["status"] = "ok"
+
+    def _process_bundle(self, pdf_path, parts, result):
+        """
+        PDF-пакет из нескольких рапортов: каждый рапорт структурируется и собирается в свой документ
+        (part_output_path) в отдельном потоке; запросы к Ollama - в общих слотах max_llm_requests.
+        """
+        print(f"{os.path.basename(pdf_path)}: найдено рапортов - {len(parts)}, каждый обрабатывается отдельно.")
+        set_metric("bundle_parts", len(parts))
+        metrics = current_metrics()
+
+        def process_part(number):
+            part_result = {"part": number, "output": part_output_path(result["output"], number),
+                           "status": "error", "error": None}
+            with use_metrics(metrics):
+                try:
+                    entry = (self.journal.load(pdf_path, self.extraction_key, part=number)
+                             if self.journal is not None else None)
+                    self._process_raport(pdf_path, parts[number - 1], entry, part_result, part=number)
+                except Exception as e:
+                    part_result["error"] = str(e) or e.__class__.__name__
+            return part_result
+
+        with ThreadPoolExecutor(max_workers=len(parts)) as part_pool:
+            result["parts"] = list(part_pool.map(process_part, range(1, len(parts) + 1)))
+        failed = [part for part in result["parts"] if part["status"] != "ok"]
+        if failed:
+            result["error"] = "; ".join(f"рапорт {part['part']}: {part['error']}" for part in failed)
+        else:
+            result["status"] = "ok"
+
+    def process(self, pdf_path):
+        """
+        Обрабатывает один PDF. Возвращает
+        {"pdf": ..., "output": ..., "status": "ok" | "error", "error": ..., "resumed": этап журнала или None}.
+        Для PDF-пакета из нескольких рапортов добавляется "parts" - список
+        {"part": номер, "output": ..., "status": ..., "error": ...} по рапортам.
+        """
+        result = {"pdf": pdf_path, "output": output_path_for(pdf_path, self.output_dir), "status": "error",
+                  "error": None, "resumed": None}
+        with document_metrics(pdf_path, self.metrics_sink) as metrics:
+            try:
+                self._process_document(pdf_path, result)
+            except Exception as e:
+                result["error"] = str(e) or e.__class__.__name__
+            if result["status"] != "ok" and self.journal is not None:
+                self.journal.record_error(pdf_path, result["error"])
+            metrics.set("status", result["status"])
+        return result
+
+    def close(self):
+        self._process_pool.shutdown()
+
+
+def run_batch(pdf_paths, output_dir, parser, workers=None, max_llm_requests=1, verify_docx=False,
+              metrics_sink=None, journal=None):
+    """
+    Генерирует планы расследования для набора PDF-рапортов с помощью
+    настроенного RaportParser (модель, кэш и т.д.) через DocumentPipeline (параметры - там же).
+    При переданном journal повторный запуск пакета продолжается с последнего завершенного этапа
+    каждого документа. Возвращает список результатов DocumentPipeline.process по каждому файлу.
+    """
+    pipeline = DocumentPipeline(output_dir, parser, workers=workers, max_llm_requests=max_llm_requests,
+                                verify_docx=verify_docx, metrics_sink=metrics_sink, journal=journal)
+    # Потоков больше, чем слотов LLM, чтобы извлечение следующих PDF шло,
+    # пока модель занята предыдущими документами.
+    try:
+        with ThreadPoolExecutor(max_workers=pipeline.workers + max_llm_requests) as document_pool:
+            return list(document_pool.map(pipeline.process, pdf_paths))
+    finally:
+        pipeline.close()
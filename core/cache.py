@@ -0,0 +1,110 @@
+# core/cache.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+DEFAULT_CACHE_PATH = os.path.join('data', 'cache', 'llm_cache.sqlite3')
+
+# Ограничения по умолчанию: ~5000 документов, 200 МБ, 90 дней
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+DEFAULT_MAX_AGE_DAYS = 90
+
+
+def make_cache_key(raport_text, model_name, prompt_fingerprint):
+    """
+    Ключ кэша: хэш текста рапорта + название модели + отпечаток промпта.
+    Любое изменение промпта или модели автоматически делает старые записи недостижимыми.
+    """
+    digest = hashlib.sha256()
+    for part in (raport_text, model_name, prompt_fingerprint):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    Персистентный кэш результатов извлечения данных LLM в SQLite
+    с вытеснением по возрасту, числу записей и суммарному размеру.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_bytes=DEFAULT_MAX_BYTES, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_days * 24 * 3600
+
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS extractions ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS extractions_last_access ON extractions(last_access)")
+
+    def _connect(self):
+        # Отдельное соединение на каждую операцию: кэш используется из потоков пакетного режима
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key):
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT value, created_at FROM extractions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if now - created_at > self.max_age_seconds:
+                conn.execute("DELETE FROM extractions WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE extractions SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def put(self, key, model_name, case_data):
+        value = json.dumps(case_data, ensure_ascii=False)
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO extractions (key, model, value, size, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, value, len(value.encode('utf-8')), now, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM extractions WHERE created_at < ?", (now - self.max_age_seconds,))
+        # LRU по числу записей
+        conn.execute(
+            "DELETE FROM extractions WHERE key IN ("
+            " SELECT key FROM extractions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        # LRU по суммарному размеру: удаляем всё, что не помещается после самых свежих записей
+        conn.execute(
+            "DELETE FROM extractions WHERE key IN ("
+            " SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY last_access DESC) AS total"
+            " FROM extractions) WHERE total > ?)",
+            (self.max_bytes,),
+        )
+
+    def clear(self):
+        with closing(self._connect()) as conn, conn:
+            removed = conn.execute("DELETE FROM extractions").rowcount
+        with closing(self._connect()) as conn:
+            conn.execute("VACUUM")
+        return removed
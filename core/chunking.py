@@ -0,0 +1,110 @@
+# core/chunking.py
+
+# Map-reduce извлечение для рапортов, не помещающихся в контекст модели:
+# текст режется на перекрывающиеся фрагменты по границам страниц, каждый фрагмент
+# структурируется отдельно, а частичные результаты сливаются по правилам для каждого поля.
+
+NOT_AVAILABLE = "Н/Д"
+
+# Правила слияния частичных результатов:
+#   "first"   - первое найденное значение (номера и даты из шапки рапорта),
+#   "longest" - самое полное описание,
+#   "union"   - объединение уникальных значений из всех фрагментов.
+MERGE_RULES = {
+    "рапорт_дата": "first",
+    "фио_следователя": "first",
+    "должность_следователя": "longest",
+    "дата_обнаружения": "first",
+    "источник_сведений": "first",
+    "суть_правонарушения": "longest",
+    "статья_ук_рк": "first",
+    "номер_ердр": "first",
+    "дата_регистрации_ердр": "first",
+    "место_правонарушения": "first",
+    "тип_правонарушения": "first",
+    "фигуранты": "union",
+    "дополнительные_сведения": "union",
+}
+
+
+def _split_long_page(page_text, max_chars, overlap_chars):
+    """Делит страницу, которая сама не помещается во фрагмент, по строкам с перекрытием."""
+    pieces = []
+    start = 0
+    while start < len(page_text):
+        end = min(start + max_chars, len(page_text))
+        if end < len(page_text):
+            # Стараемся резать по переводу строки, а не посреди слова
+            newline = page_text.rfind("\n", start + max_chars // 2, end)
+            if newline != -1:
+                end = newline + 1
+        pieces.append(page_text[start:end])
+        if end >= len(page_text):
+            break
+        start = max(end - overlap_chars, start + 1)
+    return pieces
+
+
+def split_pages_into_chunks(pages, max_chars, overlap_chars=None):
+    """
+    Собирает страницы во фрагменты не длиннее max_chars символов, разрезая только
+    по границам страниц (слишком длинные страницы делятся по строкам).
+    Каждый следующий фрагмент начинается с хвоста последней страницы предыдущего
+    (overlap_chars символов, по умолчанию 10% фрагмента), чтобы сведения на стыке не терялись.
+    """
+    if overlap_chars is None:
+        overlap_chars = max_chars // 10
+
+    units = []
+    for page_text in pages:
+        if len(page_text) > max_chars:
+            units.extend(_split_long_page(page_text, max_chars, overlap_chars))
+        elif page_text:
+            units.append(page_text)
+
+    chunks = []
+    current = []
+    current_len = 0
+    for unit in units:
+        if current and current_len + len(unit) > max_chars:
+            chunks.append("\n".join(current))
+            overlap = current[-1][-overlap_chars:] if overlap_chars else ""
+            overlap = overlap[:max(max_chars - len(unit), 0)]
+            current = [overlap] if overlap else []
+            current_len = len(overlap)
+        current.append(unit)
+        current_len += len(unit)
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def merge_partial_case_data(partials, fields):
+    """
+    Сливает частичные case_data (в порядке фрагментов) по MERGE_RULES.
+    Значения "Н/Д" считаются отсутствующими; если поле не найдено ни в одном фрагменте - "Н/Д".
+    """
+    merged = {}
+    for field in fields:
+        values = []
+        for partial in partials:
+            value = (partial.get(field) or "").strip()
+            if value and value != NOT_AVAILABLE:
+                values.append(value)
+
+        if not values:
+            merged[field] = NOT_AVAILABLE
+            continue
+
+        rule = MERGE_RULES.get(field, "first")
+        if rule == "longest":
+            merged[field] = max(values, key=len)
+        elif rule == "union":
+            unique_values = []
+            for value in values:
+                if value not in unique_values:
+                    unique_values.append(value)
+            merged[field] = "; ".join(unique_values)
+        else:
+            merged[field] = values[0]
+    return merged
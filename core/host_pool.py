@@ -0,0 +1,296 @@
+# core/host_pool.py
+
+import asyncio
+import collections
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import httpx
+import ollama
+
+# Ошибки, после которых запрос переотправляется на другой экземпляр Ollama.
+# 404 тоже: на этом экземпляре может быть не загружена нужная модель.
+FAILOVER_STATUS_CODES = {404, 429, 500, 502, 503, 504}
+
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+
+
+# Событие отмены синхронного запроса, выполняемого в потоке пула: проигравший дублирующий запрос
+# проверяет его между фрагментами потокового ответа (request_cancelled) и закрывает соединение.
+_cancel_event = contextvars.ContextVar("ollama_request_cancel_event", default=None)
+
+
+class RequestCancelledError(Exception):
+    """Запрос отменен пулом: ответ уже получен от другого экземпляра."""
+
+
+def request_cancelled():
+    """Отменен ли запрос, выполняемый в текущем потоке (см. OllamaHostPool.call)."""
+    event = _cancel_event.get()
+    return event is not None and event.is_set()
+
+
+def is_failover_error(error):
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code in FAILOVER_STATUS_CODES
+    return isinstance(error, (httpx.TransportError, ConnectionError))
+
+
+class NoHealthyHostsError(ConnectionError):
+    """Ни один экземпляр Ollama из пула не доступен."""
+
+
+class OllamaHost:
+    def __init__(self, url, health_check_timeout=5.0):
+        self.url = url
+        self.client = ollama.Client(host=url)
+        self.health_client = ollama.Client(host=url, timeout=health_check_timeout)
+        self.async_client = None  # создается в цикле событий асинхронного клиента
+        self.outstanding = 0
+        self.healthy = True
+        self.retry_at = 0.0
+        self.failures = 0
+
+    def is_available(self, now):
+        return self.healthy or now >= self.retry_at
+
+    def __repr__(self):
+        return f"OllamaHost({self.url}, outstanding={self.outstanding}, healthy={self.healthy})"
+
+
+class OllamaHostPool:
+    """
+    Пул экземпляров Ollama с балансировкой по наименьшему числу незавершенных запросов.
+
+    Экземпляр, вернувший сетевую ошибку или 404/429/5xx, помечается недоступным на failure_cooldown
+    секунд, а запрос сразу переотправляется на следующий. Фоновая проверка здоровья
+    (start_health_checks) возвращает экземпляры в работу. Если задан hedge_percentile
+    (например, 0.95), запрос, который выполняется дольше этого перцентиля последних задержек,
+    дублируется на другой экземпляр (не на тот, что уже выполняет запрос), и берется первый ответ.
+    Проигравший запрос отменяется: асинхронный - сразу, синхронный потоковый - на следующем
+    фрагменте ответа (request_cancelled); синхронный без потока дорабатывает впустую.
+    """
+
+    def __init__(self, urls, failure_cooldown=30.0, hedge_percentile=None, health_check_timeout=5.0):
+        if not urls:
+            raise ValueError("Пул Ollama должен содержать хотя бы один адрес.")
+        self.hosts = [OllamaHost(url, health_check_timeout) for url in urls]
+        self.failure_cooldown = failure_cooldown
+        self.hedge_percentile = hedge_percentile
+        self.health_check_timeout = health_check_timeout
+        self._latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self._health_thread = None
+        self._stop_health_checks = threading.Event()
+        self._hedge_executor = None
+
+    # --- Выбор экземпляра и учет запросов ---
+
+    def _acquire(self, exclude=()):
+        with self._lock:
+            now = time.monotonic()
+            candidates = [host for host in self.hosts if host not in exclude and host.is_available(now)]
+            if not candidates:
+                return None
+            host = min(candidates, key=lambda candidate: candidate.outstanding)
+            host.outstanding += 1
+            return host
+
+    def _release(self, host, error=None, latency=None):
+        with self._lock:
+            host.outstanding -= 1
+            if error is None:
+                host.healthy = True
+                host.failures = 0
+                if latency is not None:
+                    self._latencies.append(latency)
+            elif is_failover_error(error):
+                host.healthy = False
+                host.failures += 1
+                host.retry_at = time.monotonic() + self.failure_cooldown
+                print(f"Экземпляр Ollama {host.url} недоступен ({error}), запросы переводятся на другие.")
+
+    def hedge_delay(self):
+        """Задержка, после которой запрос дублируется, или None (хеджирование выключено/мало данных)."""
+        if not self.hedge_percentile or len(self.hosts) < 2:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        return samples[min(int(len(samples) * self.hedge_percentile), len(samples) - 1)]
+
+    # --- Синхронные вызовы ---
+
+    def _call_on_host(self, host, request):
+        started = time.monotonic()
+        try:
+            result = request(host.client)
+        except Exception as e:
+            self._release(host, error=e)
+            raise
+        self._release(host, latency=time.monotonic() - started)
+        return result
+
+    def _call_with_failover(self, request, tried=None, cancel_event=None):
+        """
+        tried - экземпляры, которые этот запрос уже получили (дополняется по ходу переотправки);
+        cancel_event - событие отмены запроса для request_cancelled.
+        """
+        tried = [] if tried is None else tried
+        if cancel_event is not None:
+            # Поток исполнителя переиспользуется: событие задается заново для каждой задачи
+            _cancel_event.set(cancel_event)
+        last_error = None
+        while True:
+            host = self._acquire(exclude=tried)
+            if host is None:
+                raise last_error or NoHealthyHostsError("Нет доступных экземпляров Ollama в пуле.")
+            tried.append(host)
+            try:
+                return self._call_on_host(host, request)
+            except Exception as e:
+                if not is_failover_error(e):
+                    raise
+                last_error = e
+
+    def call(self, request):
+        """
+        Выполняет request(client) на наименее загруженном экземпляре
+        с переотправкой на другие при сбое и, при необходимости, с дублированием.
+        """
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._call_with_failover(request)
+
+        if self._hedge_executor is None:
+            with self._lock:
+                if self._hedge_executor is None:
+                    self._hedge_executor = ThreadPoolExecutor(thread_name_prefix="ollama-hedge")
+        primary_hosts, primary_cancel = [], threading.Event()
+        primary = self._hedge_executor.submit(self._call_with_failover, request, primary_hosts, primary_cancel)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        # Дубль уходит на другой экземпляр: тот же экземпляр ответил бы не быстрее
+        hedge_cancel = threading.Event()
+        hedge = self._hedge_executor.submit(self._call_with_failover, request, list(primary_hosts), hedge_cancel)
+        events = {primary: primary_cancel, hedge: hedge_cancel}
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None or not pending:
+                    for other in pending:
+                        events[other].set()
+                        other.cancel()
+                    return future.result()
+
+    # --- Асинхронные вызовы ---
+
+    async def _acall_on_host(self, host, request):
+        if host.async_client is None:
+            host.async_client = ollama.AsyncClient(host=host.url)
+        started = time.monotonic()
+        try:
+            result = await request(host.async_client)
+        except BaseException as e:
+            # BaseException: отмена проигравшего дублирующего запроса тоже должна освободить экземпляр
+            self._release(host, error=e)
+            raise
+        self._release(host, latency=time.monotonic() - started)
+        return result
+
+    async def _acall_with_failover(self, request, tried=None):
+        tried = [] if tried is None else tried
+        last_error = None
+        while True:
+            host = self._acquire(exclude=tried)
+            if host is None:
+                raise last_error or NoHealthyHostsError("Нет доступных экземпляров Ollama в пуле.")
+            tried.append(host)
+            try:
+                return await self._acall_on_host(host, request)
+            except Exception as e:
+                if not is_failover_error(e):
+                    raise
+                last_error = e
+
+    async def acall(self, request):
+        """Асинхронный аналог call: request(async_client) - корутинная функция."""
+        delay = self.hedge_delay()
+        primary_hosts = []
+        primary = asyncio.ensure_future(self._acall_with_failover(request, primary_hosts))
+        if delay is None:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        hedge = asyncio.ensure_future(self._acall_with_failover(request, list(primary_hosts)))
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None or not pending:
+                    for other in pending:
+                        other.cancel()
+                    return task.result()
+
+    async def aclose(self):
+        for host in self.hosts:
+            if host.async_client is not None:
+                await host.async_client.close()
+                host.async_client = None
+
+    # --- Проверка здоровья ---
+
+    def check_health(self):
+        """Опрашивает все экземпляры (GET /api/tags) и обновляет их доступность."""
+        for host in self.hosts:
+            try:
+                host.health_client.list()
+                healthy = True
+            except Exception:
+                healthy = False
+            with self._lock:
+                if healthy and not host.healthy:
+                    print(f"Экземпляр Ollama {host.url} снова доступен.")
+                host.healthy = healthy
+                if not healthy:
+                    host.retry_at = time.monotonic() + self.failure_cooldown
+
+    def start_health_checks(self, interval=15.0):
+        """
+        Запускает фоновую проверку здоровья раз в interval секунд. Первая проверка тоже идет в фоне:
+        недоступный экземпляр не задерживает запуск, а до проверки считается доступным
+        (первый неудачный запрос к нему сразу переводит запросы на другие).
+        """
+        if self._health_thread is not None:
+            return self._health_thread
+
+        def loop():
+            while True:
+                self.check_health()
+                if self._stop_health_checks.wait(interval):
+                    return
+
+        self._health_thread = threading.Thread(target=loop, name="ollama-health-checks", daemon=True)
+        self._health_thread.start()
+        return self._health_thread
+
+    def stop_health_checks(self):
+        self._stop_health_checks.set()
+
+    def close(self):
+        """Останавливает проверку здоровья и потоки дублирующих запросов (незавершенные дубли отменяются)."""
+        self.stop_health_checks()
+        with self._lock:
+            executor, self._hedge_executor = self._hedge_executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,152 @@
+# core/journal.py
+
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+# Журнал пакетной обработки (SQLite в режиме WAL) хранит для каждого PDF последний завершенный
+# этап и его результат, поэтому перезапущенный пакет продолжает с того места, где остановился:
+#   extracted  - текст страниц (повторно не читается PDF),
+#   structured - case_data (повторно не вызывается LLM; текст страниц больше не нужен и удаляется),
+#   planned    - план расследования,
+#   rendered   - документ сохранен.
+# Каждый этап фиксируется отдельной транзакцией сразу по завершении: падение процесса
+# или перезапуск Ollama теряют не больше одного незавершенного этапа на документ.
+#
+# Рапорты PDF-пакета (core/parser.py, split_raport_bundle) ведутся отдельными записями "<pdf>::<номер>":
+# запись самого PDF остается на этапе extracted с текстом всех страниц.
+#
+# Запись сбрасывается, если PDF изменился (размер или время изменения); case_data - если сменились
+# модель, промпт или настройки извлечения (RaportParser.extraction_key); план и документ - если
+# изменились входные данные сборки (inputs_hash, см. core/sidecar.py).
+
+JOURNAL_NAME = "batch_journal.sqlite3"
+STAGES = ("extracted", "structured", "planned", "rendered")
+_JSON_COLUMNS = ("pages", "case_data", "plan")
+
+
+def journal_path_for(output_dir):
+    return os.path.join(output_dir, JOURNAL_NAME)
+
+
+def _document_key(pdf_path, part):
+    return pdf_path if part is None else f"{pdf_path}::{part}"
+
+
+def _pdf_fingerprint(pdf_path):
+    try:
+        stat = os.stat(pdf_path)
+    except OSError:
+        return "missing"
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class BatchJournal:
+    """Журнал этапов пакетной обработки; безопасен для вызова из потоков пакетного режима."""
+
+    def __init__(self, path):
+        self.path = path
+        journal_dir = os.path.dirname(path)
+        if journal_dir:
+            os.makedirs(journal_dir, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " pdf TEXT PRIMARY KEY,"
+                " pdf_fingerprint TEXT NOT NULL,"
+                " stage TEXT,"
+                " pages TEXT,"
+                " case_data TEXT,"
+                " extraction_key TEXT,"
+                " plan TEXT,"
+                " inputs_hash TEXT,"
+                " output TEXT,"
+                " error TEXT,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " updated_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        # Как и в ExtractionCache: отдельное соединение на операцию. synchronous=NORMAL в режиме WAL
+        # не теряет зафиксированные транзакции при падении процесса (только при отключении питания).
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def load(self, pdf_path, extraction_key, part=None):
+        """
+        Сохраненное состояние документа (part - номер рапорта PDF-пакета):
+        {"stage", "pages", "case_data", "plan", "inputs_hash", "output"} (отсутствующие результаты - None)
+        или None, если документ еще не обрабатывался или PDF изменился.
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT pdf_fingerprint, stage, pages, case_data, extraction_key, plan, inputs_hash, output"
+                " FROM documents WHERE pdf = ?", (_document_key(pdf_path, part),)
+            ).fetchone()
+        if row is None or row[0] != _pdf_fingerprint(pdf_path) or row[1] is None:
+            return None
+        _, stage, pages, case_data, stored_key, plan, inputs_hash, output = row
+        entry = {"stage": stage, "pages": pages and json.loads(pages), "case_data": None, "plan": None,
+                 "inputs_hash": None, "output": output}
+        if stored_key != extraction_key:
+            # case_data получены другой моделью или промптом: от журнала остается только текст страниц
+            entry["stage"] = "extracted" if entry["pages"] is not None else None
+            return entry if entry["stage"] else None
+        entry["case_data"] = case_data and json.loads(case_data)
+        entry["plan"] = plan and json.loads(plan)
+        entry["inputs_hash"] = inputs_hash
+        return entry
+
+    def record(self, pdf_path, stage, part=None, **values):
+        """
+        Фиксирует завершение этапа с его результатами (pages, case_data, extraction_key, plan,
+        inputs_hash, output). Ошибка предыдущей попытки очищается.
+        """
+        if stage not in STAGES:
+            raise ValueError(f"Неизвестный этап журнала: {stage}")
+        if stage == "extracted":
+            # Новое извлечение текста - прежние результаты документа недействительны
+            values = {"case_data": None, "extraction_key": None, "plan": None, "inputs_hash": None, **values}
+        elif stage == "structured":
+            values = {"pages": None, "plan": None, "inputs_hash": None, **values}
+        columns = {name: json.dumps(value, ensure_ascii=False) if name in _JSON_COLUMNS and value is not None
+                   else value for name, value in values.items()}
+        columns.update(stage=stage, error=None)
+        self._upsert(pdf_path, columns, part)
+
+    def record_error(self, pdf_path, error):
+        """Сохраняет ошибку документа; достигнутый этап и его результаты не меняются."""
+        with closing(self._connect()) as conn, conn:
+            updated = conn.execute(
+                "UPDATE documents SET error = ?, attempts = attempts + 1, updated_at = ? WHERE pdf = ?",
+                (error, time.time(), pdf_path),
+            ).rowcount
+        if not updated:
+            self._upsert(pdf_path, {"stage": None, "error": error, "attempts": 1})
+
+    def _upsert(self, pdf_path, columns, part=None):
+        key = _document_key(pdf_path, part)
+        columns = {**columns, "pdf_fingerprint": _pdf_fingerprint(pdf_path), "updated_at": time.time()}
+        names = ", ".join(columns)
+        placeholders = ", ".join("?" for _ in columns)
+        updates = ", ".join(f"{name} = excluded.{name}" for name in columns)
+        with closing(self._connect()) as conn, conn:
+            # Смена отпечатка PDF сбрасывает всю запись документа
+            conn.execute("DELETE FROM documents WHERE pdf = ? AND pdf_fingerprint != ?",
+                         (key, columns["pdf_fingerprint"]))
+            conn.execute(
+                f"INSERT INTO documents (pdf, {names}) VALUES (?, {placeholders})"
+                f" ON CONFLICT(pdf) DO UPDATE SET {updates}",
+                (key, *columns.values()),
+            )
+
+    def clear(self):
+        with closing(self._connect()) as conn, conn:
+            removed = conn.execute("DELETE FROM documents").rowcount
+        with closing(self._connect()) as conn:
+            conn.execute("VACUUM")
+        return removed
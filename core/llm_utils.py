@@ -1,31 +1,37 @@
 # core/llm_utils.py
 
 import ollama
+import hashlib
 import json
 import re
+import threading
+import time
 
-class OllamaClient:
-    def __init__(self, model_name="llama3"):
-        self.model = model_name
+from core.cache import make_cache_key
+from core.host_pool import RequestCancelledError, request_cancelled
+from core.metrics import add_metric, record_llm_response
+from core.plan_generator import extract_main_uk_article
+from core.token_budget import plan_request_budget
 
-    def _get_extraction_prompt(self, raport_text):
-        """
-        Генерирует промпт для извлечения структурированных данных из текста рапорта.
-        """
-        prompt = f"""
-Ты - очень точный и надежный специализированный ИИ-помощник для анализа юридических документов.
-Твоя задача - извлечь ВСЮ ключевую информацию из следующего "Рапорта об обнаружении сведений об уголовном правонарушении" и представить ее в ФОРМАТЕ JSON.
-Если какое-либо поле отсутствует в тексте, используй значение "Н/Д".
-Пожалуйста, будь точным и извлекай данные как есть, без домысливания.
-Твой ответ ДОЛЖЕН БЫТЬ ТОЛЬКО ЧИСТЫМ JSON-ОБЪЕКТОМ, без какого-либо дополнительного текста (таких как "Here is the JSON:", "```json", "```"), объяснений или форматирования.
-ОБЯЗАТЕЛЬНО УБЕДИСЬ, ЧТО JSON-ОБЪЕКТ НАЧИНАЕТСЯ С '{{' И ЗАВЕРШАЕТСЯ НА '}}' И ЯВЛЯЕТСЯ ВАЛИДНЫМ.
+# Контекст, с которым модель загружается при прогреве. Совпадает со ступенью, в которую
+# укладывается типичный рапорт, чтобы первый настоящий запрос не вызвал перезагрузку модели.
+WARM_UP_NUM_CTX = 4096
 
-ТЕКСТ РАПОРТА:
 
-{raport_text}
+def parse_keep_alive(value):
+    """
+    Приводит keep_alive из CLI/.env к виду, который принимает Ollama:
+    число секунд ("-1" - держать модель постоянно, "0" - выгружать сразу) или длительность ("30m", "2h").
+    """
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
 
-ТРЕБУЕМЫЕ ПОЛЯ JSON (названия полей использовать СТРОГО как указано, порядок не важен):
-{{
+# Поля, извлекаемые из рапорта, и их описания для модели (порядок сохраняется в промпте и схеме)
+EXTRACTION_FIELDS = {
     "рапорт_дата": "Дата рапорта (пример: 5 октября 2023 г.)",
     "фио_следователя": "Полное ФИО следователя (пример: Сарсенбаев М.Р.)",
     "должность_следователя": "Полная должность следователя (пример: Следователь по ОВД 2-го Следственного управления Департамента экономических расследований по г. Астана Агентства по финансовому мониторингу РК)",
@@ -39,59 +45,540 @@ class OllamaClient:
     "тип_правонарушения": "финансовая пирамида",
     "фигуранты": "Краткое описание фигурантов (пример: руководство компании «Е»)",
     "дополнительные_сведения": "Любые другие важные сведения из рапорта (пример: Прилагаю подтверждающие документы об уголовном правонарушении.)"
-}}
-Отвечай ТОЛЬКО JSON-объектом. Ничего лишнего не добавляй.
-"""
-        return prompt
+}
+
+# Версия раскладки промпта извлечения; входит в отпечаток промпта, поэтому ее смена
+# инвалидирует закэшированные ответы. 2 - неизменное системное сообщение + текст рапорта.
+PROMPT_VERSION = 2
+
+
+def _build_system_prompt():
+    fields_block = json.dumps(EXTRACTION_FIELDS, ensure_ascii=False, indent=4)
+    return f"""Ты - очень точный и надежный специализированный ИИ-помощник для анализа юридических документов.
+Твоя задача - извлечь информацию из "Рапорта об обнаружении сведений об уголовном правонарушении", который передаст пользователь, и представить ее в ФОРМАТЕ JSON.
+Если какое-либо поле отсутствует в тексте, используй значение "Н/Д".
+Пожалуйста, будь точным и извлекай данные как есть, без домысливания.
+Твой ответ ДОЛЖЕН БЫТЬ ТОЛЬКО ЧИСТЫМ JSON-ОБЪЕКТОМ, без какого-либо дополнительного текста (таких как "Here is the JSON:", "```json", "```"), объяснений или форматирования.
+
+ПОЛЯ JSON (названия полей использовать СТРОГО как указано, порядок не важен, значения - строки):
+{fields_block}
+Если пользователь перечислил поля, верни ТОЛЬКО их. Отвечай ТОЛЬКО JSON-объектом. Ничего лишнего не добавляй."""
+
+
+# Системное сообщение не зависит ни от рапорта, ни от набора запрашиваемых полей и совпадает
+# байт в байт во всех запросах: Ollama переиспользует вычисленный KV-кэш этого префикса
+# между последовательными запросами к той же модели (пока не сменился num_ctx и модель не выгружена)
+# и обрабатывает только сообщение с текстом рапорта.
+EXTRACTION_SYSTEM_PROMPT = _build_system_prompt()
+
+
+def build_case_data_schema(fields=None):
+    """
+    JSON-схема ответа для structured output Ollama (параметр format).
+    Все поля - обязательные строки, лишние поля запрещены.
+    """
+    fields = list(fields or EXTRACTION_FIELDS)
+    return {
+        "type": "object",
+        "properties": {field: {"type": "string"} for field in fields},
+        "required": fields,
+        "additionalProperties": False,
+    }
+
+
+def validate_case_data(case_data, fields=None):
+    """
+    Быстрая проверка ответа модели по схеме. Приводит к строке числа и списки строк
+    (например, номер ЕРДР, возвращенный числом), отбрасывает лишние поля и возвращает
+    список полей, которые отсутствуют или не удалось привести к непустой строке.
+    """
+    fields = fields or EXTRACTION_FIELDS
+    for key in [key for key in case_data if key not in EXTRACTION_FIELDS]:
+        del case_data[key]
+
+    failing = []
+    for field in fields:
+        value = case_data.get(field)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        elif isinstance(value, list) and all(isinstance(item, str) for item in value):
+            value = "; ".join(value)
+
+        if isinstance(value, str) and value.strip():
+            case_data[field] = value.strip()
+        else:
+            case_data.pop(field, None)
+            failing.append(field)
+    return failing
+
+
+# Каскад моделей: ответ черновой (малой) модели проверяется, и основной модели передаются
+# только поля, не прошедшие проверку. Без этих полей план не строится, поэтому "Н/Д"
+# в ответе по всему рапорту считается ошибкой черновой модели (во фрагменте длинного
+# рапорта поле может законно отсутствовать - там проверяется только формат).
+CASCADE_REQUIRED_FIELDS = ("статья_ук_рк", "номер_ердр", "тип_правонарушения", "суть_правонарушения")
+_ERDR_NUMBER_RE = re.compile(r"\d{15}")
+
+
+def check_draft_fields(case_data, fields, fragment=False):
+    """
+    Проверка ответа черновой модели поверх validate_case_data: обязательные поля заполнены,
+    номер ЕРДР - 15 цифр, из статьи УК РК выделяется номер (extract_main_uk_article).
+    Возвращает список полей, которые нужно запросить у основной модели.
+    """
+    failing = []
+    for field in fields:
+        value = case_data.get(field)
+        if value is None:
+            failing.append(field)
+        elif value == "Н/Д":
+            if field in CASCADE_REQUIRED_FIELDS and not fragment:
+                failing.append(field)
+        elif field == "номер_ердр" and not _ERDR_NUMBER_RE.fullmatch(value.replace(" ", "")):
+            failing.append(field)
+        elif field == "статья_ук_рк" and extract_main_uk_article(value) is None:
+            failing.append(field)
+    return failing
+
+
+class OllamaClient:
+    def __init__(self, model_name="llama3", cache=None, stream=False, max_field_retries=1,
+                 max_num_ctx=16384, adaptive_ctx=True, keep_alive=None, host=None, host_pool=None,
+                 draft_model=None):
+        self.model = model_name
+        # Черновая модель каскада (например, квантованная 3B); None - только основная модель
+        self.draft_model = draft_model if draft_model and draft_model != model_name else None
+        self.host = host
+        # host=None - адрес из OLLAMA_HOST или localhost:11434, как у модульного ollama.chat
+        self._client = ollama.Client(host=host)
+        # Пул экземпляров Ollama (core.host_pool); если задан, host не используется
+        self.host_pool = host_pool
+        self.keep_alive = parse_keep_alive(keep_alive)
+        self.cache = cache
+        self.stream = stream
+        self.max_field_retries = max_field_retries
+        self.max_num_ctx = max_num_ctx
+        self.adaptive_ctx = adaptive_ctx
+        self._prompt_fingerprint = None
+        # num_ctx, с которым загружена каждая модель: смена контекста перезагружает модель в Ollama
+        self._current_num_ctx = {}
+
+    @property
+    def models(self):
+        """Модели в порядке обращения: черновая (если задана), затем основная."""
+        return (self.draft_model, self.model) if self.draft_model else (self.model,)
+
+    @property
+    def model_label(self):
+        """Имя модели для кэша и case_data: "черновая>основная" при каскаде."""
+        return ">".join(self.models)
+
+    def start_warm_up(self):
+        """
+        Асинхронно загружает модель в память Ollama (пустой запрос generate) и возвращает поток.
+        Загрузка идет параллельно с разбором PDF; ошибки прогрева не критичны -
+        модель в худшем случае загрузится при первом настоящем запросе.
+        """
+        thread = threading.Thread(target=self._warm_up, name=f"ollama-warm-up-{self.model_label}", daemon=True)
+        thread.start()
+        return thread
+
+    def _warm_up(self):
+        options = None
+        if self.adaptive_ctx:
+            options = {"num_ctx": min(WARM_UP_NUM_CTX, self.max_num_ctx)}
+        # При каскаде первой загружается черновая модель - к ней уйдет первый запрос.
+        for model in self.models:
+            if options:
+                self._current_num_ctx[model] = options["num_ctx"]
+            self._load_model(model, options)
+
+    def keep_warm(self):
+        """
+        Продлевает keep_alive моделей в простое (режим наблюдения) без смены контекста: передается
+        num_ctx, с которым модель уже загружена этим клиентом. Другой num_ctx (как у прогрева)
+        заставил бы Ollama перезагрузить модель и потерять кэш префикса системного сообщения.
+        """
+        for model in self.models:
+            num_ctx = self._current_num_ctx.get(model)
+            self._load_model(model, {"num_ctx": num_ctx} if self.adaptive_ctx and num_ctx else None)
+
+    def _load_model(self, model, options):
+        """Пустой запрос generate: загружает модель или продлевает ее keep_alive."""
+        # В пуле - на всех экземплярах: запросы будут распределяться по каждому из них
+        clients = [host.client for host in self.host_pool.hosts] if self.host_pool else [self._client]
+        for client in clients:
+            try:
+                client.generate(model=model, prompt="", options=options, keep_alive=self.keep_alive)
+            except Exception as e:
+                print(f"Прогрев модели Ollama {model} не удался: {e}")
+
+    def close(self):
+        """Освобождает пул экземпляров Ollama (потоки проверки здоровья и дублирующих запросов)."""
+        if self.host_pool is not None:
+            self.host_pool.close()
+
+    def _call(self, request):
+        """Выполняет request(client) на своем клиенте или через пул экземпляров Ollama."""
+        if self.host_pool is not None:
+            return self.host_pool.call(request)
+        return request(self._client)
+
+    def request_budget(self, raport_text, fields=None, model=None):
+        """
+        Оценка токенов и параметры num_ctx/num_predict для запроса по этому тексту.
+        Используется и для самого запроса, и RaportParser - чтобы заранее перейти
+        к обработке по фрагментам, если рапорт не помещается в max_num_ctx.
+        """
+        prompt = self._get_extraction_prompt(raport_text, fields)
+        return plan_request_budget(prompt, list(fields or EXTRACTION_FIELDS), self.max_num_ctx,
+                                   current_num_ctx=self._current_num_ctx.get(model or self.model))
+
+    def _request_options(self, raport_text, fields, model):
+        if not self.adaptive_ctx:
+            return None
+        budget = self.request_budget(raport_text, fields, model)
+        if not budget["fits"]:
+            print(f"Внимание: промпт (~{budget['prompt_tokens']} токенов) с ответом не помещается "
+                  f"в контекст {self.max_num_ctx}. Используется максимальный контекст, "
+                  f"Ollama может обрезать начало текста.")
+        self._current_num_ctx[model] = budget["num_ctx"]
+        return {"num_ctx": budget["num_ctx"], "num_predict": budget["num_predict"]}
+
+    def prompt_fingerprint(self):
+        """
+        Отпечаток версии и шаблона промпта и схемы извлечения: меняется при любой правке
+        EXTRACTION_SYSTEM_PROMPT, _get_extraction_messages или EXTRACTION_FIELDS,
+        что автоматически инвалидирует закэшированные ответы.
+        """
+        if self._prompt_fingerprint is None:
+            template = f"v{PROMPT_VERSION}\n" + self._get_extraction_prompt("{raport_text}")
+            schema = json.dumps(build_case_data_schema(), ensure_ascii=False, sort_keys=True)
+            self._prompt_fingerprint = hashlib.sha256((template + schema).encode('utf-8')).hexdigest()
+        return self._prompt_fingerprint
+
+    def _get_extraction_messages(self, raport_text, fields=None):
+        """
+        Сообщения запроса извлечения: неизменное системное сообщение (инструкции и описания
+        всех полей), затем текст рапорта и, если передан fields, перечень полей для ответа.
+        Перечень стоит после текста: повторный запрос полей по тому же тексту
+        переиспользует кэш префикса вместе с самим рапортом.
+        """
+        fields = list(fields or EXTRACTION_FIELDS)
+        if len(fields) == len(EXTRACTION_FIELDS):
+            task = "Извлеки все поля."
+        else:
+            task = f"Извлеки ТОЛЬКО поля: {', '.join(fields)}."
+        return [
+            {'role': 'system', 'content': EXTRACTION_SYSTEM_PROMPT},
+            {'role': 'user', 'content': f"ТЕКСТ РАПОРТА:\n\n{raport_text}\n\n{task}"},
+        ]
 
-    def extract_case_data(self, raport_text):
+    def _get_extraction_prompt(self, raport_text, fields=None):
+        """Полный текст промпта (все сообщения подряд) - для оценки токенов и отпечатка."""
+        return "\n\n".join(message['content'] for message in self._get_extraction_messages(raport_text, fields))
+
+    def _cache_key(self, raport_text, fields):
+        if self.cache is None:
+            return None
+        fingerprint = self.prompt_fingerprint()
+        if fields:
+            fingerprint += "|" + ",".join(fields)
+        return make_cache_key(raport_text, self.model_label, fingerprint)
+
+    def extract_case_data(self, raport_text, fields=None, fragment=False):
+        """
+        Отправляет запрос в Ollama для извлечения данных из текста рапорта
+        (всех полей или только перечисленных в fields). fragment=True - текст является
+        фрагментом длинного рапорта (см. check_draft_fields).
+        Если подключен кэш, повторный запрос для того же текста, модели и промпта не выполняется.
+        """
+        cache_key = self._cache_key(raport_text, fields)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print("Данные рапорта взяты из кэша LLM.")
+                add_metric("llm_cache_hits")
+                return cached
+
+        case_data = self.extract_fields(raport_text, fields, fragment)
+        if case_data is not None and cache_key is not None:
+            self.cache.put(cache_key, self.model_label, case_data)
+        return case_data
+
+    def extract_fields(self, raport_text, fields=None, fragment=False):
         """
-        Отправляет запрос в Ollama для извлечения данных из текста рапорта.
+        Извлекает поля по JSON-схеме и проверяет ответ. Повторно запрашиваются
+        только поля, не прошедшие проверку, а не весь документ.
+        При каскаде сначала отвечает черновая модель, а основной модели передаются
+        только поля, не прошедшие check_draft_fields (или весь рапорт, если черновой ответ не получен).
+        Поля, так и не полученные после повторов, заполняются "Н/Д".
         """
-        prompt = self._get_extraction_prompt(raport_text)
+        flow = self._extraction_flow(fields, fragment)
+        response = None
         try:
-            response = ollama.chat(model=self.model, messages=[
-                {'role': 'user', 'content': prompt},
-            ])
-            
-            content = response['message']['content']
-            
-            # 1. Удаляем Markdown-блоки, если они есть
-            if content.startswith("```json") and content.endswith("```"):
-                content = content[7:-3].strip()
-            elif content.startswith("```") and content.endswith("```"):
-                content = content[3:-3].strip()
-            
-            cleaned_content = content.strip()
-
-            # 2. Ищем первый '{' и последний '}'
-            start_brace = cleaned_content.find('{')
-            end_brace = cleaned_content.rfind('}')
-
-            if start_brace != -1 and end_brace != -1 and end_brace > start_brace:
-                # Берем только содержимое между ними, включая сами скобки
-                json_string_candidate = cleaned_content[start_brace : end_brace + 1]
-            else:
-                # Если не нашли четкие скобки, это проблема.
-                print("Внимание: Не удалось найти полный JSON-блок в ответе LLM. Попытка восстановления.")
-                # Попытка восстановить JSON: если он оборван в конце
-                if cleaned_content.startswith('{') and not cleaned_content.endswith('}'):
-                    json_string_candidate = cleaned_content + '}'
-                else:
-                    json_string_candidate = cleaned_content # Оставляем как есть, пусть json.loads выдаст ошибку
-
-            case_data = json.loads(json_string_candidate)
-            return case_data
-        except ollama.ResponseError as e:
-            print(f"Ошибка Ollama API: {e}")
-            print(f"Убедитесь, что Ollama запущен и модель {self.model} доступна.")
+            while True:
+                request_fields, model = flow.send(response)
+                response = self._request_case_data(raport_text, request_fields, model)
+        except StopIteration as done:
+            return done.value
+
+    def _extraction_flow(self, fields, fragment):
+        """
+        Порядок запросов extract_fields без самих запросов: генератор выдает (поля, модель),
+        получает через send ответ модели (dict или None) и возвращает итоговый case_data.
+        Общий для синхронного extract_fields и AsyncOllamaClient.extract_fields_async -
+        клиенты отличаются только тем, как выполняют запрос.
+        """
+        fields = list(fields or EXTRACTION_FIELDS)
+        case_data, failing = None, None
+        if self.draft_model:
+            draft = yield fields, self.draft_model
+            case_data, failing = self._review_draft(draft, fields, fragment)
+        if case_data is None:
+            case_data = yield fields, self.model
+            if case_data is None:
+                # Ошибка запроса или невалидный JSON - повтор по полям здесь не поможет
+                return None
+            failing = validate_case_data(case_data, fields)
+        elif failing:
+            escalated = (yield failing, self.model) or {}
+            failing = self._merge_retried_fields(case_data, escalated, failing, fields)
+
+        attempt = 0
+        while failing and attempt < self.max_field_retries:
+            attempt += 1
+            print(f"Повторный запрос к LLM для полей, не прошедших проверку: {', '.join(failing)}")
+            retried = (yield failing, self.model) or {}
+            failing = self._merge_retried_fields(case_data, retried, failing, fields)
+
+        return self._finalize_fields(case_data, failing, fields)
+
+    def _review_draft(self, draft, fields, fragment):
+        """
+        Проверяет ответ черновой модели. Возвращает (case_data, поля для основной модели)
+        или (None, None), если основной модели передается весь рапорт.
+        Поля, не прошедшие проверку, удаляются из case_data: если основная модель их не даст,
+        они проходят обычные повторные запросы и в итоге получают "Н/Д" с предупреждением.
+        """
+        if draft is None:
+            print(f"Черновая модель {self.draft_model} не дала ответа: рапорт передается модели {self.model}.")
+            add_metric("llm_escalated_documents")
+            return None, None
+        validate_case_data(draft, fields)
+        failing = check_draft_fields(draft, fields, fragment)
+        if len(failing) == len(fields):
+            print(f"Ответ черновой модели {self.draft_model} не прошел проверку: "
+                  f"рапорт передается модели {self.model}.")
+            add_metric("llm_escalated_documents")
+            return None, None
+        add_metric("llm_draft_fields", len(fields) - len(failing))
+        for field in failing:
+            draft.pop(field, None)
+        if failing:
+            print(f"Поля, переданные модели {self.model}: {', '.join(failing)}")
+            add_metric("llm_escalated_fields", len(failing))
+        return draft, failing
+
+    @staticmethod
+    def _merge_retried_fields(case_data, retried, failing, fields):
+        """Переносит прошедшие проверку поля повторного ответа и возвращает оставшиеся ошибки."""
+        validate_case_data(retried, failing)
+        case_data.update({field: retried[field] for field in failing if field in retried})
+        return validate_case_data(case_data, fields)
+
+    @staticmethod
+    def _finalize_fields(case_data, failing, fields):
+        if len(failing) == len(fields):
             return None
-        except json.JSONDecodeError as e:
-            print(f"Ошибка парсинга JSON ответа LLM: {e}")
-            print(f"Попытка парсинга строки: {json_string_candidate}")
+        for field in failing:
+            print(f"Внимание: поле '{field}' не удалось извлечь, используется значение 'Н/Д'.")
+            case_data[field] = "Н/Д"
+        return case_data
+
+    def _build_request(self, raport_text, fields, model):
+        """Сообщения, JSON-схема и options для запроса извлечения указанных полей."""
+        messages = self._get_extraction_messages(raport_text, fields)
+        return messages, build_case_data_schema(fields), self._request_options(raport_text, fields, model)
+
+    @classmethod
+    def _parse_case_data(cls, content, json_string_candidate):
+        """Разбирает ответ модели; при невалидном JSON бросает json.JSONDecodeError."""
+        if not json_string_candidate:
+            json_string_candidate = cls._extract_json_candidate(content)
+        case_data = json.loads(json_string_candidate)
+        if not isinstance(case_data, dict):
+            raise json.JSONDecodeError("ответ не является JSON-объектом", json_string_candidate, 0)
+        return case_data
+
+    def _report_request_error(self, error, content, model):
+        if isinstance(error, ollama.ResponseError):
+            print(f"Ошибка Ollama API: {error}")
+            print(f"Убедитесь, что Ollama запущен и модель {model} доступна.")
+        elif isinstance(error, json.JSONDecodeError):
+            print(f"Ошибка парсинга JSON ответа LLM: {error}")
+            print(f"Попытка парсинга строки: {error.doc}")
             print(f"Полный ответ LLM до очистки: {content}")
             print("Попробуйте скорректировать промпт или проверьте, что LLM генерирует валидный JSON.")
-            return None
+        else:
+            print(f"Неизвестная ошибка при взаимодействии с Ollama: {error}")
+
+    def _request_case_data(self, raport_text, fields, model=None):
+        model = model or self.model
+        messages, schema, options = self._build_request(raport_text, fields, model)
+        content = ""
+        json_string_candidate = None
+        started = time.perf_counter()
+        try:
+            if self.stream:
+                content, json_string_candidate, final_part, chunks = self._call(
+                    lambda client: self._chat_until_json_closed(client, model, messages, schema, options)
+                )
+                record_llm_response(final_part, time.perf_counter() - started, streamed_chunks=chunks)
+            else:
+                response = self._call(
+                    lambda client: client.chat(model=model, messages=messages, format=schema,
+                                               options=options, keep_alive=self.keep_alive)
+                )
+                record_llm_response(response, time.perf_counter() - started)
+                content = response['message']['content']
+            return self._parse_case_data(content, json_string_candidate)
         except Exception as e:
-            print(f"Неизвестная ошибка при взаимодействии с Ollama: {e}")
+            self._report_request_error(e, content, model)
             return None
+
+    def _chat_until_json_closed(self, client, model, messages, schema, options=None):
+        """
+        Запрашивает ответ в потоковом режиме и прекращает генерацию, как только
+        закрылся JSON-объект верхнего уровня (см. ChatStreamReader). Закрытие потока разрывает
+        соединение, и Ollama перестает генерировать токены после '}'.
+        Возвращает ChatStreamReader.result().
+        """
+        reader = ChatStreamReader()
+        stream = client.chat(model=model, messages=messages, format=schema, options=options,
+                             keep_alive=self.keep_alive, stream=True)
+        try:
+            for part in stream:
+                if request_cancelled():
+                    # Ответ уже получен от другого экземпляра пула: закрытие потока останавливает генерацию
+                    raise RequestCancelledError("дублирующий запрос отменен")
+                if reader.feed(part):
+                    break
+        finally:
+            stream.close()
+        return reader.result()
+
+    @staticmethod
+    def _extract_json_candidate(content):
+        """
+        Выделяет JSON-объект из полного (не потокового) ответа модели.
+        """
+        # 1. Удаляем Markdown-блоки, если они есть
+        if content.startswith("```json") and content.endswith("```"):
+            content = content[7:-3].strip()
+        elif content.startswith("```") and content.endswith("```"):
+            content = content[3:-3].strip()
+
+        cleaned_content = content.strip()
+
+        # 2. Ищем первый '{' и последний '}'
+        start_brace = cleaned_content.find('{')
+        end_brace = cleaned_content.rfind('}')
+
+        if start_brace != -1 and end_brace != -1 and end_brace > start_brace:
+            # Берем только содержимое между ними, включая сами скобки
+            return cleaned_content[start_brace : end_brace + 1]
+
+        # Ответ по схеме не должен обрываться; недостающие поля будут запрошены повторно
+        print("Внимание: Не удалось найти полный JSON-блок в ответе LLM.")
+        return cleaned_content # Оставляем как есть, пусть json.loads выдаст ошибку
+
+
+class JsonObjectScanner:
+    """
+    Инкрементальный сканер потока токенов: отслеживает глубину скобок и состояние
+    строковых литералов и сообщает, когда закрылся JSON-объект верхнего уровня.
+    Текст до первой '{' (например, "```json") пропускается.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._started = False
+
+    def feed(self, chunk):
+        """
+        Принимает очередной фрагмент ответа. Возвращает полный текст объекта,
+        как только он закрылся, иначе None.
+        """
+        segment_start = 0
+        for index, char in enumerate(chunk):
+            if not self._started:
+                if char != '{':
+                    continue
+                self._started = True
+                segment_start = index
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._buffer.append(chunk[segment_start:index + 1])
+                    return "".join(self._buffer)
+
+        if self._started:
+            self._buffer.append(chunk[segment_start:])
+        return None
+
+
+# После закрытия JSON-объекта поток читается еще не больше STATS_GRACE_CHUNKS фрагментов: при ответе
+# по JSON-схеме Ollama завершает генерацию сразу после '}', и следующий фрагмент - итоговый, со счетчиками
+# (prompt_eval_count, eval_count, load/prompt_eval/eval_duration). Если модель продолжает писать текст
+# после объекта, поток закрывается без итогового фрагмента, и счетчики только оцениваются (core/metrics.py).
+STATS_GRACE_CHUNKS = 2
+
+
+class ChatStreamReader:
+    """
+    Разбор потокового ответа /api/chat: текст до закрытия JSON-объекта (JsonObjectScanner)
+    и итоговый фрагмент Ollama со счетчиками, если он пришел в пределах STATS_GRACE_CHUNKS.
+    """
+
+    def __init__(self):
+        self._scanner = JsonObjectScanner()
+        self._received = []
+        self._json_object = None
+        self._final_part = None
+        self._extra_chunks = 0
+
+    def feed(self, part):
+        """Принимает очередной фрагмент потока; True - поток можно закрывать."""
+        if part.get('done'):
+            self._final_part = part
+        if self._json_object is None:
+            chunk = part['message']['content']
+            self._received.append(chunk)
+            self._json_object = self._scanner.feed(chunk)
+        else:
+            self._extra_chunks += 1
+        return self._final_part is not None or (
+            self._json_object is not None and self._extra_chunks >= STATS_GRACE_CHUNKS)
+
+    def result(self):
+        """
+        (полученный текст, JSON-объект или None, если объект не закрылся,
+        итоговый фрагмент со счетчиками или None, число фрагментов текста).
+        """
+        return "".join(self._received), self._json_object, self._final_part, len(self._received)
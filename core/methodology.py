@@ -0,0 +1,267 @@
+# core/methodology.py
+
+import hashlib
+import json
+import os
+import re
+import threading
+
+# Реестр методик расследования из Excel-файла типового плана. Листы книги разбираются
+# один раз и сохраняются в компактный JSON-артефакт; при обычных запусках читается только он,
+# а openpyxl импортируется лишь тогда, когда файл методики изменился (по mtime/размеру,
+# а при их расхождении - по sha256 содержимого).
+
+DEFAULT_METHODOLOGY_PATH = os.path.join('data', 'methodology', 'типовой план ЖФ 16.09.2023.xlsx')
+DEFAULT_COMPILED_PATH = os.path.join('data', 'cache', 'methodology.json')
+COMPILED_FORMAT_VERSION = 1
+
+DEFAULT_METHODOLOGY = "орм 1 вариант"
+# Выбор листа методики по типу правонарушения: первая подстрока, найденная в тип_правонарушения
+METHODOLOGY_BY_OFFENCE_TYPE = [
+    ("пирамид", "орм жф"),
+]
+
+# Этапы книги ("1 этап - до регистрации в ЕРДР", "2-этап", "3 этап") крупнее этапов шаблонов действий
+# (methodology_stage в core/templates.py, ключи PERIOD_MAP): номер этапа книги -> этапы шаблонов.
+# Срок этапа книги - граница для сроков его этапов шаблонов: диапазон каждого этапа шаблона
+# (PERIOD_MAP) сужается до нее, а не заменяется одним общим сроком (template_stage_durations).
+TEMPLATE_STAGES_BY_WORKBOOK_STAGE = {
+    1: (),  # до регистрации в ЕРДР - в план досудебного расследования не входит
+    2: ("Быстрая фиксация", "Сбор базовых доказательств", "Аналитический блок", "Процессуальная фиксация",
+        "Обеспечение", "Международное сотрудничество"),
+    3: ("Квалификация и обвинение", "Завершение ДР"),
+}
+_STAGE_NUMBER_RE = re.compile(r"^\s*(\d+)\s*-?\s*этап", re.IGNORECASE)
+# Сроки вида "Дни 15-60" и "До дня 120" (как в PERIOD_MAP)
+_DAY_RANGE_RE = re.compile(r"^\s*дни\s*(\d+)\s*-\s*(\d+)\s*$", re.IGNORECASE)
+_DAY_LIMIT_RE = re.compile(r"^\s*до\s+дня\s*(\d+)\s*$", re.IGNORECASE)
+
+# Колонки листа (по началу заголовка в верхнем регистре)
+_COLUMN_PREFIXES = {
+    "этап": "ЭТАП",
+    "описание": "ОПИСАНИЕ ЭТАПА",
+    "действие": "СЛЕДСТВЕННО-ОПЕРАТИВНЫЕ",
+    "цели": ("ЦЕЛИ", "ПРОВОДИМАЯ РАБОТА"),
+    "форма_завершения": "ФОРМА ЗАВЕРШЕНИЯ",
+    "срок": "СРОК",
+}
+
+_lock = threading.Lock()
+_registry = None
+
+
+def _normalize(value):
+    return " ".join(str(value).split()) if value is not None else ""
+
+
+def _stage_name(value):
+    # В книге встречается дублированный текст объединенной ячейки: "2-этап      ...      2-этап"
+    parts = []
+    for part in re.split(r"\s{3,}", str(value or "")):
+        part = _normalize(part)
+        if part and part not in parts:
+            parts.append(part)
+    return " ".join(parts)
+
+
+def sheet_key(sheet_name):
+    return _normalize(sheet_name).lower()
+
+
+def _find_columns(header):
+    columns = {}
+    for index, title in enumerate(header):
+        title = _normalize(title).upper()
+        for column, prefixes in _COLUMN_PREFIXES.items():
+            if column not in columns and title.startswith(prefixes):
+                columns[column] = index
+    return columns
+
+
+def _parse_sheet(rows):
+    """
+    Разбирает строки листа методики: этапы (объединенные ячейки колонки "ЭТАП"
+    продолжаются вниз), действия этапа с целями и формой завершения, сроки этапов,
+    если в листе есть колонка "Срок...". Строки без действия дополняют цели предыдущего.
+    """
+    columns = None
+    stages = []
+    stage = None
+    action = None
+    for row in rows:
+        if columns is None:
+            if row and _normalize(row[0]).upper() == "ЭТАП":
+                columns = _find_columns(row)
+            continue
+
+        def cell(column):
+            index = columns.get(column)
+            return _normalize(row[index]) if index is not None and index < len(row) else ""
+
+        if cell("этап"):
+            stage = {"этап": _stage_name(row[columns["этап"]]), "описание": cell("описание"),
+                     "срок": cell("срок"), "действия": []}
+            stages.append(stage)
+            action = None
+        if stage is None:
+            continue
+        if cell("срок") and not stage["срок"]:
+            stage["срок"] = cell("срок")
+
+        if cell("действие"):
+            action = {"действие": cell("действие"), "цели": cell("цели"),
+                      "форма_завершения": cell("форма_завершения")}
+            stage["действия"].append(action)
+        elif action is not None and cell("цели"):
+            action["цели"] = f"{action['цели']}\n{cell('цели')}".strip()
+    return stages
+
+
+def compile_methodology_workbook(xlsx_path):
+    """Читает все листы книги (openpyxl) и возвращает {ключ листа: методика}."""
+    import openpyxl  # только при перекомпиляции: обычные запуски обходятся JSON-артефактом
+
+    workbook = openpyxl.load_workbook(xlsx_path, read_only=True, data_only=True)
+    try:
+        methodologies = {}
+        for worksheet in workbook.worksheets:
+            stages = _parse_sheet(worksheet.iter_rows(values_only=True))
+            if not stages:
+                continue
+            methodologies[sheet_key(worksheet.title)] = {
+                "лист": worksheet.title,
+                "этапы": stages,
+                "durations": {stage["этап"]: stage["срок"] for stage in stages if stage["срок"]},
+            }
+        return methodologies
+    finally:
+        workbook.close()
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_compiled(compiled_path):
+    try:
+        with open(compiled_path, encoding="utf-8") as f:
+            compiled = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return compiled if compiled.get("version") == COMPILED_FORMAT_VERSION else None
+
+
+def _write_compiled(compiled_path, compiled):
+    os.makedirs(os.path.dirname(compiled_path) or ".", exist_ok=True)
+    tmp_path = f"{compiled_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(compiled, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, compiled_path)
+
+
+def load_methodologies(xlsx_path=DEFAULT_METHODOLOGY_PATH, compiled_path=DEFAULT_COMPILED_PATH, force=False):
+    """
+    Возвращает скомпилированный реестр {"source": {...}, "methodologies": {...}}.
+    Перекомпилирует книгу, только если изменилось ее содержимое (или force=True).
+    Если книги нет, возвращает пустой реестр: сроки берутся из PERIOD_MAP.
+    """
+    try:
+        stat = os.stat(xlsx_path)
+    except OSError:
+        print(f"Файл методики не найден: {xlsx_path}. Используются сроки по умолчанию.")
+        return {"source": None, "methodologies": {}}
+
+    compiled = None if force else _read_compiled(compiled_path)
+    source = compiled.get("source") if compiled else None
+    if source and source["mtime_ns"] == stat.st_mtime_ns and source["size"] == stat.st_size:
+        return compiled
+
+    sha256 = _file_sha256(xlsx_path)
+    if compiled and source and source["sha256"] == sha256:
+        # Файл переписан без изменений (копирование, синхронизация) - обновляем только отметку
+        compiled["source"].update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+    else:
+        print(f"Компиляция методики из {xlsx_path}...")
+        try:
+            methodologies = compile_methodology_workbook(xlsx_path)
+        except Exception as e:
+            print(f"Не удалось прочитать методику {xlsx_path}: {e}. Используются сроки по умолчанию.")
+            return {"source": None, "methodologies": {}}
+        compiled = {
+            "version": COMPILED_FORMAT_VERSION,
+            "source": {"path": xlsx_path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": sha256},
+            "methodologies": methodologies,
+        }
+    try:
+        _write_compiled(compiled_path, compiled)
+    except OSError as e:
+        print(f"Не удалось сохранить скомпилированную методику {compiled_path}: {e}")
+    return compiled
+
+
+def get_methodology_registry():
+    """Реестр методик по умолчанию; загружается один раз за процесс."""
+    global _registry
+    with _lock:
+        if _registry is None:
+            _registry = load_methodologies()
+        return _registry
+
+
+def workbook_stage_number(stage_name):
+    """Номер этапа книги по его названию ("2-этап" -> 2) или None."""
+    match = _STAGE_NUMBER_RE.match(stage_name or "")
+    return int(match.group(1)) if match else None
+
+
+def _day_range(srok):
+    """(первый день, последний день) срока или None, если срок не в днях."""
+    match = _DAY_RANGE_RE.match(srok or "")
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    match = _DAY_LIMIT_RE.match(srok or "")
+    return (None, int(match.group(1))) if match else None
+
+
+def _clamp_srok(srok, bound):
+    """Срок этапа шаблона srok, суженный до срока этапа книги bound; None - если сузить нельзя."""
+    days, bound_days = _day_range(srok), _day_range(bound)
+    if days is None or bound_days is None:
+        return None
+    first = max(days[0] or 1, bound_days[0] or 1)
+    last = min(days[1], bound_days[1])
+    if first > last:
+        return None
+    return f"Дни {first}-{last}" if days[0] is not None else f"До дня {last}"
+
+
+def template_stage_durations(methodology, defaults):
+    """
+    Сроки этапов шаблонов действий по срокам этапов книги методики (TEMPLATE_STAGES_BY_WORKBOOK_STAGE).
+    defaults - сроки этапов шаблонов без методики (PERIOD_MAP): у каждого этапа шаблона свой диапазон,
+    и срок этапа книги его только сужает ("Дни 15-60" при сроке "Дни 1-45" - "Дни 15-45").
+    Срок книги целиком получают этапы шаблонов без срока по умолчанию и этапы, чей диапазон с ним
+    не пересекается или не сравним (срок книги не в днях). Этапы книги без срока не дают ничего.
+    """
+    durations = {}
+    for stage_name, srok in methodology["durations"].items():
+        for template_stage in TEMPLATE_STAGES_BY_WORKBOOK_STAGE.get(workbook_stage_number(stage_name), ()):
+            durations[template_stage] = _clamp_srok(defaults.get(template_stage), srok) or srok
+    return durations
+
+
+def select_methodology(offence_type, registry=None):
+    """
+    Выбирает методику по типу правонарушения (METHODOLOGY_BY_OFFENCE_TYPE),
+    иначе - DEFAULT_METHODOLOGY. Возвращает None, если в реестре нет подходящего листа.
+    """
+    methodologies = (registry or get_methodology_registry())["methodologies"]
+    offence_type = (offence_type or "").lower()
+    for substring, key in METHODOLOGY_BY_OFFENCE_TYPE:
+        if substring in offence_type and key in methodologies:
+            return methodologies[key]
+    return methodologies.get(DEFAULT_METHODOLOGY)
@@ -0,0 +1,207 @@
+# core/metrics.py
+
+import contextlib
+import contextvars
+import datetime
+import json
+import os
+import threading
+import time
+
+# Метрики обработки документа: время этапов (PDF, LLM, план, DOCX), объем текста,
+# счетчики токенов и тайминги Ollama. Сборщик текущего документа хранится в contextvar,
+# поэтому глубоко вложенный код (клиент Ollama, разбор PDF) записывает в него без передачи
+# параметров; при переходе в другой поток или цикл событий контекст нужно передать явно
+# (use_metrics / bind_metrics).
+
+# Поля ответа Ollama: длительности приходят в наносекундах
+OLLAMA_COUNTERS = ("prompt_eval_count", "eval_count")
+OLLAMA_DURATIONS = ("load_duration", "prompt_eval_duration", "eval_duration", "total_duration")
+
+PROMETHEUS_PREFIX = "plan_llm"
+
+_current = contextvars.ContextVar("document_metrics", default=None)
+
+
+class DocumentMetrics:
+    """Метрики одного документа; значения - плоский словарь для JSON lines."""
+
+    def __init__(self, document):
+        self.values = {"document": document, "status": "error"}
+        self._lock = threading.Lock()  # фрагменты длинного рапорта пишут из нескольких потоков
+
+    def add(self, name, value):
+        with self._lock:
+            self.values[name] = self.values.get(name, 0) + value
+
+    def set(self, name, value):
+        with self._lock:
+            self.values[name] = value
+
+    def record_llm_response(self, response, wall_seconds, streamed_chunks=None):
+        """
+        Учитывает ответ Ollama. Потоковый ответ обычно дочитывается до итогового фрагмента
+        со счетчиками (llm_utils.ChatStreamReader). Если поток закрыт без него (модель писала текст
+        после JSON-объекта), prompt_eval_count и длительности не учитываются, такие запросы
+        считаются в llm_requests_without_stats, а eval_count оценивается по числу фрагментов.
+        """
+        self.add("llm_requests", 1)
+        self.add("llm_request_seconds", wall_seconds)
+        if response is None:
+            self.add("llm_requests_without_stats", 1)
+            if streamed_chunks:
+                self.add("eval_count", streamed_chunks)
+                self.set("eval_count_estimated", True)
+            return
+        for name in OLLAMA_COUNTERS:
+            value = response.get(name)
+            if value:
+                self.add(name, value)
+        for name in OLLAMA_DURATIONS:
+            value = response.get(name)
+            if value:
+                self.add(f"{name}_seconds", value / 1e9)
+
+
+def current_metrics():
+    return _current.get()
+
+
+def set_metric(name, value):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.set(name, value)
+
+
+def add_metric(name, value=1):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add(name, value)
+
+
+@contextlib.contextmanager
+def use_metrics(metrics):
+    """Подключает сборщик метрик в рабочем потоке (ThreadPoolExecutor не переносит contextvars)."""
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Замеряет этап и добавляет время к "<name>_seconds" текущего документа (если метрики собираются)."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(f"{name}_seconds", time.perf_counter() - started)
+
+
+def record_llm_response(response, wall_seconds, streamed_chunks=None):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.record_llm_response(response, wall_seconds, streamed_chunks)
+
+
+async def bind_metrics(metrics, coroutine):
+    """Выполняет корутину в задаче другого цикла событий с тем же сборщиком метрик."""
+    _current.set(metrics)
+    return await coroutine
+
+
+@contextlib.contextmanager
+def document_metrics(document, sink=None):
+    """
+    Открывает сборщик метрик документа на время блока; по выходу передает запись в sink.
+    Статус "ok" нужно выставить явно (metrics.set("status", "ok")).
+    """
+    metrics = DocumentMetrics(document)
+    token = _current.set(metrics)
+    started = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+        metrics.set("total_seconds", time.perf_counter() - started)
+        metrics.set("finished_at", datetime.datetime.now().astimezone().isoformat(timespec="seconds"))
+        if sink is not None:
+            sink.emit(metrics.values)
+
+
+class MetricsSink:
+    """
+    Приемник метрик: JSON lines (одна строка на документ) и/или текстовый файл
+    для textfile collector node_exporter (агрегаты за запуск, перезаписывается атомарно).
+    """
+
+    def __init__(self, jsonl_path=None, prometheus_path=None):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self._lock = threading.Lock()
+        self._documents = {}
+        self._sums = {}
+        self._counts = {}
+        for path in (jsonl_path, prometheus_path):
+            if path and os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def emit(self, record):
+        with self._lock:
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if self.prometheus_path:
+                self._aggregate(record)
+                self._write_prometheus()
+
+    def _aggregate(self, record):
+        status = record.get("status", "error")
+        self._documents[status] = self._documents.get(status, 0) + 1
+        for name, value in record.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            self._sums[name] = self._sums.get(name, 0) + value
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def _write_prometheus(self):
+        lines = [
+            f"# HELP {PROMETHEUS_PREFIX}_documents_total Обработанные документы по статусу.",
+            f"# TYPE {PROMETHEUS_PREFIX}_documents_total counter",
+        ]
+        lines += [f'{PROMETHEUS_PREFIX}_documents_total{{status="{status}"}} {count}'
+                  for status, count in sorted(self._documents.items())]
+
+        stages = sorted(name[:-len("_seconds")] for name in self._sums if name.endswith("_seconds"))
+        lines += [
+            f"# HELP {PROMETHEUS_PREFIX}_stage_seconds Время этапов обработки документа.",
+            f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds summary",
+        ]
+        for name in stages:
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_sum{{stage="{name}"}} {self._sums[name + "_seconds"]:.6f}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_count{{stage="{name}"}} {self._counts[name + "_seconds"]}')
+
+        lines += [
+            f"# HELP {PROMETHEUS_PREFIX}_volume_total Объем обработанных данных (страницы, символы, токены, запросы).",
+            f"# TYPE {PROMETHEUS_PREFIX}_volume_total counter",
+        ]
+        for name in ("pages", "chars", "chunks", "llm_requests", "llm_requests_without_stats", "llm_cache_hits",
+                     "llm_draft_fields", "llm_escalated_fields", "llm_escalated_documents", "near_duplicate_hits",
+                     "near_duplicate_reused_fields", *OLLAMA_COUNTERS):
+            if name in self._sums:
+                lines.append(f'{PROMETHEUS_PREFIX}_volume_total{{kind="{name}"}} {self._sums[name]}')
+
+        lines += [
+            f"# HELP {PROMETHEUS_PREFIX}_last_update_timestamp_seconds Время последнего обновления метрик.",
+            f"# TYPE {PROMETHEUS_PREFIX}_last_update_timestamp_seconds gauge",
+            f"{PROMETHEUS_PREFIX}_last_update_timestamp_seconds {time.time():.0f}",
+        ]
+        tmp_path = f"{self.prometheus_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.prometheus_path)
@@ -0,0 +1,242 @@
+# core/near_duplicates.py
+
+import difflib
+import hashlib
+import json
+import random
+import re
+import sqlite3
+import struct
+import time
+import zlib
+from contextlib import closing
+
+from core.cache import DEFAULT_CACHE_PATH, DEFAULT_MAX_AGE_DAYS, DEFAULT_MAX_ENTRIES
+from core.chunking import NOT_AVAILABLE
+
+# Индекс почти одинаковых рапортов. Перерегистрации и исправленные версии рапорта по тому же
+# делу отличаются от исходного несколькими словами (даты, номер ЕРДР), поэтому точный кэш LLM
+# (хэш текста) их не находит. Для каждого структурированного рапорта сохраняются MinHash-сигнатура
+# нормализованного текста, сам текст и case_data. Похожий рапорт получает case_data ранее
+# обработанного, а LLM заново извлекает только поля, значения которых затронуты различиями текстов,
+# а если различия не относятся ни к одному значению - свободные текстовые и незаполненные поля.
+# Для того же текста LLM не вызывается.
+#
+# Кандидаты ищутся по LSH: сигнатура из NUM_PERMUTATIONS минимумов делится на LSH_BANDS полос;
+# тексты с совпадающей хотя бы одной полосой отбираются по доле совпадающих минимумов (оценка
+# коэффициента Жаккара множеств шинглов - последовательностей из SHINGLE_WORDS слов), а лучшие
+# MAX_CANDIDATES из них проверяются точным коэффициентом по сохраненному тексту.
+# Таблицы хранятся в файле кэша LLM и, как и записи кэша, вытесняются по возрасту и числу записей.
+
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // LSH_BANDS
+SHINGLE_WORDS = 4
+DEFAULT_THRESHOLD = 0.9
+# Погрешность оценки по 64 минимумам - около 0.03-0.05: кандидаты отбираются с запасом
+ESTIMATE_MARGIN = 0.1
+MAX_CANDIDATES = 4
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_random = random.Random(20231005)  # перестановки должны совпадать во всех процессах и запусках
+_PERMUTATIONS = [(_random.randrange(1, _MERSENNE_PRIME), _random.randrange(0, _MERSENNE_PRIME))
+                 for _ in range(NUM_PERMUTATIONS)]
+_SIGNATURE_FORMAT = f"<{NUM_PERMUTATIONS}Q"
+
+_WORD_RE = re.compile(r"\w+(?:[.\-/:]\w+)*")
+# Слова короче - предлоги, союзы, инициалы: их изменение не указывает на измененное поле
+_MIN_CHANGED_WORD = 3
+_STEM_CHARS = 5  # сравнение слов по началу - без учета падежных окончаний ("Иванов" / "Иванова")
+# Поля с описанием своими словами: их значения не повторяют текст дословно, поэтому измененные
+# слова, не относящиеся к другим полям, могут затрагивать любое из них
+FREE_TEXT_FIELDS = ("фигуранты", "суть_правонарушения", "дополнительные_сведения")
+
+
+def normalize_words(text):
+    """Слова текста в нижнем регистре (числа и даты вида 05.10.2023 - одним словом)."""
+    return _WORD_RE.findall(text.lower())
+
+
+def _shingles(words):
+    if len(words) < SHINGLE_WORDS:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def jaccard_similarity(words, other):
+    """Точный коэффициент Жаккара множеств шинглов двух текстов."""
+    shingles, other_shingles = _shingles(words), _shingles(other)
+    union = len(shingles | other_shingles)
+    return len(shingles & other_shingles) / union if union else 1.0
+
+
+def minhash_signature(words):
+    """MinHash-сигнатура множества шинглов текста (NUM_PERMUTATIONS чисел)."""
+    hashes = [int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+              for shingle in _shingles(words)] or [0]
+    return [min((a * value + b) % _MERSENNE_PRIME for value in hashes) for a, b in _PERMUTATIONS]
+
+
+def _band_hashes(signature):
+    for band in range(LSH_BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(struct.pack(f"<{ROWS_PER_BAND}Q", *rows), digest_size=8).digest()
+        yield band, int.from_bytes(digest, "little", signed=True)
+
+
+def estimate_similarity(signature, other):
+    """Оценка коэффициента Жаккара по двум сигнатурам."""
+    return sum(1 for a, b in zip(signature, other) if a == b) / NUM_PERMUTATIONS
+
+
+def _stem(word):
+    return word if any(char.isdigit() for char in word) else word[:_STEM_CHARS]
+
+
+def changed_fields(old_words, new_words, case_data, fields, known_values=()):
+    """
+    Поля из fields, которые нужно извлечь заново при переходе от текста old_words (из него извлечены
+    значения case_data) к new_words; остальные переносятся без изменений. Для того же текста - ни одного:
+    - поля, которых нет в case_data;
+    - поля, значения которых содержат удаленные, замененные или добавленные слова;
+    - все свободные текстовые поля (FREE_TEXT_FIELDS), если среди измененных слов есть не относящиеся
+      к значениям остальных полей case_data и known_values (значения, извлеченные правилами из
+      new_words): дописанный в текст фигурант или эпизод не пересекается ни с одним старым значением;
+    - пустые поля и "Н/Д", если среди добавленных слов есть такие необъясненные слова
+      (в новой версии сведения могли появиться).
+    """
+    if old_words == new_words:
+        return [field for field in fields if field not in case_data]
+    matcher = difflib.SequenceMatcher(None, old_words, new_words, autojunk=False)
+    removed, added = set(), set()
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag != "equal":
+            removed.update(old_words[old_start:old_end])
+            added.update(new_words[new_start:new_end])
+
+    def stems(words):
+        return {_stem(word) for word in words if len(word) >= _MIN_CHANGED_WORD or any(char.isdigit() for char in word)}
+
+    def value_stems(value):
+        return {_stem(word) for word in normalize_words(str(value))}
+
+    removed, added = stems(removed), stems(added)
+    changed = removed | added
+    explained = set()
+    for value in [value for field, value in case_data.items() if field not in FREE_TEXT_FIELDS] + list(known_values):
+        explained |= value_stems(value)
+    free_text_changed = bool(changed - explained)
+    new_information = bool(added - explained)
+
+    result = []
+    for field in fields:
+        value = str(case_data.get(field, "")).strip()
+        if (field not in case_data or value_stems(value) & changed
+                or (free_text_changed and field in FREE_TEXT_FIELDS)
+                or (new_information and value in ("", NOT_AVAILABLE))):
+            result.append(field)
+    return result
+
+
+class NearDuplicateIndex:
+    """
+    Персистентный индекс почти одинаковых рапортов в SQLite (по умолчанию - в файле кэша LLM).
+    Безопасен для вызова из потоков пакетного режима. threshold - минимальный коэффициент Жаккара
+    шинглов, при котором рапорт считается версией ранее обработанного. Внутри пакета рапорт находит
+    версии, структурирование которых завершилось до начала его структурирования.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, threshold=DEFAULT_THRESHOLD, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_age_days=DEFAULT_MAX_AGE_DAYS):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_days * 24 * 3600
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS near_duplicates ("
+                " key TEXT PRIMARY KEY,"
+                " extraction_key TEXT NOT NULL,"
+                " signature BLOB NOT NULL,"
+                " words BLOB NOT NULL,"
+                " case_data TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS near_duplicate_bands ("
+                " band INTEGER NOT NULL,"
+                " hash INTEGER NOT NULL,"
+                " key TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS near_duplicate_bands_hash ON near_duplicate_bands(band, hash)")
+            conn.execute("CREATE INDEX IF NOT EXISTS near_duplicate_bands_key ON near_duplicate_bands(key)")
+
+    def _connect(self):
+        # Как и в ExtractionCache: отдельное соединение на каждую операцию
+        return sqlite3.connect(self.path, timeout=30)
+
+    def find(self, words, signature, extraction_key):
+        """
+        Самый похожий ранее обработанный рапорт той же модели и промпта (extraction_key):
+        {"similarity", "words", "case_data"} или None, если похожих не выше threshold.
+        """
+        bands = list(_band_hashes(signature))
+        condition = " OR ".join("(b.band = ? AND b.hash = ?)" for _ in bands)
+        now = time.time()
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT n.key, n.signature FROM near_duplicate_bands b"
+                " JOIN near_duplicates n ON n.key = b.key"
+                f" WHERE ({condition}) AND n.extraction_key = ? AND n.created_at >= ?",
+                (*[value for band in bands for value in band], extraction_key, now - self.max_age_seconds),
+            ).fetchall()
+            estimates = sorted(((estimate_similarity(signature, struct.unpack(_SIGNATURE_FORMAT, stored)), key)
+                                for key, stored in rows), reverse=True)
+            best = None
+            for estimate, key in estimates[:MAX_CANDIDATES]:
+                if estimate < self.threshold - ESTIMATE_MARGIN:
+                    break
+                stored_words, case_data = conn.execute(
+                    "SELECT words, case_data FROM near_duplicates WHERE key = ?", (key,)
+                ).fetchone()
+                stored_words = zlib.decompress(stored_words).decode("utf-8").split(" ")
+                similarity = jaccard_similarity(words, stored_words)
+                if similarity >= self.threshold and (best is None or similarity > best["similarity"]):
+                    best = {"similarity": similarity, "words": stored_words, "case_data": case_data}
+        if best is not None:
+            best["case_data"] = json.loads(best["case_data"])
+        return best
+
+    def put(self, words, signature, extraction_key, case_data):
+        text = " ".join(words)
+        key = hashlib.sha256(f"{extraction_key}\0{text}".encode("utf-8")).hexdigest()
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO near_duplicates (key, extraction_key, signature, words, case_data, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, extraction_key, struct.pack(_SIGNATURE_FORMAT, *signature), zlib.compress(text.encode("utf-8")),
+                 json.dumps(case_data, ensure_ascii=False), now),
+            )
+            conn.execute("DELETE FROM near_duplicate_bands WHERE key = ?", (key,))
+            conn.executemany("INSERT INTO near_duplicate_bands (band, hash, key) VALUES (?, ?, ?)",
+                             [(band, value, key) for band, value in _band_hashes(signature)])
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        removed = conn.execute("DELETE FROM near_duplicates WHERE created_at < ?",
+                               (now - self.max_age_seconds,)).rowcount
+        removed += conn.execute(
+            "DELETE FROM near_duplicates WHERE key IN ("
+            " SELECT key FROM near_duplicates ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        if removed:
+            conn.execute("DELETE FROM near_duplicate_bands WHERE key NOT IN (SELECT key FROM near_duplicates)")
+
+    def clear(self):
+        with closing(self._connect()) as conn, conn:
+            removed = conn.execute("DELETE FROM near_duplicates").rowcount
+            conn.execute("DELETE FROM near_duplicate_bands")
+        return removed
@@ -1,60 +1,480 @@
 # core/parser.py
 
+import contextlib
+import multiprocessing
 import os
-from core.llm_utils import OllamaClient
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from core.chunking import merge_partial_case_data, split_pages_into_chunks
+from core.async_llm import AsyncOllamaClient
+from core.llm_utils import EXTRACTION_FIELDS, OllamaClient
+from core.metrics import add_metric, current_metrics, set_metric, stage, use_metrics
+from core.near_duplicates import changed_fields, minhash_signature, normalize_words
 from pypdf import PdfReader # Импортируем pypdf
 
+# --- Детерминированное извлечение регулярных полей рапорта ---
+# Поля с устойчивым форматом заполняются правилами, а LLM получает только остальные.
+
+_MONTHS = "января|февраля|марта|апреля|мая|июня|июля|августа|сентября|октября|ноября|декабря"
+
+_ERDR_NUMBER_RE = re.compile(r"ЕРДР\D{0,25}?(?<!\d)(\d{15})(?!\d)")
+_ANY_ERDR_NUMBER_RE = re.compile(r"(?<!\d)(\d{15})(?!\d)")
+_DATE_TIME_PATTERN = (
+    r"(?<!\d)(\d{2}\.\d{2}\.\d{4})\s*(?:г\.?|года)?\s*(?:в\s*)?"
+    r"(\d{1,2})\s*(?::|час(?:а|ов)?)\s*(\d{2})(?:\s*мин(?:ут[аы]?|\.)?)?"
+)
+_DATE_TIME_RE = re.compile(_DATE_TIME_PATTERN)
+# Дата регистрации следует сразу за номером: "за №237100121000075, 05.10.2023г. в 17:28"
+_REGISTRATION_PREFIX = r"[\s,]*(?:от\s*)?"
+_REGISTRATION_DATE_TIME_RE = re.compile(_REGISTRATION_PREFIX + _DATE_TIME_PATTERN)
+_REGISTRATION_DATE_RE = re.compile(_REGISTRATION_PREFIX + r"(\d{2}\.\d{2}\.\d{4})(?!\d)")
+_RAPORT_DATE_RE = re.compile(rf"(?<!\d)(\d{{1,2}})\s+({_MONTHS})\s+(\d{{4}})\s*(?:г\.|года)?", re.IGNORECASE)
+# "ст. 217 ч.2 п.1 УК РК" и обратный порядок "п.1 ч.2 ст.217 УК РК"; "У К" - частый артефакт pypdf.
+# УПК РК отсекается, т.к. после номера статьи требуется именно "УК".
+_ARTICLE_RE = re.compile(
+    r"ст(?:атьи|\.)?\s*(\d{1,3}(?:-\d+)?)\s*,?\s*(?:ч(?:асти|\.)?\s*(\d+))?\s*,?\s*"
+    r"(?:п(?:ункта|\.)?\s*(\d+))?\s*,?\s*У\s?К\s*РК"
+)
+_ARTICLE_REVERSED_RE = re.compile(
+    r"(?:п(?:ункта|\.)?\s*(\d+)\s*,?\s*)?ч(?:асти|\.)?\s*(\d+)\s*,?\s*ст(?:атьи|\.)?\s*(\d{1,3}(?:-\d+)?)\s*У\s?К\s*РК"
+)
+_UNDERSCORES_RE = re.compile(r"_{3,}")
+_INLINE_SPACES_RE = re.compile(r"[ \t\u00a0]+")
+
+# Параллельное извлечение текста включается только для больших документов:
+# запуск процессов (spawn) стоит дороже, чем чтение нескольких десятков страниц.
+PARALLEL_MIN_PAGES = 64
+PAGES_PER_TASK = 16
+
+RULE_FIELDS = ("номер_ердр", "дата_регистрации_ердр", "дата_обнаружения", "статья_ук_рк", "рапорт_дата")
+
+# Заголовок рапорта отдельной строкой: "РАПОРТ", "Р А П О Р Т", "Рапорт об обнаружении сведений ..."
+_RAPORT_TITLE_RE = re.compile(r"р\s?а\s?п\s?о\s?р\s?т(?:\s+об\s+обнаружении\b.*|\s*№.*)?", re.IGNORECASE)
+TITLE_SEARCH_LINES = 25  # заголовок ищется в шапке - первых непустых строках страницы
+
+
+def _format_article(article, part, point):
+    result = article
+    if part:
+        result += f" ч.{part}"
+    if point:
+        result += f" п.{point}"
+    return result
+
+
+def pre_extract_fields(raport_text):
+    """
+    Извлекает регулярные поля рапорта (номер и дата ЕРДР, дата обнаружения,
+    статья УК РК, дата рапорта) скомпилированными регулярными выражениями.
+    Возвращает только найденные поля; остальное остается за LLM.
+    """
+    fields = {}
+
+    erdr_match = _ERDR_NUMBER_RE.search(raport_text) or _ANY_ERDR_NUMBER_RE.search(raport_text)
+    registration_end = None
+    if erdr_match:
+        fields["номер_ердр"] = erdr_match.group(1)
+        registration = _REGISTRATION_DATE_TIME_RE.match(raport_text, erdr_match.end())
+        if registration:
+            date, hours, minutes = registration.groups()
+            fields["дата_регистрации_ердр"] = f"{date}г. в {int(hours):02d}:{minutes}"
+            registration_end = registration.end()
+        else:
+            registration_date = _REGISTRATION_DATE_RE.match(raport_text, erdr_match.end())
+            if registration_date:
+                fields["дата_регистрации_ердр"] = f"{registration_date.group(1)}г."
+
+    # Дата обнаружения - первая дата со временем, не являющаяся датой регистрации в ЕРДР
+    for match in _DATE_TIME_RE.finditer(raport_text):
+        if registration_end is not None and erdr_match.end() <= match.start() < registration_end:
+            continue
+        date, hours, minutes = match.groups()
+        fields["дата_обнаружения"] = f"{date} {int(hours):02d}:{minutes}"
+        break
+
+    # Из двух форм записи статьи берем ту, что встречается раньше (полная обратная форма
+    # "п.1 ч.2 ст.217" начинается раньше, чем вложенная в нее прямая "ст.217 УК РК")
+    article_match = _ARTICLE_RE.search(raport_text)
+    reversed_match = _ARTICLE_REVERSED_RE.search(raport_text)
+    if reversed_match and (article_match is None or reversed_match.start() <= article_match.start()):
+        point, part, article = reversed_match.groups()
+        fields["статья_ук_рк"] = _format_article(article, part, point)
+    elif article_match:
+        fields["статья_ук_рк"] = _format_article(*article_match.groups())
+
+    raport_date_match = _RAPORT_DATE_RE.search(raport_text)
+    if raport_date_match:
+        day, month, year = raport_date_match.groups()
+        fields["рапорт_дата"] = f"{int(day)} {month.lower()} {year} г."
+
+    return fields
+
+
+def has_raport_title(page_text):
+    """Есть ли в шапке страницы заголовок рапорта."""
+    lines = [line.strip() for line in page_text.splitlines() if line.strip()]
+    return any(_RAPORT_TITLE_RE.fullmatch(line) for line in lines[:TITLE_SEARCH_LINES])
+
+
+def split_raport_bundle(pages):
+    """
+    Делит страницы PDF, в котором подряд сшиты несколько рапортов, на отдельные рапорты без LLM.
+    Кандидат на начало рапорта - страница с заголовком рапорта в шапке. Сам заголовок документ
+    не делит: к рапорту часто приложены рапорты оперативных сотрудников без регистрации в ЕРДР.
+    Новый рапорт начинается, только если на первых страницах кандидата свой номер ЕРДР, отличный
+    от номера текущего рапорта; остальные страницы остаются в текущем рапорте (приложения).
+    Возвращает список списков страниц - один элемент, если рапорт в PDF один.
+    """
+    starts = [index for index, page_text in enumerate(pages) if index == 0 or has_raport_title(page_text)]
+    parts = []
+    part_erdr = None
+    for start, stop in zip(starts, starts[1:] + [len(pages)]):
+        segment = pages[start:stop]
+        erdr = pre_extract_fields(join_pages(segment[:2])).get("номер_ердр")
+        if parts and not (erdr and part_erdr and erdr != part_erdr):
+            parts[-1].extend(segment)
+            part_erdr = part_erdr or erdr
+        else:
+            parts.append(list(segment))
+            part_erdr = erdr
+    return parts
+
+
+def compact_raport_text(raport_text, max_chars=None):
+    """
+    Сжимает текст для промпта: схлопывает пробелы, пустые строки и линии подчеркиваний
+    (поля для подписи), при необходимости обрезает до max_chars символов.
+    """
+    lines = []
+    for line in raport_text.splitlines():
+        line = _INLINE_SPACES_RE.sub(" ", _UNDERSCORES_RE.sub("___", line)).strip()
+        if line:
+            lines.append(line)
+    compact = "\n".join(lines)
+    if max_chars is not None and len(compact) > max_chars:
+        compact = compact[:max_chars]
+    return compact
+
+
+def _extract_page_range(pdf_path, start, stop):
+    """Текст страниц [start, stop) - задача для пула процессов."""
+    reader = PdfReader(pdf_path)
+    return [reader.pages[index].extract_text() or "" for index in range(start, stop)]
+
+
+def iter_pdf_pages(pdf_path, max_pages=None, processes=1):
+    """
+    Генератор текстов страниц PDF в исходном порядке (пустые страницы - пустые строки).
+    Большие документы (от PARALLEL_MIN_PAGES страниц) при processes > 1 делятся
+    на диапазоны по PAGES_PER_TASK страниц и обрабатываются в пуле процессов;
+    страницы отдаются по мере готовности очередного диапазона.
+    processes=None - по числу CPU.
+    При досрочном закрытии генератора незапущенные диапазоны отменяются.
+    """
+    reader = PdfReader(pdf_path)
+    page_count = len(reader.pages)
+    if max_pages:
+        page_count = min(page_count, max_pages)
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    # Первые страницы (обычно шапка рапорта) читаются в текущем процессе: если потребитель
+    # остановится на них (early_stop), пул процессов даже не запускается.
+    head_count = min(PAGES_PER_TASK, page_count)
+    for index in range(head_count):
+        yield reader.pages[index].extract_text() or ""
+
+    if processes > 1 and page_count >= PARALLEL_MIN_PAGES:
+        ranges = [(start, min(start + PAGES_PER_TASK, page_count))
+                  for start in range(head_count, page_count, PAGES_PER_TASK)]
+        with ProcessPoolExecutor(max_workers=min(processes, len(ranges)),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(_extract_page_range, pdf_path, start, stop) for start, stop in ranges]
+            try:
+                for future in futures:
+                    yield from future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+    else:
+        for index in range(head_count, page_count):
+            yield reader.pages[index].extract_text() or ""
+
+
+def extract_pages_from_pdf(pdf_path, max_pages=None, early_stop=False, processes=1):
+    """
+    Извлекает текст из PDF-файла с помощью pypdf постранично.
+    Это работает только для текстовых PDF, не для сканированных изображений.
+    Возвращает список текстов непустых страниц или None, если текста нет.
+
+    max_pages ограничивает число читаемых страниц. При early_stop чтение прекращается,
+    как только правила нашли все регулярные поля шапки (RULE_FIELDS): шапка и текст рапорта
+    обычно занимают первые страницы, а дальше идут приложения.
+    Вынесено на уровень модуля, чтобы функцию можно было передавать в пул процессов.
+    """
+    try:
+        pages = []
+        found_fields = set()
+        previous_page = ""
+        page_stream = iter_pdf_pages(pdf_path, max_pages=max_pages, processes=processes)
+        try:
+            for page_text in page_stream:
+                # Проверяем, есть ли текст на страницах
+                if page_text:
+                    pages.append(page_text)
+                if early_stop and page_text:
+                    # Вместе с предыдущей страницей, чтобы не потерять поле на стыке страниц
+                    found_fields.update(pre_extract_fields(previous_page + page_text))
+                    previous_page = page_text
+                    if found_fields.issuperset(RULE_FIELDS):
+                        print(f"Шапка рапорта найдена на первых страницах, чтение PDF остановлено "
+                              f"после страницы {len(pages)}.")
+                        break
+        finally:
+            page_stream.close()
+
+        if pages:
+            print("Текст успешно извлечен из PDF с помощью pypdf.")
+            return pages
+        else:
+            print("Не удалось извлечь текст из PDF с помощью pypdf. Возможно, PDF является сканированным изображением или не содержит текстового слоя.")
+            return None
+
+    except Exception as e:
+        print(f"Ошибка при извлечении текста из PDF с помощью pypdf: {e}")
+        print("Убедитесь, что файл PDF не поврежден и не защищен.")
+        return None
+
+
+def join_pages(pages):
+    return "".join(page_text + "\n" for page_text in pages)
+
+
+def extract_text_from_pdf(pdf_path):
+    """
+    Извлекает весь текст PDF-файла одной строкой (страницы разделены переводом строки).
+    """
+    pages = extract_pages_from_pdf(pdf_path)
+    if pages is None:
+        return None
+    return join_pages(pages)
+
+
 # Класс RaportParser теперь будет использовать pypdf для извлечения текста
 class RaportParser:
-    def __init__(self, ollama_model="llama3"):
-        self.ollama_client = OllamaClient(model_name=ollama_model)
+    def __init__(self, ollama_model="llama3", cache=None, stream=False, pre_extract=True, max_prompt_chars=12000,
+                 chunked=True, chunk_workers=2, max_num_ctx=16384, max_pages=None, early_stop=False,
+                 pdf_processes=None, keep_alive=None, warm_up=False, async_llm=False, llm_concurrency=4,
+                 request_timeout=300.0, max_retries=3, host_pool=None, ollama_host=None, draft_model=None,
+                 near_duplicates=None, split_bundles=False):
+        client_settings = dict(model_name=ollama_model, cache=cache, stream=stream, max_num_ctx=max_num_ctx,
+                               keep_alive=keep_alive, host=ollama_host, host_pool=host_pool,
+                               draft_model=draft_model)
+        if async_llm:
+            # Общий пул соединений, лимит одновременных запросов, таймауты и повторы
+            self.ollama_client = AsyncOllamaClient(max_in_flight=llm_concurrency, request_timeout=request_timeout,
+                                                   max_retries=max_retries, **client_settings)
+        else:
+            self.ollama_client = OllamaClient(**client_settings)
+        # Загрузка модели в Ollama идет параллельно с разбором PDF
+        self.warm_up_thread = self.ollama_client.start_warm_up() if warm_up else None
+        self.pre_extract = pre_extract
+        self.max_prompt_chars = max_prompt_chars
+        self.chunked = chunked
+        self.chunk_workers = chunk_workers
+        self.max_pages = max_pages
+        self.early_stop = early_stop
+        self.pdf_processes = pdf_processes
+        self.near_duplicates = near_duplicates
+        self.split_bundles = split_bundles
+        self._llm_slots = None  # limit_llm_requests
 
-    def _extract_text_from_pdf(self, pdf_path):
+    def extraction_key(self):
         """
-        Извлекает текст из PDF-файла с помощью pypdf.
-        Это работает только для текстовых PDF, не для сканированных изображений.
+        Ключ настроек, от которых зависят case_data: модель и промпт извлечения, извлечение правилами
+        (pre_extract), индекс почти одинаковых рапортов (с порогом) и разделение PDF-пакетов.
+        Журнал пакета (core/journal.py) не переиспользует case_data, полученные с другим ключом.
         """
-        text_content = ""
+        near_duplicates = self.near_duplicates.threshold if self.near_duplicates is not None else "off"
+        options = f"pre_extract={int(bool(self.pre_extract))},near_duplicates={near_duplicates}," \
+                  f"split_bundles={int(bool(self.split_bundles))}"
+        return f"{self.ollama_client.model_label}:{self.ollama_client.prompt_fingerprint()}:{options}"
+
+    def close(self):
+        """Освобождает клиент Ollama (цикл событий асинхронного клиента, пул экземпляров)."""
+        self.ollama_client.close()
+
+    def limit_llm_requests(self, max_llm_requests):
+        """
+        Ограничивает число одновременных запросов к Ollama через этот парсер из всех потоков.
+        Слот берется на каждый запрос извлечения, в том числе на каждый фрагмент длинного
+        рапорта и на каждый рапорт PDF-пакета, поэтому лимит соблюдается при любом chunk_workers.
+        """
+        self._llm_slots = threading.Semaphore(max_llm_requests)
+
+    @contextlib.contextmanager
+    def _llm_slot(self):
+        if self._llm_slots is None:
+            yield
+            return
+        with stage("llm_wait"):
+            self._llm_slots.acquire()
         try:
-            reader = PdfReader(pdf_path)
-            # Проверяем, есть ли текст на страницах
-            has_text = False
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text_content += page_text + "\n"
-                    has_text = True
-            
-            if has_text:
-                print("Текст успешно извлечен из PDF с помощью pypdf.")
-                return text_content
-            else:
-                print("Не удалось извлечь текст из PDF с помощью pypdf. Возможно, PDF является сканированным изображением или не содержит текстового слоя.")
-                return None
-
-        except Exception as e:
-            print(f"Ошибка при извлечении текста из PDF с помощью pypdf: {e}")
-            print("Убедитесь, что файл PDF не поврежден и не защищен.")
-            return None
+            yield
+        finally:
+            self._llm_slots.release()
+
+    def _extract_text_from_pdf(self, pdf_path):
+        pages = self._extract_pages_from_pdf(pdf_path)
+        return join_pages(pages) if pages is not None else None
+
+    def _extract_pages_from_pdf(self, pdf_path, processes=None):
+        return extract_pages_from_pdf(pdf_path, max_pages=self.max_pages, early_stop=self.early_stop,
+                                      processes=self.pdf_processes if processes is None else processes)
 
     def parse_raport_pdf_with_llm(self, pdf_path):
         """
         Извлекает текст из PDF с помощью pypdf,
         а затем использует LLM для парсинга данных.
         """
-        raport_text = self._extract_text_from_pdf(pdf_path)
-        
-        if raport_text is None:
+        with stage("pdf"):
+            pages = self._extract_pages_from_pdf(pdf_path)
+
+        if pages is None:
             # Если pypdf не смог извлечь текст, это критично для текущей логики
             print("Прерывание: Не удалось извлечь читаемый текст из PDF.")
             return None
 
         print("Текст из PDF успешно извлечен. Передаю в LLM для структурирования...")
-        case_data = self.ollama_client.extract_case_data(raport_text)
-        
+        return self.parse_raport_text_with_llm(join_pages(pages), pages=pages)
+
+    def split_bundle(self, pages):
+        """Рапорты PDF-пакета (split_raport_bundle) или [pages], если разделение отключено."""
+        return split_raport_bundle(pages) if self.split_bundles else [pages]
+
+    def parse_raport_bundle_pdf_with_llm(self, pdf_path):
+        """
+        Как parse_raport_pdf_with_llm, но PDF может содержать несколько рапортов подряд (split_bundles):
+        каждый рапорт структурируется отдельно, до chunk_workers рапортов одновременно.
+        Возвращает список case_data по рапортам в порядке страниц (None - рапорт не удалось
+        структурировать) или None, если из PDF не удалось извлечь текст.
+        """
+        with stage("pdf"):
+            pages = self._extract_pages_from_pdf(pdf_path)
+        if pages is None:
+            print("Прерывание: Не удалось извлечь читаемый текст из PDF.")
+            return None
+
+        parts = self.split_bundle(pages)
+        if len(parts) == 1:
+            print("Текст из PDF успешно извлечен. Передаю в LLM для структурирования...")
+            return [self.parse_raport_text_with_llm(join_pages(pages), pages=pages)]
+        return self.parse_bundle_parts_with_llm(parts)
+
+    def parse_bundle_parts_with_llm(self, parts):
+        """Структурирует рапорты PDF-пакета (списки страниц) параллельно; возвращает список case_data."""
+        print(f"В PDF найдено рапортов: {len(parts)} (страниц: {', '.join(str(len(part)) for part in parts)}). "
+              f"Каждый рапорт структурируется отдельно.")
+        set_metric("bundle_parts", len(parts))
+        metrics = current_metrics()
+
+        def parse_part(part_pages):
+            with use_metrics(metrics):
+                return self.parse_raport_text_with_llm(join_pages(part_pages), pages=part_pages)
+
+        with ThreadPoolExecutor(max_workers=self.chunk_workers) as pool:
+            return list(pool.map(parse_part, parts))
+
+    def parse_raport_text_with_llm(self, raport_text, pages=None):
+        """
+        Структурирует уже извлеченный текст рапорта с помощью LLM.
+        Используется пакетным режимом, где извлечение текста выполняется в отдельном пуле.
+        Регулярные поля сначала заполняются правилами; LLM получает сжатый текст
+        и запрос только на оставшиеся поля. Если сжатый текст не помещается в max_prompt_chars
+        или в бюджет контекста модели, включается map-reduce режим по фрагментам страниц
+        (см. _extract_chunked).
+        С индексом near_duplicates (core/near_duplicates.py) почти совпадающий с ранее обработанным
+        рапорт получает его case_data, и LLM извлекает только поля, затронутые различиями текстов.
+        """
+        with stage("llm"):
+            return self._parse_raport_text(raport_text, pages)
+
+    def _parse_raport_text(self, raport_text, pages):
+        # Суммируются: рапорты PDF-пакета структурируются в метриках одного документа
+        if pages is not None:
+            add_metric("pages", len(pages))
+        add_metric("chars", len(raport_text))
+        rule_fields = pre_extract_fields(raport_text) if self.pre_extract else {}
+        llm_fields = [field for field in EXTRACTION_FIELDS if field not in rule_fields]
+        if rule_fields:
+            print(f"Поля, извлеченные правилами без LLM: {', '.join(rule_fields)}")
+
+        case_data = {}
+        if self.near_duplicates is not None:
+            words = normalize_words(raport_text)
+            signature = minhash_signature(words)
+            extraction_key = f"{self.ollama_client.model_label}:{self.ollama_client.prompt_fingerprint()}"
+            near_duplicate = self.near_duplicates.find(words, signature, extraction_key)
+            if near_duplicate is not None:
+                previous = near_duplicate["case_data"]
+                case_data = {field: value for field, value in previous.items() if field in llm_fields}
+                llm_fields = changed_fields(near_duplicate["words"], words, previous, llm_fields,
+                                            known_values=rule_fields.values())
+                print(f"Рапорт почти совпадает с ранее обработанным (сходство {near_duplicate['similarity']:.2f}): "
+                      + (f"заново извлекаются поля {', '.join(llm_fields)}" if llm_fields
+                         else "данные перенесены без обращения к LLM"))
+                add_metric("near_duplicate_hits")
+                add_metric("near_duplicate_reused_fields", len(EXTRACTION_FIELDS) - len(rule_fields) - len(llm_fields))
+                set_metric("near_duplicate_similarity", near_duplicate["similarity"])
+
+        if llm_fields:
+            extracted = self._extract_fields(raport_text, pages, llm_fields)
+            case_data = None if extracted is None else {**case_data, **extracted}
+        if case_data is not None:
+            case_data.update(rule_fields)
+            if self.near_duplicates is not None:
+                self.near_duplicates.put(words, signature, extraction_key, case_data)
+
         if case_data:
             print("Данные успешно структурированы LLM.")
         else:
             print("LLM не смог структурировать данные или произошла ошибка.")
 
         return case_data
+
+    def _extract_fields(self, raport_text, pages, fields):
+        prompt_text = compact_raport_text(raport_text)
+        too_long = (len(prompt_text) > self.max_prompt_chars
+                    or not self.ollama_client.request_budget(prompt_text, fields)["fits"])
+        if too_long and self.chunked:
+            return self._extract_chunked(pages or [raport_text], fields)
+        with self._llm_slot():
+            return self.ollama_client.extract_case_data(prompt_text[:self.max_prompt_chars], fields=fields)
+
+    def _extract_chunked(self, pages, fields):
+        """
+        Map-reduce извлечение: перекрывающиеся фрагменты по страницам структурируются
+        параллельно (не более chunk_workers запросов к Ollama и не больше свободных слотов
+        limit_llm_requests), затем сливаются по полям.
+        """
+        compact_pages = [compact_raport_text(page_text) for page_text in pages]
+        chunks = split_pages_into_chunks(compact_pages, self.max_prompt_chars)
+        print(f"Текст рапорта не помещается в один запрос: обработка по фрагментам ({len(chunks)} шт.)")
+
+        metrics = current_metrics()
+
+        def extract_chunk(chunk):
+            with use_metrics(metrics), self._llm_slot():
+                return self.ollama_client.extract_case_data(chunk, fields=fields, fragment=True)
+
+        add_metric("chunks", len(chunks))
+        with ThreadPoolExecutor(max_workers=self.chunk_workers) as pool:
+            partials = list(pool.map(extract_chunk, chunks))
+
+        partials = [partial for partial in partials if partial is not None]
+        if not partials:
+            return None
+        if len(partials) < len(chunks):
+            print(f"Внимание: не удалось структурировать фрагментов - {len(chunks) - len(partials)}.")
+        return merge_partial_case_data(partials, fields)
@@ -1,10 +1,15 @@
 # core/plan_generator.py
 
+import logging
 import re
 import os
 
+from core.action_index import compile_action_index
+from core.methodology import select_methodology, template_stage_durations
 from core.templates import INVESTIGATION_PLAN_ACTIONS
 
+logger = logging.getLogger(__name__)
+
 # Определяем маппинг сроков здесь, напрямую в коде
 # --- ИЗМЕНЕНИЕ: ЗАМЕНА ДЛИННОГО ТИРЕ НА ОБЫЧНЫЙ ДЕФИС В СРОКАХ ---
 PERIOD_MAP = {
@@ -27,15 +32,31 @@ def extract_main_uk_article(uk_article_string):
         return match.group(1)
     return None
 
+
+_action_indexes = {}
+
+
+def get_action_index(methodology=None):
+    """
+    Индекс шаблонов действий для методики (сроки этапов книги методики, переведенные в этапы шаблонов
+    через template_stage_durations, сужают сроки PERIOD_MAP); компилируется один раз на методику.
+    """
+    name = methodology["лист"] if methodology else None
+    index = _action_indexes.get(name)
+    if index is None:
+        durations = {**PERIOD_MAP, **template_stage_durations(methodology, PERIOD_MAP)} if methodology else PERIOD_MAP
+        index = _action_indexes[name] = compile_action_index(INVESTIGATION_PLAN_ACTIONS, durations)
+    return index
+
+
 def generate_investigation_plan(case_data):
     """
     Генерирует детализированный план расследования на основе данных дела,
-    фильтруя действия по статье УК РК и используя предопределенный маппинг для сроков.
+    отбирая действия по статье УК РК (с частью и пунктом) и типу правонарушения
+    через скомпилированный индекс шаблонов. Методика (лист типового плана) выбирается
+    по типу правонарушения; сроки этапов, которых нет в методике, берутся из PERIOD_MAP.
     """
     uk_article_full = case_data.get('статья_ук_рк', 'Н/Д')
-    main_uk_article = extract_main_uk_article(uk_article_full)
-
-    methodology_durations = PERIOD_MAP
 
     actual_investigator_fio = case_data.get('фио_следователя', 'Н/Д')
     actual_investigator_duty = case_data.get('должность_следователя', 'Следователь')
@@ -49,50 +70,24 @@ def generate_investigation_plan(case_data):
 
     actual_registration_date = case_data.get('дата_регистрации_ердр', 'Н/Д')
 
+    offence_type = case_data.get('тип_правонарушения')
+    methodology = select_methodology(offence_type)
+    selected = get_action_index(methodology).select(uk_article_full, offence_type)
+
     filtered_actions = []
-    current_number = 1
-
-    print(f"\n--- Отладка формирования действий плана ---")
-    for action_template in INVESTIGATION_PLAN_ACTIONS:
-        relevant_articles = action_template.get("relevant_articles", [])
-
-        if not relevant_articles or (main_uk_article and main_uk_article in relevant_articles):
-            action_copy = action_template.copy()
-
-            action_copy["номер"] = current_number
-
-            methodology_stage = action_copy.get("methodology_stage")
-            current_srok = ""
-
-            print(f"  Действие #{current_number}: '{action_copy['действие']}'")
-            print(f"    methodology_stage из шаблона: '{methodology_stage}'")
-            print(f"    Проверка наличия '{methodology_stage}' в загруженной методологии: {methodology_stage in methodology_durations if methodology_stage else False}")
-
-            if methodology_stage and methodology_stage in methodology_durations:
-                current_srok = methodology_durations[methodology_stage]
-                print(f"    Срок взят из PERIOD_MAP: '{current_srok}'")
-            elif action_copy.get("срок"):
-                current_srok = action_copy.get("срок")
-                print(f"    Срок взят из шаблона (специфичный): '{current_srok}'")
-            else:
-                current_srok = actual_registration_date
-                print(f"    Дефолтный срок (дата ЕРДР): '{current_srok}'")
-            
-            action_copy["срок"] = current_srok # <--- Убедитесь, что это кириллическая 'с'
-
-            current_ispolnitel = ""
-            if action_copy.get("исполнитель"):
-                current_ispolnitel = action_copy.get("исполнитель")
-                print(f"    Исполнитель из шаблона: '{current_ispolnitel}'")
-            else:
-                current_ispolnitel = actual_investigator_full
-                print(f"    Исполнитель по умолчанию (из рапорта): '{current_ispolnitel}'")
-            
-            action_copy["исполнитель"] = current_ispolnitel
-
-            filtered_actions.append(action_copy)
-            current_number += 1
-    print(f"--- Конец отладки формирования действий плана ---\n")
+    debug = logger.isEnabledFor(logging.DEBUG)
+    if debug:
+        logger.debug("Формирование действий плана: методика '%s', статья '%s', действий - %d",
+                     methodology['лист'] if methodology else 'PERIOD_MAP', uk_article_full, len(selected))
+    for current_number, (_, template, _, _, srok, srok_source) in enumerate(selected, start=1):
+        action = dict(template)
+        action["номер"] = current_number
+        action["срок"] = srok if srok is not None else actual_registration_date
+        action["исполнитель"] = template.get("исполнитель") or actual_investigator_full
+        if debug:
+            logger.debug("  Действие #%d: '%s' - срок (%s): '%s', исполнитель: '%s'", current_number,
+                         action['действие'], srok_source, action['срок'], action['исполнитель'])
+        filtered_actions.append(action)
 
     plan_title_info = {
         "номер_дела": case_data.get('номер_ердр', '_______'),
@@ -103,5 +98,6 @@ def generate_investigation_plan(case_data):
 
     return {
         "plan_title_info": plan_title_info,
-        "actions": filtered_actions
+        "actions": filtered_actions,
+        "methodology": methodology["лист"] if methodology else None,
     }
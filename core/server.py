@@ -0,0 +1,336 @@
+# core/server.py
+
+import contextlib
+import hashlib
+import io
+import json
+import os
+import signal
+import socketserver
+import stat
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core.llm_utils import EXTRACTION_FIELDS, validate_case_data
+from core.metrics import document_metrics, stage
+from core.methodology import get_methodology_registry
+from core.parser import extract_pages_from_pdf, join_pages
+from core.plan_generator import generate_investigation_plan, get_action_index
+from utils.doc_formatter import render_plan_docx
+
+# Локальный сервис генерации планов для других инструментов: вместо запуска cli/main.py на каждый
+# документ и чтения .docx с диска - HTTP по TCP или Unix-сокету. Процесс держит в памяти клиент Ollama
+# (модель остается прогретой), скомпилированные индексы шаблонов действий и скелет документа.
+#
+#   POST /v1/case-data  PDF рапорта (тело запроса)  -> массив case_data (JSON) - по одному на рапорт
+#                                                      (в PDF-пакете их несколько)
+#   POST /v1/plan       case_data (JSON)            -> план расследования (JSON)
+#   POST /v1/docx       план (JSON)                 -> .docx (bytes, собирается в памяти)
+#   GET  /v1/health     модель, число запросов в работе и объединенных запросов
+#
+# Одинаковые одновременные запросы (тот же эндпоинт и то же содержимое по sha256) объединяются:
+# вычисление выполняется один раз, остальные запросы ждут его результат. Готовые результаты
+# не хранятся - повторное извлечение того же рапорта обслуживает кэш LLM (core/cache.py).
+
+MAX_BODY_BYTES = 64 * 1024 * 1024
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+JSON_CONTENT_TYPE = "application/json; charset=utf-8"
+
+
+class ServiceError(Exception):
+    """Ошибка запроса к сервису с HTTP-статусом ответа."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class RequestCoalescer:
+    """
+    Объединяет одинаковые одновременные вычисления: первый запрос с ключом выполняет compute,
+    остальные, пришедшие до его завершения, получают тот же результат (или то же исключение).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}  # ключ -> Future
+
+    def run(self, key, compute):
+        """Возвращает (результат, True, если результат получен от другого запроса)."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            return future.result(), True
+        try:
+            result = compute()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+
+def preload_plan_templates():
+    """Компилирует индексы шаблонов действий всех методик и загружает скелет документа заранее."""
+    get_action_index()
+    for methodology in get_methodology_registry()["methodologies"].values():
+        get_action_index(methodology)
+    render_plan_docx({})
+
+
+def _json_bytes(value):
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def _parse_json_object(body, name):
+    try:
+        value = json.loads(body)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ServiceError(400, f"тело запроса не является JSON: {e}") from None
+    if not isinstance(value, dict):
+        raise ServiceError(400, f"ожидается JSON-объект {name}")
+    return value
+
+
+def _parse_case_data(body):
+    """case_data для /v1/plan: значения полей приводятся как ответ модели (validate_case_data)."""
+    case_data = _parse_json_object(body, "case_data")
+    # Отсутствующие поля план заменяет значениями по умолчанию; переданные должны быть непустыми строками
+    failing = validate_case_data(case_data, [field for field in EXTRACTION_FIELDS if field in case_data])
+    if failing:
+        raise ServiceError(400, f"поля case_data должны быть непустыми строками: {', '.join(failing)}")
+    return case_data
+
+
+def _is_text_mapping(value):
+    return isinstance(value, dict) and all(
+        isinstance(item, (str, int, float)) and not isinstance(item, bool) for item in value.values())
+
+
+def _parse_plan(body):
+    """План для /v1/docx: plan_title_info - объект, actions - массив объектов со строковыми полями."""
+    plan = _parse_json_object(body, "плана")
+    actions = plan.get("actions", [])
+    if not _is_text_mapping(plan.get("plan_title_info", {})) or not isinstance(actions, list) \
+            or not all(_is_text_mapping(action) for action in actions):
+        raise ServiceError(400, 'ожидается план вида {"plan_title_info": {поле: строка}, '
+                                '"actions": [{поле: строка}, ...]}')
+    return plan
+
+
+class PlanService:
+    """
+    Обработчики эндпоинтов, общие для всех соединений сервера.
+    Как и в DocumentPipeline, одновременно к Ollama обращаются не больше max_llm_requests запросов,
+    считая каждый фрагмент длинного рапорта (parser.limit_llm_requests).
+    metrics_sink - core.metrics.MetricsSink: метрики этапов по каждому вычисленному запросу.
+    """
+
+    def __init__(self, parser, max_llm_requests=1, metrics_sink=None):
+        self.parser = parser
+        self.metrics_sink = metrics_sink
+        self.model = parser.ollama_client.model_label
+        parser.limit_llm_requests(max_llm_requests)
+        self._coalescer = RequestCoalescer()
+        # Эндпоинт -> (обработчик, разбор и проверка JSON-тела; None - тело передается как есть)
+        self._routes = {
+            "/v1/case-data": (self._case_data, None),
+            "/v1/plan": (self._plan, _parse_case_data),
+            "/v1/docx": (self._docx, _parse_plan),
+        }
+        self._stats_lock = threading.Condition()
+        self.active = 0
+        self.coalesced = 0
+
+    def _case_data(self, pdf_bytes):
+        with stage("pdf"):
+            pages = extract_pages_from_pdf(io.BytesIO(pdf_bytes), max_pages=self.parser.max_pages,
+                                           early_stop=self.parser.early_stop, processes=1)
+        if pages is None:
+            raise ServiceError(422, "не удалось извлечь текст из PDF")
+        parts = self.parser.split_bundle(pages)
+        if len(parts) > 1:
+            raports = self.parser.parse_bundle_parts_with_llm(parts)
+        else:
+            raports = [self.parser.parse_raport_text_with_llm(join_pages(pages), pages=pages)]
+        failed = [str(number) for number, case_data in enumerate(raports, start=1) if case_data is None]
+        if failed:
+            raise ServiceError(422, "LLM не смог структурировать данные"
+                               + (f" рапортов {', '.join(failed)}" if len(raports) > 1 else ""))
+        return JSON_CONTENT_TYPE, _json_bytes(raports)
+
+    def _plan(self, case_data):
+        with stage("plan"):
+            investigation_plan = generate_investigation_plan(case_data)
+        return JSON_CONTENT_TYPE, _json_bytes(investigation_plan)
+
+    def _docx(self, investigation_plan):
+        with stage("render"):
+            return DOCX_CONTENT_TYPE, render_plan_docx(investigation_plan)
+
+    def health(self):
+        return {"status": "ok", "model": self.model, "active": self.active, "coalesced": self.coalesced}
+
+    def dispatch(self, path, body):
+        """
+        Выполняет запрос к эндпоинту path с телом body.
+        Возвращает (content_type, тело ответа, объединен ли запрос с уже выполняющимся).
+        """
+        route = self._routes.get(path)
+        if route is None:
+            raise ServiceError(404, f"неизвестный эндпоинт: {path}")
+        handler, parse = route
+        if parse is not None:
+            argument = parse(body)
+            # Ключ по каноническому JSON: порядок ключей и форматирование не мешают объединению
+            content = json.dumps(argument, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        else:
+            argument = content = body
+        digest = hashlib.sha256(path.encode("utf-8") + b"\0" + content).hexdigest()
+
+        def compute():
+            with document_metrics(f"{path} sha256:{digest[:16]}", self.metrics_sink) as metrics:
+                response = handler(argument)
+                metrics.set("status", "ok")
+                return response
+
+        (content_type, response), coalesced = self._coalescer.run(digest, compute)
+        if coalesced:
+            with self._stats_lock:
+                self.coalesced += 1
+        return content_type, response, coalesced
+
+    @contextlib.contextmanager
+    def in_flight(self):
+        """Учитывает запрос в работе - от чтения тела до отправки ответа (см. wait_idle)."""
+        with self._stats_lock:
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self._stats_lock:
+                self.active -= 1
+                self._stats_lock.notify_all()
+
+    def wait_idle(self, timeout=None):
+        """Ждет завершения запросов в работе; False, если не дождались за timeout секунд."""
+        with self._stats_lock:
+            return self._stats_lock.wait_for(lambda: self.active == 0, timeout)
+
+
+class PlanRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # соединение переиспользуется для следующих запросов клиента
+    service = None  # задается в make_server
+
+    def address_string(self):
+        # У соединений через Unix-сокет нет адреса клиента
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        self._send(status, JSON_CONTENT_TYPE, _json_bytes({"error": message}))
+
+    def do_GET(self):
+        if self.path == "/v1/health":
+            self._send(200, JSON_CONTENT_TYPE, _json_bytes(self.service.health()))
+        else:
+            self._send_error(404, f"неизвестный эндпоинт: {self.path}")
+
+    def do_POST(self):
+        length = self.headers.get("Content-Length")
+        if length is None or not length.isdigit():
+            # Тело без длины (chunked) не читается - соединение нельзя использовать дальше
+            self.close_connection = True
+            self._send_error(411, "требуется заголовок Content-Length")
+            return
+        if int(length) > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send_error(413, f"тело запроса больше {MAX_BODY_BYTES} байт")
+            return
+        with self.service.in_flight():
+            body = self.rfile.read(int(length))
+            try:
+                content_type, response, coalesced = self.service.dispatch(self.path, body)
+            except ServiceError as e:
+                self._send_error(e.status, str(e))
+                return
+            except Exception as e:
+                print(f"Ошибка обработки запроса {self.path}: {e}")
+                self._send_error(500, str(e) or e.__class__.__name__)
+                return
+            headers = {"X-Coalesced": "1" if coalesced else "0"}
+            if content_type == DOCX_CONTENT_TYPE:
+                headers["Content-Disposition"] = 'attachment; filename="plan.docx"'
+            self._send(200, content_type, response, headers)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """HTTP-сервер на Unix-сокете: доступ ограничивается правами на файл сокета."""
+
+    daemon_threads = True
+
+    def server_bind(self):
+        # Сокет, оставшийся от аварийно завершенного процесса, мешает bind
+        try:
+            if stat.S_ISSOCK(os.stat(self.server_address).st_mode):
+                os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+        super().server_bind()
+        os.chmod(self.server_address, 0o660)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+
+
+def make_server(service, host="127.0.0.1", port=8765, unix_socket=None):
+    """Сервер для service: на Unix-сокете unix_socket или на host:port (port=0 - свободный порт)."""
+    handler = type("Handler", (PlanRequestHandler,), {"service": service})
+    if unix_socket:
+        return ThreadingUnixHTTPServer(unix_socket, handler)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def run_server(server, service, drain_timeout=60.0):
+    """
+    Обслуживает запросы до SIGTERM/SIGINT (вызывать из главного потока). После сигнала новые соединения
+    не принимаются, а запросы в работе дообрабатываются (не дольше drain_timeout секунд).
+    """
+    def handle_signal(signum, frame):
+        # shutdown() ждет выхода из serve_forever - из обработчика сигнала в том же потоке его вызывать нельзя
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    previous_handlers = {signum: signal.signal(signum, handle_signal) for signum in (signal.SIGTERM, signal.SIGINT)}
+    try:
+        server.serve_forever()
+    finally:
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+        if not service.wait_idle(drain_timeout):
+            print(f"Запросы в работе не завершились за {drain_timeout:g} с.")
+        server.server_close()
@@ -0,0 +1,152 @@
+# core/sidecar.py
+
+import datetime
+import glob
+import hashlib
+import json
+import os
+
+# Рядом с каждым .docx сохраняется JSON-файл с извлеченными case_data ("<имя>.case.json").
+# По нему команда rerender пересобирает план без PDF и LLM - после изменения шаблонов действий,
+# PERIOD_MAP, методики или макета документа. В файле хранится хэш входных данных последней
+# сборки, поэтому пересобираются только документы, у которых что-то действительно изменилось.
+
+SIDECAR_FORMAT = "plan_llm.case_data"
+SIDECAR_VERSION = 1
+SIDECAR_SUFFIX = ".case.json"
+
+# Исходники, от которых зависит план и документ (помимо данных шаблонов и методики)
+_PLAN_SOURCES = ("core/plan_generator.py", "core/action_index.py", "core/methodology.py")
+_RENDERER_SOURCES = ("utils/doc_formatter.py",)
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class SidecarError(ValueError):
+    """Файл case_data не читается или имеет неподдерживаемую версию."""
+
+
+def sidecar_path_for(docx_path):
+    return f"{os.path.splitext(docx_path)[0]}{SIDECAR_SUFFIX}"
+
+
+def docx_path_for(sidecar_path):
+    return f"{sidecar_path[:-len(SIDECAR_SUFFIX)]}.docx"
+
+
+def _now():
+    return datetime.datetime.now().astimezone().isoformat(timespec="seconds")
+
+
+def _sha256_json(value):
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _sha256_sources(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(os.path.join(_REPO_ROOT, path), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def render_fingerprints():
+    """
+    Хэши входных данных сборки, не зависящих от конкретного дела:
+    шаблоны действий и PERIOD_MAP (с кодом формирования плана), методика, макет документа.
+    """
+    from core.methodology import get_methodology_registry
+    from core.plan_generator import PERIOD_MAP
+    from core.templates import INVESTIGATION_PLAN_ACTIONS
+    from utils.doc_formatter import skeleton_fingerprint
+
+    source = get_methodology_registry()["source"]
+    return {
+        "templates": _sha256_json([INVESTIGATION_PLAN_ACTIONS, PERIOD_MAP, _sha256_sources(_PLAN_SOURCES)]),
+        "methodology": source["sha256"] if source else None,
+        "renderer": _sha256_json([skeleton_fingerprint(), _sha256_sources(_RENDERER_SOURCES)]),
+    }
+
+
+def render_inputs_hash(case_data, fingerprints):
+    return _sha256_json({"case_data": _sha256_json(case_data), **fingerprints})
+
+
+def _write_json(path, value):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(value, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def write_sidecar(docx_path, case_data, source_pdf=None, model=None, fingerprints=None):
+    """Сохраняет case_data рядом с только что собранным docx_path. Возвращает путь к файлу."""
+    fingerprints = fingerprints or render_fingerprints()
+    now = _now()
+    sidecar = {
+        "format": SIDECAR_FORMAT,
+        "version": SIDECAR_VERSION,
+        "case_data": case_data,
+        "source": {"pdf": source_pdf, "model": model, "extracted_at": now},
+        "rendered": {"inputs_hash": render_inputs_hash(case_data, fingerprints), "rendered_at": now},
+    }
+    path = sidecar_path_for(docx_path)
+    _write_json(path, sidecar)
+    return path
+
+
+def load_sidecar(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            sidecar = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SidecarError(f"не удалось прочитать {path}: {e}") from e
+    if not isinstance(sidecar, dict) or sidecar.get("format") != SIDECAR_FORMAT:
+        raise SidecarError(f"{path} не является файлом case_data")
+    if sidecar.get("version", 0) > SIDECAR_VERSION:
+        raise SidecarError(f"{path}: версия {sidecar.get('version')} новее поддерживаемой ({SIDECAR_VERSION})")
+    if not isinstance(sidecar.get("case_data"), dict):
+        raise SidecarError(f"{path}: нет case_data")
+    return sidecar
+
+
+def collect_sidecars(inputs):
+    """Раскрывает директории, glob-шаблоны и пути в отсортированный список файлов case_data."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = glob.glob(os.path.join(item, f"*{SIDECAR_SUFFIX}"))
+        else:
+            candidates = glob.glob(item, recursive=True)
+        for path in candidates:
+            if os.path.isfile(path) and path.endswith(SIDECAR_SUFFIX):
+                paths.append(os.path.abspath(path))
+    return sorted(set(paths))
+
+
+def rerender_sidecar(path, fingerprints, force=False, verify=False):
+    """
+    Пересобирает документ по файлу case_data, если изменились входные данные сборки
+    или документа нет. Возвращает {"sidecar", "output", "status": "rendered" | "unchanged" | "error", "error"}.
+    """
+    from core.plan_generator import generate_investigation_plan
+    from utils.doc_formatter import create_investigation_plan_doc
+
+    output = docx_path_for(path)
+    result = {"sidecar": path, "output": output, "status": "error", "error": None}
+    try:
+        sidecar = load_sidecar(path)
+        inputs_hash = render_inputs_hash(sidecar["case_data"], fingerprints)
+        rendered = sidecar.get("rendered") or {}
+        if not force and rendered.get("inputs_hash") == inputs_hash and os.path.exists(output):
+            result["status"] = "unchanged"
+            return result
+
+        investigation_plan = generate_investigation_plan(sidecar["case_data"])
+        create_investigation_plan_doc(investigation_plan, output, verify=verify)
+        sidecar["version"] = SIDECAR_VERSION
+        sidecar["rendered"] = {"inputs_hash": inputs_hash, "rendered_at": _now()}
+        _write_json(path, sidecar)
+        result["status"] = "rendered"
+    except Exception as e:
+        result["error"] = str(e) or e.__class__.__name__
+    return result
@@ -1,5 +1,8 @@
 # core/templates.py
 
+# Условия отбора действий ("relevant_articles" со статьей, частью и пунктом, "relevant_types")
+# описаны в core/action_index.py; шаблоны компилируются в индекс один раз при первом формировании плана.
+
 INVESTIGATION_PLAN_ACTIONS = [
     {
         "действие": "Установить сумму преступного доход (сумма хищения, сумма дохода, стоимость имущество (товаров) и т.д.)",
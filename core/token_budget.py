@@ -0,0 +1,86 @@
+# core/token_budget.py
+
+import math
+import re
+
+# Грубая оценка числа токенов без загрузки токенизатора модели.
+# Для llama3-подобных BPE-словарей кириллица заметно "дороже" латиницы:
+# в среднем ~2.5 символа кириллицы, ~4 символа латиницы и ~3 цифры на токен,
+# знаки препинания и прочие символы считаем отдельными токенами.
+_CYRILLIC_RE = re.compile(r"[А-Яа-яЁёӘәҒғҚқҢңӨөҰұҮүҺһІі]")
+_LATIN_RE = re.compile(r"[A-Za-z]")
+_DIGIT_RE = re.compile(r"\d")
+_SPACE_RE = re.compile(r"\s")
+
+CHARS_PER_TOKEN_CYRILLIC = 2.5
+CHARS_PER_TOKEN_LATIN = 4.0
+CHARS_PER_TOKEN_DIGITS = 3.0
+ESTIMATE_SAFETY_MARGIN = 1.1
+
+# Размеры контекста округляются до фиксированных ступеней: Ollama перезагружает модель
+# при каждой смене num_ctx, поэтому произвольные значения приводили бы к постоянным перезагрузкам.
+NUM_CTX_BUCKETS = (2048, 4096, 8192, 16384, 32768, 65536, 131072)
+# Загруженный контекст уменьшается, когда запросу хватает его половины (см. plan_request_budget):
+# одна перезагрузка модели дешевле, чем обработка всех следующих запросов с лишним контекстом.
+SHRINK_RATIO = 2
+
+# Ожидаемый объем ответа по полям (в токенах значения) для расчета num_predict
+FIELD_OUTPUT_TOKENS = {
+    "суть_правонарушения": 400,
+    "должность_следователя": 60,
+    "фигуранты": 120,
+    "дополнительные_сведения": 120,
+}
+DEFAULT_FIELD_OUTPUT_TOKENS = 30
+FIELD_KEY_TOKENS = 12  # имя поля на кириллице, кавычки, двоеточие, запятая
+OUTPUT_HEADROOM = 1.5
+MIN_NUM_PREDICT = 128
+
+
+def estimate_tokens(text):
+    """Оценивает число токенов текста (с запасом ESTIMATE_SAFETY_MARGIN)."""
+    cyrillic = _CYRILLIC_RE.subn("", text)[1]
+    latin = _LATIN_RE.subn("", text)[1]
+    digits = _DIGIT_RE.subn("", text)[1]
+    spaces = _SPACE_RE.subn("", text)[1]
+    other = len(text) - cyrillic - latin - digits - spaces
+    tokens = (cyrillic / CHARS_PER_TOKEN_CYRILLIC + latin / CHARS_PER_TOKEN_LATIN
+              + digits / CHARS_PER_TOKEN_DIGITS + other)
+    return math.ceil(tokens * ESTIMATE_SAFETY_MARGIN)
+
+
+def estimate_output_tokens(fields):
+    """Ожидаемый размер JSON-ответа с указанными полями."""
+    return sum(FIELD_KEY_TOKENS + FIELD_OUTPUT_TOKENS.get(field, DEFAULT_FIELD_OUTPUT_TOKENS)
+               for field in fields)
+
+
+def plan_request_budget(prompt, fields, max_num_ctx, current_num_ctx=None):
+    """
+    Подбирает параметры запроса под длину промпта и ожидаемый ответ.
+    Возвращает словарь {"num_ctx", "num_predict", "prompt_tokens", "fits"}.
+
+    current_num_ctx - контекст, с которым модель уже загружена этим клиентом:
+    если его хватает, он переиспользуется, чтобы не вызывать перезагрузку модели. Исключение -
+    контекст, больший нужного в SHRINK_RATIO и более раз: тогда выбирается меньшая ступень, иначе после
+    одного длинного рапорта (или прогрева) все короткие выполнялись бы с избыточным контекстом.
+    Если промпт не помещается в max_num_ctx, num_ctx ограничивается max_num_ctx,
+    num_predict урезается до остатка, а fits=False.
+    """
+    prompt_tokens = estimate_tokens(prompt)
+    num_predict = max(math.ceil(estimate_output_tokens(fields) * OUTPUT_HEADROOM), MIN_NUM_PREDICT)
+    required = prompt_tokens + num_predict
+
+    if current_num_ctx and required <= current_num_ctx <= max_num_ctx and required * SHRINK_RATIO > current_num_ctx:
+        return {"num_ctx": current_num_ctx, "num_predict": num_predict,
+                "prompt_tokens": prompt_tokens, "fits": True}
+
+    for bucket in NUM_CTX_BUCKETS:
+        if bucket > max_num_ctx:
+            break
+        if required <= bucket:
+            return {"num_ctx": bucket, "num_predict": num_predict,
+                    "prompt_tokens": prompt_tokens, "fits": True}
+
+    return {"num_ctx": max_num_ctx, "num_predict": max(max_num_ctx - prompt_tokens, MIN_NUM_PREDICT),
+            "prompt_tokens": prompt_tokens, "fits": False}
@@ -0,0 +1,244 @@
+# core/watch.py
+
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import signal
+import threading
+import time
+
+# Режим наблюдения за директориями: резидентный процесс подхватывает новые PDF-рапорты
+# из входных директорий и передает их в тот же конвейер, что и пакетный режим (DocumentPipeline).
+# Модель Ollama остается загруженной, а интерпретатор и зависимости не запускаются заново на каждый документ.
+#
+# inotify (Linux) используется только как сигнал "в директории что-то изменилось"; без него
+# (другая ОС, исчерпан лимит наблюдателей) директории опрашиваются раз в poll_interval секунд.
+# Файл считается дописанным, когда его размер и время изменения не меняются settle_seconds:
+# копирование по сети или сканер может закрывать файл несколько раз до завершения записи.
+
+# Флаги inotify из <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+
+
+def _open_inotify(directories):
+    """Дескриптор inotify, наблюдающий за directories, или None, если inotify недоступен."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    for directory in directories:
+        if libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) < 0:
+            os.close(fd)
+            return None
+    return fd
+
+
+class FolderWatcher:
+    """Находит во входных директориях новые или измененные PDF, запись которых завершена."""
+
+    def __init__(self, directories, settle_seconds=2.0, poll_interval=5.0, use_inotify=True):
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self._inotify_fd = _open_inotify(self.directories) if use_inotify else None
+        self._pending = {}  # путь -> (размер, время изменения, с какого момента не меняется)
+        self._submitted = {}  # путь -> (размер, время изменения) при постановке в очередь
+        self._retry_at = {}  # путь -> когда повторить обработку, завершившуюся ошибкой
+
+    @property
+    def uses_inotify(self):
+        return self._inotify_fd is not None
+
+    def wait(self, timeout, wake_fd=None):
+        """Ждет изменения в директориях (inotify), данных в wake_fd или истечения timeout."""
+        fds = [fd for fd in (self._inotify_fd, wake_fd) if fd is not None]
+        if not fds:
+            time.sleep(timeout)
+            return
+        readable, _, _ = select.select(fds, [], [], timeout)
+        if self._inotify_fd in readable:
+            # Содержимое событий не нужно: после пробуждения директории сканируются целиком
+            try:
+                while os.read(self._inotify_fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def _list_pdfs(self):
+        for directory in self.directories:
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.name.lower().endswith(".pdf"):
+                    continue
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        yield entry.path, (stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    continue  # файл удален между листингом и stat
+
+    def scan(self, now=None):
+        """
+        Возвращает PDF, готовые к обработке: новые или измененные с момента постановки в очередь
+        и не менявшиеся settle_seconds. Пока файл дописывается, он остается в ожидании.
+        """
+        now = time.monotonic() if now is None else now
+        ready = []
+        present = set()
+        for path, signature in self._list_pdfs():
+            present.add(path)
+            if self._submitted.get(path) == signature:
+                if path in self._retry_at and now >= self._retry_at[path]:
+                    del self._retry_at[path]
+                    ready.append(path)
+                continue
+            self._retry_at.pop(path, None)
+            if signature[0] == 0:
+                continue
+            pending = self._pending.get(path)
+            if pending is None or pending[:2] != signature:
+                self._pending[path] = (*signature, now)
+            elif now - pending[2] >= self.settle_seconds:
+                ready.append(path)
+        for path in [path for path in self._pending if path not in present]:
+            del self._pending[path]
+        return sorted(ready)
+
+    def mark_submitted(self, path):
+        pending = self._pending.pop(path, None)
+        if pending is not None:
+            self._submitted[path] = pending[:2]
+
+    def retry_later(self, path, delay):
+        """Повторить обработку неизмененного файла не раньше чем через delay секунд (например, после сбоя Ollama)."""
+        self._retry_at[path] = time.monotonic() + delay
+
+    def next_timeout(self):
+        """Сколько ждать следующего сканирования: меньше, если есть файлы в ожидании завершения записи."""
+        if self._pending:
+            return min(self.poll_interval, self.settle_seconds / 2)
+        return self.poll_interval
+
+    def close(self):
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+
+
+def run_watch(watcher, pipeline, consumers, queue_size=16, keep_warm_interval=None, retry_interval=300.0,
+              on_result=None):
+    """
+    Главный цикл режима наблюдения (вызывать из главного потока - устанавливает обработчики сигналов).
+    Готовые PDF помещаются в ограниченную очередь (queue_size), которую разбирают consumers потоков
+    через pipeline.process. Пока очередь заполнена, новые файлы не принимаются (обратное давление) -
+    они будут подхвачены следующими сканированиями.
+    По SIGTERM/SIGINT прием новых файлов прекращается, а уже поставленные в очередь документы
+    дообрабатываются; повторный сигнал прерывает ожидание очереди (документы в работе все равно завершаются).
+    keep_warm_interval - раз в сколько секунд простоя (очередь пуста, документов в работе нет)
+    продлевать keep_alive модели в Ollama (keep_warm - с тем же num_ctx, без перезагрузки),
+    чтобы она не выгружалась между рапортами.
+    Документ, обработка которого завершилась ошибкой, повторяется через retry_interval секунд
+    (с журналом - с последнего завершенного этапа) или сразу после изменения файла.
+    on_result(result) вызывается из потоков-обработчиков для каждого документа.
+    """
+    work = queue.Queue(maxsize=queue_size)
+    stopping = threading.Event()
+    aborting = threading.Event()
+    # Время окончания последнего документа и число документов в очереди и в работе: продление
+    # keep_alive в простое не должно совпадать с обработкой длинного документа
+    activity_lock = threading.Lock()
+    last_activity = [time.monotonic()]
+    in_flight = [0]
+    failed = queue.SimpleQueue()  # ошибки из потоков-обработчиков; состояние watcher меняет только главный поток
+    # Сигнал прерывает ожидание изменений в директориях сразу, а не по истечении poll_interval
+    wake_read, wake_write = os.pipe()
+
+    def handle_signal(signum, frame):
+        os.write(wake_write, b"\0")
+        if stopping.is_set():
+            aborting.set()
+            print("Повторный сигнал: очередь не дообрабатывается, ожидание документов в работе.")
+        else:
+            stopping.set()
+            print(f"Получен сигнал завершения: дообработка очереди ({work.qsize()} шт.) и выход.")
+
+    previous_handlers = {signum: signal.signal(signum, handle_signal) for signum in (signal.SIGTERM, signal.SIGINT)}
+
+    def consume():
+        while True:
+            pdf_path = work.get()
+            try:
+                if pdf_path is None:
+                    return
+                if aborting.is_set():
+                    with activity_lock:
+                        in_flight[0] -= 1
+                    continue
+                try:
+                    result = pipeline.process(pdf_path)
+                finally:
+                    with activity_lock:
+                        in_flight[0] -= 1
+                        last_activity[0] = time.monotonic()
+                if result["status"] != "ok":
+                    failed.put(pdf_path)
+                if on_result is not None:
+                    on_result(result)
+            finally:
+                work.task_done()
+
+    threads = [threading.Thread(target=consume, name=f"watch-worker-{index}", daemon=True)
+               for index in range(consumers)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while not stopping.is_set():
+            while not failed.empty():
+                watcher.retry_later(failed.get(), retry_interval)
+            for pdf_path in watcher.scan():
+                # Блокирующая постановка с проверкой сигнала: очередь - предел документов в ожидании.
+                # Документ учитывается в in_flight до постановки, чтобы не было момента, когда
+                # обработчик уже взял его из очереди, а счетчик еще не увеличен
+                with activity_lock:
+                    in_flight[0] += 1
+                while not stopping.is_set():
+                    try:
+                        work.put(pdf_path, timeout=0.5)
+                    except queue.Full:
+                        continue
+                    watcher.mark_submitted(pdf_path)
+                    break
+                else:
+                    with activity_lock:
+                        in_flight[0] -= 1
+            if keep_warm_interval:
+                with activity_lock:
+                    idle = in_flight[0] == 0 and time.monotonic() - last_activity[0] >= keep_warm_interval
+                    if idle:
+                        last_activity[0] = time.monotonic()
+                if idle:
+                    threading.Thread(target=pipeline.parser.ollama_client.keep_warm, name="ollama-keep-warm",
+                                     daemon=True).start()
+            watcher.wait(watcher.next_timeout(), wake_read)
+    finally:
+        # Маркеры завершения ставятся после оставшихся документов очереди
+        for _ in threads:
+            work.put(None)
+        for thread in threads:
+            thread.join()
+        watcher.close()
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+        os.close(wake_read)
+        os.close(wake_write)
@@ -0,0 +1,7 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# Тесты запускаются из корня репозитория или из tests/: пакеты core, cli и utils - в корне
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,67 @@
+# tests/test_cache.py
+
+import itertools
+
+import core.cache
+from core.cache import ExtractionCache, make_cache_key
+
+
+def _fake_clock(monkeypatch, start=1_000_000.0):
+    ticks = itertools.count(start)
+    monkeypatch.setattr(core.cache.time, "time", lambda: next(ticks))
+
+
+def test_cache_key_depends_on_text_model_and_prompt():
+    key = make_cache_key("текст", "llama3", "prompt")
+    assert key == make_cache_key("текст", "llama3", "prompt")
+    assert key != make_cache_key("текст2", "llama3", "prompt")
+    assert key != make_cache_key("текст", "qwen2", "prompt")
+    assert key != make_cache_key("текст", "llama3", "prompt2")
+
+
+def test_put_and_get_round_trip(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache.sqlite3"))
+    cache.put("key", "llama3", {"номер_ердр": "237100121000075"})
+    assert cache.get("key") == {"номер_ердр": "237100121000075"}
+    assert cache.get("missing") is None
+
+
+def test_evicts_least_recently_used_entries(tmp_path, monkeypatch):
+    _fake_clock(monkeypatch)
+    cache = ExtractionCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.put("first", "llama3", {"поле": "1"})
+    cache.put("second", "llama3", {"поле": "2"})
+    assert cache.get("first") is not None  # first становится самой свежей записью
+    cache.put("third", "llama3", {"поле": "3"})
+
+    assert cache.get("second") is None
+    assert cache.get("first") == {"поле": "1"}
+    assert cache.get("third") == {"поле": "3"}
+
+
+def test_evicts_by_total_size(tmp_path, monkeypatch):
+    _fake_clock(monkeypatch)
+    cache = ExtractionCache(str(tmp_path / "cache.sqlite3"), max_bytes=300)
+    for index in range(3):
+        cache.put(f"key{index}", "llama3", {"поле": "x" * 100})
+
+    assert cache.get("key0") is None
+    assert cache.get("key1") is not None
+    assert cache.get("key2") is not None
+
+
+def test_expired_entries_are_not_returned(tmp_path, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(core.cache.time, "time", lambda: now[0])
+    cache = ExtractionCache(str(tmp_path / "cache.sqlite3"), max_age_days=1)
+    cache.put("key", "llama3", {"поле": "1"})
+    now[0] += 2 * 24 * 3600
+    assert cache.get("key") is None
+
+
+def test_clear_removes_all_entries(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache.sqlite3"))
+    cache.put("a", "llama3", {})
+    cache.put("b", "llama3", {})
+    assert cache.clear() == 2
+    assert cache.get("a") is None
@@ -0,0 +1,39 @@
+# tests/test_chunking.py
+
+from core.chunking import merge_partial_case_data, split_pages_into_chunks
+
+
+def test_merge_applies_field_rules():
+    partials = [
+        {"номер_ердр": "Н/Д", "суть_правонарушения": "короткое", "фигуранты": "Иванов А.С."},
+        {"номер_ердр": "237100121000075", "суть_правонарушения": "более полное описание",
+         "фигуранты": "Петров Б.В."},
+        {"номер_ердр": "237100121000076", "суть_правонарушения": "", "фигуранты": "Иванов А.С."},
+    ]
+    merged = merge_partial_case_data(partials, ["номер_ердр", "суть_правонарушения", "фигуранты"])
+    assert merged == {
+        "номер_ердр": "237100121000075",
+        "суть_правонарушения": "более полное описание",
+        "фигуранты": "Иванов А.С.; Петров Б.В.",
+    }
+
+
+def test_merge_marks_missing_fields_not_available():
+    merged = merge_partial_case_data([{"фигуранты": "Н/Д"}, {}], ["фигуранты", "тип_правонарушения"])
+    assert merged == {"фигуранты": "Н/Д", "тип_правонарушения": "Н/Д"}
+
+
+def test_chunks_respect_limit_and_overlap():
+    pages = ["а" * 40, "б" * 40, "в" * 40]
+    chunks = split_pages_into_chunks(pages, 100, overlap_chars=10)
+    assert all(len(chunk) <= 100 + len(pages) for chunk in chunks)  # плюс разделители строк
+    assert chunks[0] == "а" * 40 + "\n" + "б" * 40
+    assert chunks[1].startswith("б" * 10)
+    assert chunks[1].endswith("в" * 40)
+
+
+def test_long_page_is_split_by_lines():
+    page = "\n".join(["строка " * 5] * 20)
+    chunks = split_pages_into_chunks([page], 100)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 100 for chunk in chunks)
@@ -0,0 +1,18 @@
+# tests/test_cli.py
+
+from click.testing import CliRunner
+
+from cli.main import cli
+
+
+def test_unknown_command_is_an_error():
+    result = CliRunner().invoke(cli, ["bach", "dir/"])
+    assert result.exit_code != 0
+    assert "No such command 'bach'" in result.output
+
+
+def test_options_without_command_go_to_generate_plan():
+    result = CliRunner().invoke(cli, ["-r", "missing.pdf"])
+    assert result.exit_code != 0
+    assert "generate-plan" in result.output
+    assert "'--raport-pdf'" in result.output
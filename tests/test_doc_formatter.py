@@ -0,0 +1,27 @@
+# tests/test_doc_formatter.py
+
+import io
+import os
+import zipfile
+
+from utils import doc_formatter
+from utils.doc_formatter import DOCUMENT_PART, default_skeleton_path, render_plan_docx
+
+
+def test_default_skeleton_path_is_package_relative_and_fingerprinted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = default_skeleton_path()
+    assert os.path.isabs(path)
+    assert os.path.dirname(path) == doc_formatter.SKELETON_DIR
+    assert doc_formatter.skeleton_fingerprint()[:16] in os.path.basename(path)
+
+
+def test_render_plan_docx_fills_skeleton(tmp_path):
+    plan = {"plan_title_info": {"номер_дела": "237100121000075"},
+            "actions": [{"номер": 1, "действие": "Осмотр <места>", "исполнитель": "Следователь", "срок": "Дни 1-10"}]}
+    content = render_plan_docx(plan, skeleton_path=str(tmp_path / "skeleton.docx"))
+    with zipfile.ZipFile(io.BytesIO(content)) as package:
+        document_xml = package.read(DOCUMENT_PART).decode("utf-8")
+    assert "237100121000075" in document_xml
+    assert "Осмотр &lt;места&gt;" in document_xml
+    assert "{{" not in document_xml
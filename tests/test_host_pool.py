@@ -0,0 +1,92 @@
+# tests/test_host_pool.py
+
+import threading
+import time
+
+import httpx
+import pytest
+
+from core.host_pool import MIN_LATENCY_SAMPLES, OllamaHostPool, RequestCancelledError, request_cancelled
+
+
+def _pool(hedge_percentile=None):
+    pool = OllamaHostPool(["http://gpu1:11434", "http://gpu2:11434"], hedge_percentile=hedge_percentile)
+    pool._latencies.extend([0.01] * MIN_LATENCY_SAMPLES)
+    return pool
+
+
+def test_failover_to_next_host():
+    pool = _pool()
+    first, second = pool.hosts
+    calls = []
+
+    def request(client):
+        calls.append(client)
+        if client is first.client:
+            raise httpx.ConnectError("connection refused")
+        return "ответ"
+
+    assert pool.call(request) == "ответ"
+    assert calls == [first.client, second.client]
+    assert not first.healthy
+    assert first.outstanding == second.outstanding == 0
+
+
+def test_hedge_goes_to_other_host_and_cancels_loser():
+    pool = _pool(hedge_percentile=0.95)
+    first, second = pool.hosts
+    # Второй экземпляр выглядит загруженнее: без исключения дубль ушел бы на тот же первый
+    second.outstanding = 5
+    calls = []
+    cancelled = threading.Event()
+
+    def request(client):
+        calls.append(client)
+        if client is first.client:
+            deadline = time.monotonic() + 2
+            while time.monotonic() < deadline:
+                if request_cancelled():
+                    cancelled.set()
+                    raise RequestCancelledError()
+                time.sleep(0.005)
+            return "медленный ответ"
+        return "быстрый ответ"
+
+    assert pool.call(request) == "быстрый ответ"
+    assert calls == [first.client, second.client]
+    assert cancelled.wait(1)
+    assert first.healthy  # отмена - не сбой экземпляра
+
+
+def test_non_failover_error_is_raised():
+    pool = _pool()
+
+    def request(client):
+        raise ValueError("ошибка разбора")
+
+    with pytest.raises(ValueError):
+        pool.call(request)
+    assert all(host.healthy for host in pool.hosts)
+
+
+def test_health_checks_start_without_blocking_and_close_stops_them():
+    pool = _pool(hedge_percentile=0.95)
+    checked = threading.Event()
+
+    def slow_check():
+        time.sleep(0.2)
+        checked.set()
+
+    pool.check_health = slow_check
+    started = time.monotonic()
+    thread = pool.start_health_checks(interval=60)
+    assert time.monotonic() - started < 0.1
+    assert all(host.healthy for host in pool.hosts)  # доступны до первой проверки
+
+    pool.call(lambda client: "ответ")
+    assert pool._hedge_executor is not None
+    pool.close()
+    assert checked.wait(1)
+    thread.join(1)
+    assert not thread.is_alive()
+    assert pool._hedge_executor is None
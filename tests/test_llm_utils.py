@@ -0,0 +1,185 @@
+# tests/test_llm_utils.py
+
+import asyncio
+
+from core.async_llm import AsyncOllamaClient
+from core.llm_utils import (EXTRACTION_FIELDS, STATS_GRACE_CHUNKS, ChatStreamReader, JsonObjectScanner, OllamaClient,
+                            build_case_data_schema, validate_case_data)
+
+
+def _feed_all(scanner, chunks):
+    for chunk in chunks:
+        result = scanner.feed(chunk)
+        if result is not None:
+            return result
+    return None
+
+
+def test_scanner_returns_object_once_closed():
+    scanner = JsonObjectScanner()
+    assert scanner.feed('{"a": "1",') is None
+    assert scanner.feed(' "b": {"c": [1, 2]}') is None
+    assert scanner.feed('} trailing text') == '{"a": "1", "b": {"c": [1, 2]}}'
+
+
+def test_scanner_skips_text_before_object():
+    assert _feed_all(JsonObjectScanner(), ['```json\n', '{"a"', ': "x"}', '\n```']) == '{"a": "x"}'
+
+
+def test_scanner_ignores_braces_and_escaped_quotes_in_strings():
+    chunks = ['{"a": "скобка } и {', ' кавычка \\"}\\" ', 'конец", "b": "\\\\"', '}']
+    assert _feed_all(JsonObjectScanner(), chunks) == '{"a": "скобка } и { кавычка \\"}\\" конец", "b": "\\\\"}'
+
+
+def test_scanner_handles_object_split_per_character():
+    text = '{"номер_ердр": "237100121000075"}'
+    assert _feed_all(JsonObjectScanner(), list(text) + ["}"]) == text
+
+
+def test_scanner_returns_none_for_unclosed_object():
+    assert _feed_all(JsonObjectScanner(), ['{"a": ', '"1"']) is None
+
+
+def test_schema_requires_all_requested_fields():
+    schema = build_case_data_schema(["номер_ердр", "фигуранты"])
+    assert schema["required"] == ["номер_ердр", "фигуранты"]
+    assert schema["additionalProperties"] is False
+    assert list(build_case_data_schema()["properties"]) == list(EXTRACTION_FIELDS)
+
+
+def test_validate_case_data_coerces_and_reports_failing_fields():
+    case_data = {
+        "номер_ердр": 237100121000075,
+        "фигуранты": ["Иванов А.С.", "Петров Б.В."],
+        "статья_ук_рк": "  217 ч.2  ",
+        "суть_правонарушения": "   ",
+        "лишнее_поле": "x",
+    }
+    failing = validate_case_data(case_data, ["номер_ердр", "фигуранты", "статья_ук_рк",
+                                             "суть_правонарушения", "тип_правонарушения"])
+    assert failing == ["суть_правонарушения", "тип_правонарушения"]
+    assert case_data == {
+        "номер_ердр": "237100121000075",
+        "фигуранты": "Иванов А.С.; Петров Б.В.",
+        "статья_ук_рк": "217 ч.2",
+    }
+
+
+def _part(content, done=False, **stats):
+    return {"message": {"content": content}, "done": done, **stats}
+
+
+def test_stream_reader_waits_for_final_stats_after_object():
+    reader = ChatStreamReader()
+    assert not reader.feed(_part('{"a": '))
+    assert not reader.feed(_part('"1"}'))
+    assert reader.feed(_part("", done=True, prompt_eval_count=120, eval_count=5))
+    content, json_object, final_part, chunks = reader.result()
+    assert json_object == '{"a": "1"}'
+    assert final_part["prompt_eval_count"] == 120
+    assert chunks == 2
+
+
+def test_stream_reader_gives_up_on_text_after_object():
+    reader = ChatStreamReader()
+    assert not reader.feed(_part('{"a": "1"}'))
+    for _ in range(STATS_GRACE_CHUNKS - 1):
+        assert not reader.feed(_part(" текст"))
+    assert reader.feed(_part(" текст"))
+    assert reader.result()[2] is None
+
+
+class _ScriptedClient(OllamaClient):
+    """Клиент без Ollama: ответы моделей по очереди из списка (None - ошибка запроса)."""
+
+    def __init__(self, responses, **kwargs):
+        super().__init__(model_name="main", draft_model="draft", **kwargs)
+        self.responses = list(responses)
+        self.requests = []
+
+    def _request_case_data(self, raport_text, fields, model=None):
+        self.requests.append((model or self.model, list(fields)))
+        response = self.responses.pop(0)
+        return dict(response) if response is not None else None
+
+
+CASCADE_FIELDS = ["номер_ердр", "статья_ук_рк", "фио_следователя"]
+
+
+def test_rejected_draft_fields_are_retried_and_not_kept():
+    client = _ScriptedClient([
+        {"номер_ердр": "12345", "статья_ук_рк": "Н/Д", "фио_следователя": "Сарсенбаев М.Р."},
+        None,  # основная модель не ответила
+        None,
+        None,
+    ], max_field_retries=2)
+
+    case_data = client.extract_fields("текст", CASCADE_FIELDS)
+
+    assert case_data == {"номер_ердр": "Н/Д", "статья_ук_рк": "Н/Д", "фио_следователя": "Сарсенбаев М.Р."}
+    assert client.requests == [
+        ("draft", CASCADE_FIELDS),
+        ("main", ["номер_ердр", "статья_ук_рк"]),
+        ("main", ["номер_ердр", "статья_ук_рк"]),
+        ("main", ["номер_ердр", "статья_ук_рк"]),
+    ]
+
+
+def test_escalated_fields_replace_rejected_draft_values():
+    client = _ScriptedClient([
+        {"номер_ердр": "12345", "статья_ук_рк": "217 ч.2", "фио_следователя": "Сарсенбаев М.Р."},
+        {"номер_ердр": "237100121000075"},
+    ])
+
+    case_data = client.extract_fields("текст", CASCADE_FIELDS)
+
+    assert case_data["номер_ердр"] == "237100121000075"
+    assert case_data["статья_ук_рк"] == "217 ч.2"
+    assert [model for model, _ in client.requests] == ["draft", "main"]
+
+
+
+class _ScriptedAsyncClient(AsyncOllamaClient):
+    def __init__(self, responses, **kwargs):
+        super().__init__(model_name="main", draft_model="draft", **kwargs)
+        self.responses = list(responses)
+        self.requests = []
+
+    async def _request_case_data_async(self, raport_text, fields, model=None):
+        self.requests.append((model or self.model, list(fields)))
+        response = self.responses.pop(0)
+        return dict(response) if response is not None else None
+
+
+def test_async_client_follows_the_same_cascade():
+    responses = [
+        {"номер_ердр": "12345", "статья_ук_рк": "Н/Д", "фио_следователя": "Сарсенбаев М.Р."},
+        None,
+        None,
+        None,
+    ]
+    client, async_client = _ScriptedClient(responses, max_field_retries=2), _ScriptedAsyncClient(responses,
+                                                                                               max_field_retries=2)
+
+    expected = client.extract_fields("текст", CASCADE_FIELDS)
+
+    assert asyncio.run(async_client.extract_fields_async("текст", CASCADE_FIELDS)) == expected
+    assert async_client.requests == client.requests
+
+class _GenerateRecorder:
+    def __init__(self):
+        self.calls = []
+
+    def generate(self, **kwargs):
+        self.calls.append(kwargs)
+
+
+def test_keep_warm_keeps_loaded_num_ctx():
+    client = OllamaClient(model_name="main", adaptive_ctx=True, max_num_ctx=32768)
+    client._client = recorder = _GenerateRecorder()
+    client._current_num_ctx["main"] = 16384
+
+    client.keep_warm()
+
+    assert recorder.calls[0]["options"] == {"num_ctx": 16384}
+    assert client._current_num_ctx["main"] == 16384
@@ -0,0 +1,96 @@
+# tests/test_methodology.py
+
+import openpyxl
+
+from core.methodology import (_parse_sheet, compile_methodology_workbook, template_stage_durations,
+                              workbook_stage_number)
+from core.plan_generator import PERIOD_MAP, generate_investigation_plan, get_action_index
+
+HEADER = ("ЭТАП", "ОПИСАНИЕ ЭТАПА", "СЛЕДСТВЕННО-ОПЕРАТИВНЫЕ И ПРОЦЕССУАЛЬНЫЕ МЕРОПРИЯТИЯ",
+          "ЦЕЛИ ПРОВОДИМОЙ РАБОТЫ", "ФОРМА ЗАВЕРШЕНИЯ", "СРОК")
+
+
+def _methodology(rows, name="тест"):
+    stages = _parse_sheet(rows)
+    return {"лист": name, "этапы": stages,
+            "durations": {stage["этап"]: stage["срок"] for stage in stages if stage["срок"]}}
+
+
+def test_parse_sheet_continues_merged_stage_cells():
+    stages = _parse_sheet([
+        ("ТИПОВОЙ ПЛАН",),
+        HEADER,
+        ("2-этап      НАЧАЛО      2-этап", "начало ДР", "Допрос", "цель 1", "протокол", "Дни 1-30"),
+        (None, None, None, "цель 2", None, None),
+        (None, None, "Выемка", "цель 3", "протокол", None),
+        ("3 этап", "оценка", "Квалификация", "цель", "постановление", None),
+    ])
+    assert [stage["этап"] for stage in stages] == ["2-этап НАЧАЛО", "3 этап"]
+    assert stages[0]["срок"] == "Дни 1-30"
+    assert [action["действие"] for action in stages[0]["действия"]] == ["Допрос", "Выемка"]
+    assert stages[0]["действия"][0]["цели"] == "цель 1\nцель 2"
+
+
+def test_workbook_stage_number():
+    assert workbook_stage_number("1 этап - до регистрации в ЕРДР") == 1
+    assert workbook_stage_number("2-этап") == 2
+    assert workbook_stage_number("Параллельно") is None
+
+
+def test_workbook_durations_narrow_template_stages():
+    methodology = {"durations": {"1 этап - до регистрации в ЕРДР": "до регистрации", "2-этап": "Дни 1-45",
+                                 "3 этап": "Дни 60-120"}}
+    durations = template_stage_durations(methodology, PERIOD_MAP)
+    assert durations["Быстрая фиксация"] == "Дни 1-10"
+    assert durations["Аналитический блок"] == "Дни 15-45"
+    assert durations["Процессуальная фиксация"] == "Дни 30-45"
+    assert durations["Международное сотрудничество"] == "Дни 1-45"  # диапазоны не пересекаются
+    assert durations["Квалификация и обвинение"] == "Дни 90-120"
+    assert durations["Завершение ДР"] == "До дня 120"
+    assert "Параллельно" not in durations
+    assert set(durations) <= set(PERIOD_MAP)
+
+
+def test_workbook_duration_not_in_days_applies_to_whole_stage():
+    durations = template_stage_durations({"durations": {"2-этап": "в течение срока ДР"}}, PERIOD_MAP)
+    assert durations["Быстрая фиксация"] == durations["Обеспечение"] == "в течение срока ДР"
+
+
+def test_workbook_deadline_column_keeps_distinct_stage_ranges(tmp_path):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "орм тест"
+    sheet.append(HEADER)
+    sheet.append(("2-этап", "начало ДР", "Допрос", "цель", "протокол", "Дни 1-60"))
+    sheet.append(("3 этап", "оценка", "Квалификация", "цель", "постановление", "Дни 60-120"))
+    path = tmp_path / "методика.xlsx"
+    workbook.save(path)
+
+    methodology = compile_methodology_workbook(str(path))["орм тест"]
+    selected = get_action_index(methodology).select("217 ч.2")
+    stages = {entry[1]["methodology_stage"]: entry[4] for entry in selected}
+
+    assert methodology["durations"] == {"2-этап": "Дни 1-60", "3 этап": "Дни 60-120"}
+    assert stages["Сбор базовых доказательств"] == PERIOD_MAP["Сбор базовых доказательств"]
+    assert stages["Аналитический блок"] == PERIOD_MAP["Аналитический блок"]
+    assert stages["Процессуальная фиксация"] == "Дни 30-60"
+    assert stages["Квалификация и обвинение"] == PERIOD_MAP["Квалификация и обвинение"]
+
+
+def test_methodology_deadline_narrows_period_map():
+    methodology = _methodology([
+        HEADER,
+        ("2-этап", "начало ДР", "Допрос", "цель", "протокол", "Дни 1-20"),
+    ], name="тест сроков")
+    selected = get_action_index(methodology).select("217 ч.2")
+    stages = {entry[1]["methodology_stage"]: (entry[4], entry[5]) for entry in selected}
+    assert stages["Сбор базовых доказательств"] == ("Дни 1-20", "методология")
+    assert stages["Квалификация и обвинение"] == (PERIOD_MAP["Квалификация и обвинение"], "методология")
+
+
+def test_generate_plan_numbers_actions():
+    plan = generate_investigation_plan({"статья_ук_рк": "217 ч.2", "тип_правонарушения": "финансовая пирамида",
+                                        "фио_следователя": "Н/Д", "должность_следователя": "Следователь"})
+    assert plan["actions"]
+    assert [action["номер"] for action in plan["actions"]] == list(range(1, len(plan["actions"]) + 1))
+    assert all(action["срок"] for action in plan["actions"])
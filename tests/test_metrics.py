@@ -0,0 +1,33 @@
+# tests/test_metrics.py
+
+from core.metrics import MetricsSink, document_metrics, record_llm_response, stage
+
+
+def test_llm_response_counters_and_durations():
+    with document_metrics("raport.pdf") as metrics:
+        record_llm_response({"prompt_eval_count": 100, "eval_count": 20, "load_duration": 2_000_000_000,
+                             "prompt_eval_duration": 500_000_000}, 1.5)
+        record_llm_response(None, 0.5, streamed_chunks=7)
+    values = metrics.values
+    assert values["llm_requests"] == 2
+    assert values["prompt_eval_count"] == 100
+    assert values["eval_count"] == 27
+    assert values["eval_count_estimated"] is True
+    assert values["llm_requests_without_stats"] == 1
+    assert values["load_duration_seconds"] == 2.0
+    assert values["prompt_eval_duration_seconds"] == 0.5
+
+
+def test_sink_writes_jsonl_and_prometheus(tmp_path):
+    sink = MetricsSink(jsonl_path=str(tmp_path / "metrics.jsonl"), prometheus_path=str(tmp_path / "plan.prom"))
+    with document_metrics("raport.pdf", sink) as metrics:
+        with stage("plan"):
+            pass
+        record_llm_response({"prompt_eval_count": 10}, 0.1)
+        metrics.set("status", "ok")
+
+    assert '"document": "raport.pdf"' in (tmp_path / "metrics.jsonl").read_text(encoding="utf-8")
+    prometheus = (tmp_path / "plan.prom").read_text(encoding="utf-8")
+    assert 'plan_llm_documents_total{status="ok"} 1' in prometheus
+    assert 'plan_llm_stage_seconds_count{stage="plan"} 1' in prometheus
+    assert 'plan_llm_volume_total{kind="prompt_eval_count"} 10' in prometheus
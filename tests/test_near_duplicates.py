@@ -0,0 +1,55 @@
+# tests/test_near_duplicates.py
+
+from core.near_duplicates import changed_fields, normalize_words
+
+RAPORT = """РАПОРТ об обнаружении сведений об уголовном правонарушении. Зарегистрировано в ЕРДР
+за №237100121000075. Следователь Сарсенбаев М.Р. Руководство ТОО «Е» в лице Иванова А.А. привлекало
+денежные средства граждан под видом инвестиций."""
+
+CASE_DATA = {
+    "номер_ердр": "237100121000075",
+    "фио_следователя": "Сарсенбаев М.Р.",
+    "фигуранты": "Иванов А.А.",
+    "суть_правонарушения": "привлечение денежных средств граждан под видом инвестиций",
+    "место_правонарушения": "Н/Д",
+}
+FIELDS = ["фио_следователя", "фигуранты", "суть_правонарушения", "место_правонарушения"]
+KNOWN_FIELDS = ["фио_следователя", "фигуранты", "суть_правонарушения"]
+
+
+def _changed(new_text, case_data=CASE_DATA, fields=FIELDS, known_values=()):
+    return changed_fields(normalize_words(RAPORT), normalize_words(new_text), case_data, fields, known_values)
+
+
+def test_identical_text_reuses_all_fields():
+    assert _changed(RAPORT) == []
+
+
+def test_missing_fields_are_always_extracted():
+    case_data = {field: value for field, value in CASE_DATA.items() if field != "фио_следователя"}
+    assert _changed(RAPORT, case_data=case_data) == ["фио_следователя"]
+
+
+def test_not_available_field_is_extracted_when_text_adds_new_words():
+    new_text = RAPORT + " Деятельность велась в г. Караганда."
+    assert "место_правонарушения" in _changed(new_text)
+
+
+def test_not_available_field_is_kept_when_only_known_values_change():
+    new_text = RAPORT.replace("237100121000075", "237100121000099")
+    assert _changed(new_text, known_values=["237100121000099"]) == []
+
+
+def test_added_person_updates_free_text_fields():
+    new_text = RAPORT.replace("Иванова А.А.", "Иванова А.А. и Петрова Б.В.")
+    assert _changed(new_text, fields=KNOWN_FIELDS) == ["фигуранты", "суть_правонарушения"]
+
+
+def test_changed_value_updates_only_its_field():
+    new_text = RAPORT.replace("Сарсенбаев М.Р.", "Сарсенбаевым М.Р.")
+    assert _changed(new_text, fields=KNOWN_FIELDS) == ["фио_следователя"]
+
+
+def test_unexplained_change_updates_free_text_fields():
+    new_text = RAPORT.replace("Сарсенбаев М.Р.", "Ахметов К.С.")
+    assert _changed(new_text, fields=KNOWN_FIELDS) == KNOWN_FIELDS
@@ -0,0 +1,145 @@
+# tests/test_parser.py
+
+import threading
+import time
+
+from core.near_duplicates import NearDuplicateIndex
+
+from core.parser import RaportParser, compact_raport_text, pre_extract_fields, split_raport_bundle
+
+RAPORT_HEADER = """РАПОРТ
+об обнаружении сведений об уголовном правонарушении
+5 октября 2023 года г. Астана
+Зарегистрировано в ЕРДР за №237100121000075, 05.10.2023г. в 17:28
+Обнаружено 04.10.2023 в 15 часов 30 минут: признаки ст.217 ч.2 п.1 У К РК"""
+
+
+def test_pre_extract_fields_reads_raport_header():
+    assert pre_extract_fields(RAPORT_HEADER) == {
+        "номер_ердр": "237100121000075",
+        "дата_регистрации_ердр": "05.10.2023г. в 17:28",
+        "дата_обнаружения": "04.10.2023 15:30",
+        "статья_ук_рк": "217 ч.2 п.1",
+        "рапорт_дата": "5 октября 2023 г.",
+    }
+
+
+def test_pre_extract_fields_reversed_article_and_registration_date_only():
+    fields = pre_extract_fields("по п.1 ч.2 ст.217 УК РК, ЕРДР № 237100121000075 от 05.10.2023")
+    assert fields == {
+        "номер_ердр": "237100121000075",
+        "дата_регистрации_ердр": "05.10.2023г.",
+        "статья_ук_рк": "217 ч.2 п.1",
+    }
+
+
+def test_pre_extract_fields_skips_upk_articles():
+    assert pre_extract_fields("в порядке ст. 179 УПК РК по признакам ст.190 ч.4 УК РК") == {"статья_ук_рк": "190 ч.4"}
+
+
+def test_pre_extract_fields_registration_time_is_not_detection_time():
+    fields = pre_extract_fields("ЕРДР №237100121000075, 05.10.2023г. в 17:28. Обнаружено 06.10.2023 в 09:05")
+    assert fields["дата_обнаружения"] == "06.10.2023 09:05"
+
+
+def test_pre_extract_fields_ignores_numbers_of_other_length():
+    assert pre_extract_fields("счет 1234567890123456, БИН 123456789012") == {}
+
+
+def test_compact_raport_text_collapses_whitespace_and_signature_lines():
+    text = "Следователь  \t Сарсенбаев М.Р.\n\n\n Подпись: __________ \n"
+    assert compact_raport_text(text) == "Следователь Сарсенбаев М.Р.\nПодпись: ___"
+    assert compact_raport_text(text, max_chars=11) == "Следователь"
+
+
+class _CountingClient:
+    """Клиент Ollama для тестов: считает одновременные запросы извлечения."""
+
+    model_label = "test"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def request_budget(self, raport_text, fields=None, model=None):
+        return {"fits": True}
+
+    def extract_case_data(self, raport_text, fields=None, fragment=False):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.02)
+        with self.lock:
+            self.active -= 1
+        return {field: "значение" for field in fields}
+
+
+class _NotAvailableClient(_CountingClient):
+    """Отвечает "Н/Д" на поле место_правонарушения и считает запросы."""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = 0
+
+    def prompt_fingerprint(self):
+        return "test"
+
+    def extract_case_data(self, raport_text, fields=None, fragment=False):
+        self.requests += 1
+        return {field: "Н/Д" if field == "место_правонарушения" else "значение" for field in fields}
+
+
+def test_identical_raport_with_not_available_field_makes_no_llm_request(tmp_path):
+    parser = RaportParser(near_duplicates=NearDuplicateIndex(str(tmp_path / "index.sqlite3")))
+    parser.ollama_client = client = _NotAvailableClient()
+    raport_text = RAPORT_HEADER + "\nРуководство ТОО «Е» привлекало денежные средства граждан."
+
+    first = parser.parse_raport_text_with_llm(raport_text)
+    second = parser.parse_raport_text_with_llm(raport_text)
+
+    assert second == first
+    assert client.requests == 1
+
+
+def test_llm_request_limit_counts_every_chunk():
+    parser = RaportParser(chunk_workers=4, max_prompt_chars=1000, pre_extract=False)
+    parser.ollama_client = client = _CountingClient()
+    parser.limit_llm_requests(2)
+    pages = [f"страница {index} " + "текст " * 150 for index in range(8)]
+
+    case_data = parser.parse_raport_text_with_llm("".join(pages), pages=pages)
+
+    assert case_data is not None
+    assert client.peak == 2
+
+
+SECOND_RAPORT_HEADER = RAPORT_HEADER.replace("237100121000075", "237100121000099")
+ATTACHED_RAPORT = "РАПОРТ\nНастоящим докладываю о проведенных оперативных мероприятиях."
+
+
+def test_split_raport_bundle_starts_raport_on_new_erdr_number():
+    pages = [RAPORT_HEADER, "продолжение", SECOND_RAPORT_HEADER, "продолжение второго"]
+    assert split_raport_bundle(pages) == [pages[:2], pages[2:]]
+
+
+def test_split_raport_bundle_keeps_attachments_with_raport():
+    # Рапорт оперативного сотрудника без номера ЕРДР и копия рапорта с тем же номером - приложения
+    pages = [RAPORT_HEADER, ATTACHED_RAPORT, RAPORT_HEADER, "продолжение"]
+    assert split_raport_bundle(pages) == [pages]
+
+
+def test_split_raport_bundle_single_page():
+    assert split_raport_bundle(["текст без заголовка"]) == [["текст без заголовка"]]
+
+
+def test_extraction_key_changes_with_extraction_settings(tmp_path):
+    def key(**settings):
+        parser = RaportParser(**settings)
+        parser.ollama_client = _NotAvailableClient()
+        return parser.extraction_key()
+
+    keys = {key(), key(pre_extract=False), key(split_bundles=True),
+            key(near_duplicates=NearDuplicateIndex(str(tmp_path / "index.sqlite3")))}
+    assert len(keys) == 4
+    assert key() == key()
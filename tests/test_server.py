@@ -0,0 +1,75 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from core.server import PlanService, ServiceError
+
+
+class _StubParser:
+    ollama_client = SimpleNamespace(model_label="stub")
+    max_pages = None
+    early_stop = False
+
+    def limit_llm_requests(self, max_llm_requests):
+        pass
+
+    def split_bundle(self, pages):
+        return [[page] for page in pages]
+
+    def parse_raport_text_with_llm(self, raport_text, pages=None):
+        return {"суть_правонарушения": raport_text.strip()}
+
+    def parse_bundle_parts_with_llm(self, parts):
+        return [{"суть_правонарушения": part[0]} for part in parts]
+
+
+@pytest.fixture
+def service():
+    return PlanService(_StubParser())
+
+
+def _body(value):
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+@pytest.mark.parametrize("case_data", [
+    {"статья_ук_рк": {"номер": 190}},
+    {"номер_ердр": ""},
+    {"фио_следователя": None},
+])
+def test_plan_rejects_malformed_case_data(service, case_data):
+    with pytest.raises(ServiceError) as error:
+        service.dispatch("/v1/plan", _body(case_data))
+    assert error.value.status == 400
+
+
+def test_plan_coerces_numeric_fields(service):
+    content_type, response, _ = service.dispatch("/v1/plan", _body({"статья_ук_рк": 190, "лишнее": 1}))
+    assert json.loads(response)["plan_title_info"]["статья_ук_рк"].startswith("190")
+
+
+@pytest.mark.parametrize("plan", [
+    {"actions": [1, 2]},
+    {"actions": {"номер": 1}},
+    {"plan_title_info": "план"},
+    {"actions": [{"действие": {"текст": "осмотр"}}]},
+])
+def test_docx_rejects_malformed_plan(service, plan):
+    with pytest.raises(ServiceError) as error:
+        service.dispatch("/v1/docx", _body(plan))
+    assert error.value.status == 400
+
+
+def test_docx_renders_valid_plan(service):
+    plan = {"plan_title_info": {"номер_дела": "237100121000075"},
+            "actions": [{"номер": 1, "действие": "Осмотр", "исполнитель": "Следователь", "срок": "3 дня"}]}
+    content_type, response, _ = service.dispatch("/v1/docx", _body(plan))
+    assert response.startswith(b"PK")
+
+
+@pytest.mark.parametrize("pages", [["рапорт"], ["первый рапорт", "второй рапорт"]])
+def test_case_data_always_returns_array(service, monkeypatch, pages):
+    monkeypatch.setattr("core.server.extract_pages_from_pdf", lambda *args, **kwargs: pages)
+    content_type, response, _ = service.dispatch("/v1/case-data", b"%PDF")
+    assert [case_data["суть_правонарушения"] for case_data in json.loads(response)] == pages
@@ -0,0 +1,35 @@
+# tests/test_token_budget.py
+
+from core.token_budget import estimate_tokens, plan_request_budget
+
+SHORT_PROMPT = "рапорт " * 50     # ~150 токенов: хватает 2048
+MEDIUM_PROMPT = "рапорт " * 1000  # ~2700 токенов: нужна ступень 4096
+
+
+def test_estimate_tokens_counts_cyrillic_denser_than_latin():
+    assert estimate_tokens("а" * 100) > estimate_tokens("a" * 100)
+    assert estimate_tokens("") == 0
+
+
+def test_num_ctx_is_rounded_to_bucket():
+    assert plan_request_budget(SHORT_PROMPT, ["номер_ердр"], 16384)["num_ctx"] == 2048
+    assert plan_request_budget(MEDIUM_PROMPT, ["номер_ердр"], 16384)["num_ctx"] == 4096
+
+
+def test_loaded_context_is_reused_when_close_to_required():
+    # ~7000 токенов: ступени 8192 хватает, но модель уже загружена с max_num_ctx=12000
+    prompt = "рапорт " * 2600
+    assert plan_request_budget(prompt, ["номер_ердр"], 12000)["num_ctx"] == 8192
+    assert plan_request_budget(prompt, ["номер_ердр"], 12000, current_num_ctx=12000)["num_ctx"] == 12000
+
+
+def test_loaded_context_shrinks_when_twice_too_large():
+    assert plan_request_budget(SHORT_PROMPT, ["номер_ердр"], 16384, current_num_ctx=16384)["num_ctx"] == 2048
+    assert plan_request_budget(SHORT_PROMPT, ["номер_ердр"], 16384, current_num_ctx=4096)["num_ctx"] == 2048
+    assert plan_request_budget(MEDIUM_PROMPT, ["номер_ердр"], 16384, current_num_ctx=16384)["num_ctx"] == 4096
+
+
+def test_prompt_longer_than_max_context_does_not_fit():
+    budget = plan_request_budget("рапорт " * 10000, ["номер_ердр"], 8192)
+    assert budget["fits"] is False
+    assert budget["num_ctx"] == 8192
@@ -1,15 +1,52 @@
 # utils/doc_formatter.py
 
-from docx import Document
-from docx.shared import Inches, Pt
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.enum.table import WD_ALIGN_VERTICAL
-from docx.oxml.ns import qn # Необходим, если придется использовать низкоуровневые настройки границ
-from docx.oxml import OxmlElement # Необходим, если придется использовать низкоуровневые настройки границ
+import contextlib
+import glob
+import hashlib
+import importlib.util
+import io
+import os
+import re
+import threading
+import zipfile
+from xml.sax.saxutils import escape
+
+# Документ плана собирается из заранее подготовленного скелета .docx: шапка, блок «УТВЕРЖДАЮ»,
+# стили и ширины колонок таблицы строятся через python-docx один раз (_build_plan_document
+# с подстановочными метками) и сохраняются в SKELETON_DIR под именем с отпечатком кода сборки
+# и шаблонов python-docx (skeleton_fingerprint): после их изменения скелет пересобирается сам.
+# При каждом рендеринге XML строк
+# таблицы собирается из шаблона строки скелета и записывается в пакет за один проход,
+# без разбора и повторного сохранения документа. python-docx нужен только для сборки
+# скелета и для отладочной проверки (verify=True).
+
+# Относительно пакета, а не текущей директории: скелет один для любых мест запуска
+SKELETON_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'cache')
+DOCUMENT_PART = 'word/document.xml'
+
+TITLE_DEFAULTS = {
+    "номер_дела": '_______',
+    "факт": '___________________________',
+    "статья_ук_рк": '_______ УК РК.',
+    "год": '_______',
+}
+ROW_FIELDS = ("номер", "действие", "исполнитель", "срок")
+
+_PLACEHOLDER_RE = re.compile(r"\{\{(\w+)\}\}")
+_INVALID_XML_CHARS_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_skeleton_lock = threading.Lock()
+_skeleton = None
+_skeleton_fingerprint = None
+
+
+def _placeholder(name):
+    return "{{" + name + "}}"
 
 
 # Функция для отладки: читаем сохраненный документ и выводим содержимое таблицы
 def debug_read_docx_table(file_path):
+    from docx import Document
+
     try:
         doc = Document(file_path)
         print(f"\n--- Отладка содержимого сохраненного DOCX: {file_path} ---")
@@ -52,11 +89,16 @@ def debug_read_docx_table(file_path):
         print(f"Ошибка при чтении сохраненного DOCX для отладки: {e}")
 
 
-def create_investigation_plan_doc(plan_data, output_path):
+def _build_plan_document(plan_data):
     """
-    Создает документ Word (.docx) со сгенерированным планом расследования,
-    ориентируясь на формат нового образца.
+    Строит документ Word (python-docx) с планом расследования,
+    ориентируясь на формат нового образца. Используется для сборки скелета.
     """
+    from docx import Document
+    from docx.shared import Inches
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from docx.enum.table import WD_ALIGN_VERTICAL
+
     document = Document()
 
     # Установка полей страницы (примерные значения для более плотного текста)
@@ -190,9 +232,156 @@ def create_investigation_plan_doc(plan_data, output_path):
     document.add_paragraph('____________________________').alignment = WD_ALIGN_PARAGRAPH.LEFT
 
 
-    document.save(output_path)
+    return document
+
+
+def _docx_template_files():
+    # Шаблоны python-docx (default.docx и др.), из которых Document() строит документ; без импорта docx
+    spec = importlib.util.find_spec("docx")
+    if spec is None or not spec.submodule_search_locations:
+        return []
+    templates_dir = os.path.join(spec.submodule_search_locations[0], "templates")
+    return sorted(os.path.join(root, name) for root, _, names in os.walk(templates_dir) for name in names)
+
+
+def skeleton_fingerprint():
+    """
+    Отпечаток скелета: хэш исходного кода этого модуля (_build_plan_document, метки шапки и строки
+    таблицы) и шаблонов python-docx. Вычисляется один раз на процесс.
+    """
+    global _skeleton_fingerprint
+    if _skeleton_fingerprint is None:
+        digest = hashlib.sha256()
+        for path in [os.path.abspath(__file__), *_docx_template_files()]:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+            digest.update(b"\0")
+        _skeleton_fingerprint = digest.hexdigest()
+    return _skeleton_fingerprint
+
+
+def default_skeleton_path():
+    return os.path.join(SKELETON_DIR, f"plan_skeleton_{skeleton_fingerprint()[:16]}.docx")
+
+
+def build_plan_skeleton(skeleton_path=None):
+    """
+    Собирает скелет документа: заголовок с метками {{номер_дела}}, {{факт}}, {{статья_ук_рк}}, {{год}}
+    и таблица с одной строкой-шаблоном с метками {{номер}}, {{действие}}, {{исполнитель}}, {{срок}}.
+    По умолчанию - в default_skeleton_path.
+    """
+    skeleton_path = skeleton_path or default_skeleton_path()
+    plan_data = {
+        "plan_title_info": {field: _placeholder(field) for field in TITLE_DEFAULTS},
+        "actions": [{field: _placeholder(field) for field in ROW_FIELDS}],
+    }
+    os.makedirs(os.path.dirname(skeleton_path) or ".", exist_ok=True)
+    tmp_path = f"{skeleton_path}.{os.getpid()}.tmp"
+    _build_plan_document(plan_data).save(tmp_path)
+    os.replace(tmp_path, skeleton_path)  # несколько процессов пакетного режима могут собирать скелет одновременно
+    print(f"Собран скелет документа плана: {skeleton_path}")
+    if os.path.dirname(skeleton_path) == SKELETON_DIR:
+        # Скелеты прежних версий кода больше не понадобятся (загруженный скелет хранится в памяти)
+        for stale_path in glob.glob(os.path.join(SKELETON_DIR, "plan_skeleton_*.docx")):
+            if stale_path != skeleton_path:
+                with contextlib.suppress(OSError):
+                    os.remove(stale_path)
+
+
+def _split_template(xml):
+    # Метки в тексте могут оказаться с пробелами по краям значения - сохраняем их в Word
+    xml = xml.replace("<w:t>{{", '<w:t xml:space="preserve">{{')
+    return _PLACEHOLDER_RE.split(xml)  # четные элементы - XML, нечетные - имена полей
+
+
+def _load_skeleton(skeleton_path=None):
+    """
+    Загружает скелет (собирает при отсутствии) и готовит его к рендерингу: неизменяемые части
+    пакета сжимаются один раз в отдельный zip в памяти, document.xml делится на шапку с метками,
+    шаблон строки таблицы и окончание. Результат кэшируется на процесс.
+    """
+    global _skeleton
+    skeleton_path = skeleton_path or default_skeleton_path()
+    with _skeleton_lock:
+        if _skeleton is not None and _skeleton["path"] == skeleton_path:
+            return _skeleton
+        if not os.path.exists(skeleton_path):
+            build_plan_skeleton(skeleton_path)
+
+        static_buffer = io.BytesIO()
+        with zipfile.ZipFile(skeleton_path) as skeleton, \
+                zipfile.ZipFile(static_buffer, "w", zipfile.ZIP_DEFLATED) as static:
+            for item in skeleton.infolist():
+                if item.filename == DOCUMENT_PART:
+                    document_xml = skeleton.read(item).decode("utf-8")
+                else:
+                    static.writestr(item, skeleton.read(item))
+
+        row_marker = document_xml.index(_placeholder(ROW_FIELDS[0]))
+        row_start = document_xml.rindex("<w:tr>", 0, row_marker)
+        row_end = document_xml.index("</w:tr>", row_marker) + len("</w:tr>")
+        _skeleton = {
+            "path": skeleton_path,
+            "static": static_buffer.getvalue(),
+            "head": _split_template(document_xml[:row_start]),
+            "row": _split_template(document_xml[row_start:row_end]),
+            "tail": document_xml[row_end:],
+        }
+        return _skeleton
+
+
+def _xml_text(value):
+    # Как cell.text в python-docx: перевод строки - <w:br/>, табуляция - <w:tab/>
+    text = escape(_INVALID_XML_CHARS_RE.sub("", str(value)))
+    return (text.replace("\n", '</w:t><w:br/><w:t xml:space="preserve">')
+                .replace("\t", '</w:t><w:tab/><w:t xml:space="preserve">'))
+
+
+def _fill(parts, values, out):
+    for index, part in enumerate(parts):
+        out.append(values[part] if index % 2 else part)
+
+
+def render_plan_docx(plan_data, skeleton_path=None):
+    """Возвращает содержимое .docx с планом расследования (bytes)."""
+    skeleton = _load_skeleton(skeleton_path)
+    plan_title_info = plan_data.get("plan_title_info", {})
+    title_values = {field: _xml_text(plan_title_info.get(field, default))
+                    for field, default in TITLE_DEFAULTS.items()}
+
+    out = []
+    _fill(skeleton["head"], title_values, out)
+    row_parts = skeleton["row"]
+    for action in plan_data.get("actions", []):
+        row_values = {field: _xml_text(action.get(field, "")) for field in ROW_FIELDS}
+        _fill(row_parts, row_values, out)
+    out.append(skeleton["tail"])
+
+    buffer = io.BytesIO(skeleton["static"])
+    buffer.seek(0, io.SEEK_END)
+    with zipfile.ZipFile(buffer, "a", zipfile.ZIP_DEFLATED) as package:
+        package.writestr(DOCUMENT_PART, "".join(out).encode("utf-8"))
+    return buffer.getvalue()
+
+
+def create_investigation_plan_doc(plan_data, output_path, verify=False):
+    """
+    Сохраняет документ Word (.docx) со сгенерированным планом расследования.
+    verify=True - перечитать сохраненный документ через python-docx и вывести содержимое таблицы.
+    """
+    content = render_plan_docx(plan_data)
+    # Запись во временный файл и атомарная замена: прерванная запись не оставляет поврежденный .docx,
+    # а повторная сборка того же документа просто заменяет его
+    tmp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
     print(f"Документ плана расследования сохранен по пути: {output_path}")
-    
-    # --- НОВОЕ: Отладочный вызов чтения DOCX ---
-    debug_read_docx_table(output_path)
-    # --- КОНЕЦ НОВОГО ---
+
+    if verify:
+        debug_read_docx_table(output_path)